@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+端到端性能基准
+在子进程中启动 mock_server.py，把 query.py 指向它和一个临时数据目录，依次计时：
+冷启动历史回填、热增量刷新、四个报表、缓存保存/加载、Excel 导出。
+每一步记录耗时、请求数 (服务端统计)、该步前后的 RSS 变化与截至该步的进程峰值 RSS；
+可与上次结果对比 (耗时与峰值 RSS 按容忍度，请求数要求一致)，出现回归时返回非零退出码。
+
+用法:
+    python bench.py --accounts 14 --fills 50000 --latency-ms 20 --out bench_output.txt
+    python bench.py --baseline bench_output.txt     # 与基线对比，回归时 exit 1
+"""
+
+import argparse
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def rss_mb():
+    """
+    当前 RSS (读 /proc，仅 Linux)，其他平台返回 None
+    """
+    try:
+        with open("/proc/self/statm") as f: pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+def max_rss_mb():
+    """
+    进程启动以来的峰值 RSS (ru_maxrss，只增不减)
+    """
+    if resource is None: return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def mock_stats(base):
+    with urllib.request.urlopen(base.replace("/v1", "/__stats"), timeout=5) as resp:
+        return json.loads(resp.read())
+
+def mock_requests(base):
+    return sum(v for k, v in mock_stats(base).items() if not k.startswith("__"))
+
+def start_mock(args):
+    port = free_port()
+    cmd = [sys.executable, os.path.join(HERE, "mock_server.py"), "--port", str(port),
+           "--accounts", str(args.accounts), "--fills", str(args.fills), "--history-days", str(args.history_days),
+           "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate), "--rate-429", str(args.rate_429)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}/v1"
+    deadline = time.time() + 600
+    while time.time() < deadline:
+        if proc.poll() is not None: raise RuntimeError("mock_server.py 启动失败")
+        try:
+            mock_stats(base)
+            return proc, base
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("mock_server.py 启动超时")
+
+def main():
+    parser = argparse.ArgumentParser(description="Paradex PnL Reader 端到端基准")
+    parser.add_argument("--accounts", type=int, default=14)
+    parser.add_argument("--fills", type=int, default=20000, help="每个账户的成交笔数")
+    parser.add_argument("--history-days", type=int, default=180)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--workers", type=int, default=6)
+    parser.add_argument("--procs", type=int, default=1, help="账户分片的子进程数 (PARADEX_PROCS)")
+    parser.add_argument("--retention-days", type=int, default=0, help="成交保留天数 (0 = 不压缩)")
+    parser.add_argument("--real-limits", action="store_true", help="使用默认限速配置 (默认放开限速以测吞吐)")
+    parser.add_argument("--out", help="结果写入 JSON 文件")
+    parser.add_argument("--baseline", help="与之前的结果文件对比")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的耗时 / 峰值 RSS 回归比例")
+    args = parser.parse_args()
+
+    proc, base = start_mock(args)
+    data_dir = tempfile.mkdtemp(prefix="paradex_bench_")
+    now_ms = int(time.time() * 1000)
+    os.environ.update({
+        "PARADEX_API_BASE_URL": base,
+        "PARADEX_DATA_DIR": data_dir,
+        "PARADEX_CACHE_BACKEND": args.backend,
+        "PARADEX_MAX_WORKERS": str(args.workers),
+        "PARADEX_PROCS": str(args.procs),
+        "PARADEX_FILL_RETENTION_DAYS": str(args.retention_days),
+        "PARADEX_HISTORY_START_MS": str(now_ms - (args.history_days + 1) * 24 * 3600 * 1000),
+        "PARADEX_XP_SEASON_START_MS": str(now_ms - args.history_days * 24 * 3600 * 1000),
+    })
+    if not args.real_limits:
+        for family in ("FILLS", "TRANSFERS", "ACCOUNT", "XP", "DEFAULT"):
+            os.environ[f"PARADEX_RATE_{family}"] = "100000,100000"
+
+    sys.path.insert(0, HERE)
+    import query
+    query.GROUPS[:] = [
+        {"id": g, "name": f"Group {g} ",
+         "accounts": [{"name": f"Acc {g}.{n + 1}", "key": f"mock-{g * 2 + n}"}
+                      for n in range(2) if g * 2 + n < args.accounts]}
+        for g in range((args.accounts + 1) // 2)
+    ]
+    reporter = query.HeadlessReporter(stream=io.StringIO(), export_excel=False, push_tg=False)
+    query.ensure_cache()
+
+    def sync_all():
+        query.SNAPSHOTS.clear()  # 计入真实的增量同步请求，而不是快照缓存命中
+        query.fan_out_accounts(lambda group, acc, key, log: query.fetch_fills_incremental(acc["key"], key, log))
+        query.fan_out_accounts(lambda group, acc, key, log: query.fetch_transfers_incremental(acc["key"], key, log))
+
+    def load_all():
+        query.STATS_CACHE.clear()
+        query.STATS_CACHE.update(query.load_cache())
+        for _, _, key in query.iter_accounts(): query.get_fill_store(key)
+
+    def export_excel():
+        reporter.export_excel = True
+        try:
+            reporter.logic_weekly_stats()
+        finally:
+            reporter.export_excel = False
+
+    steps = [
+        ("cold_backfill", sync_all),
+        ("warm_refresh", sync_all),
+        ("report_total", reporter.logic_total_stats),
+        ("report_weekly", reporter.logic_weekly_stats),
+        ("report_volume", reporter.logic_volume_stats),
+        ("report_positions", reporter.logic_positions),
+        ("cache_save", query.save_cache),
+        ("cache_load", load_all),
+    ]
+    try:
+        import openpyxl  # noqa: F401
+        steps.append(("excel_export", export_excel))
+        steps.append(("fills_export_xlsx", lambda: reporter.logic_export(out=os.path.join(data_dir, "fills.xlsx"))))
+    except ImportError:
+        print("跳过 excel_export: 未安装 openpyxl")
+    try:
+        import pyarrow  # noqa: F401
+        steps.append(("fills_export_parquet", lambda: reporter.logic_export(fmt="parquet", out=os.path.join(data_dir, "fills_parquet"))))
+    except ImportError:
+        print("跳过 fills_export_parquet: 未安装 pyarrow")
+
+    results = {}
+    try:
+        for name, fn in steps:
+            before, rss_before = mock_requests(base), rss_mb()
+            t0 = time.perf_counter()
+            fn()
+            wall = time.perf_counter() - t0
+            requests_made = mock_requests(base) - before
+            rss_after = rss_mb()
+            delta = round(rss_after - rss_before, 1) if rss_after is not None and rss_before is not None else None
+            results[name] = {"wall_s": round(wall, 3), "requests": requests_made,
+                             "rss_mb": rss_after, "rss_delta_mb": delta, "max_rss_mb": max_rss_mb()}
+            rss_str = f"RSS {rss_after} MB ({delta:+} MB)" if delta is not None else "RSS -"
+            print(f"{name:<18} {wall:>9.3f}s  {requests_made:>7} req  {rss_str}  峰值 {results[name]['max_rss_mb']} MB")
+    finally:
+        proc.terminate()
+
+    report = {"config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+              "results": results, "created_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+    if args.out:
+        with open(args.out, "w") as f: json.dump(report, f, indent=2)
+        print(f"结果已写入 {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)["results"]
+        # 注入 5xx / 429 时重试次数随机，请求数不做精确比较
+        exact_requests = not args.error_rate and not args.rate_429
+        regressions = []
+        for name, res in results.items():
+            old = baseline.get(name)
+            if not old: continue
+            if old["wall_s"] > 0.05 and res["wall_s"] > old["wall_s"] * (1 + args.tolerance):
+                regressions.append(f"{name}: {old['wall_s']:.3f}s -> {res['wall_s']:.3f}s")
+            if exact_requests and res["requests"] != old.get("requests", res["requests"]):
+                regressions.append(f"{name}: 请求数 {old['requests']} -> {res['requests']}")
+            old_rss = old.get("max_rss_mb", old.get("peak_rss_mb"))  # 旧版结果文件的列名
+            if old_rss and res["max_rss_mb"] and res["max_rss_mb"] > old_rss * (1 + args.tolerance):
+                regressions.append(f"{name}: 峰值 RSS {old_rss} MB -> {res['max_rss_mb']} MB")
+        if regressions:
+            print("❌ 性能回归:\n  " + "\n  ".join(regressions))
+            return 1
+        print("✅ 未发现超出容忍度的回归")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
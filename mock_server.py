@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+Paradex API 本地模拟服务器
+用于离线测试与性能基准，不访问生产环境：
+1. 实现 /fills、/transfers、/account/summary、/account/info、/positions、/markets/summary (公共)、
+   /xp/account-balance、/campaigns/private/points/history/season2，游标分页与线上一致 (新 -> 旧)。
+2. 合成任意规模的历史数据 (多账户、百万级成交)，按列式数组存放，内存占用可控。
+3. 可注入延迟、5xx 错误和 429 (带 Retry-After)，并统计每个接口的请求次数。
+4. 同一端口提供 WebSocket 私有推送 (JSON-RPC: auth / subscribe fills.ALL、positions)，
+   --live-rate 按速率生成实时成交并推送，--ws-drop-rate 随机丢弃推送以测试缺口补齐。
+   /__trade?account=0&n=3 立即成交 n 笔，/__kick 断开所有推送连接。
+5. /tg/bot<token>/sendMessage 为 Telegram Bot API 存根：校验 4096 字符上限，按会话限速 (超出时 429 + retry_after)，
+   可注入 502；收到的消息可从 /tg/__messages 取回。
+
+用法:
+    python mock_server.py --accounts 14 --fills 20000 --latency-ms 30 --live-rate 2
+    # 然后: PARADEX_API_BASE_URL=http://127.0.0.1:8765/v1 PARADEX_API_KEY_0_1=mock-0 python query.py total
+    # Telegram: PARADEX_TG_API_URL=http://127.0.0.1:8765/tg TG_BOT_TOKEN=test TG_CHAT_ID=1
+API Key 格式为 mock-<账户序号>；推送地址为 ws://127.0.0.1:8765/v1/ws。
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import socket
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+DAY_MS = 24 * 3600 * 1000
+MARKETS = ["BTC-USD-PERP", "ETH-USD-PERP", "SOL-USD-PERP", "ARB-USD-PERP", "DOGE-USD-PERP"]
+BASE_PRICES = {"BTC-USD-PERP": 65000.0, "ETH-USD-PERP": 3200.0, "SOL-USD-PERP": 150.0,
+               "ARB-USD-PERP": 1.1, "DOGE-USD-PERP": 0.15}
+
+# ================= 合成数据 =================
+
+def mark_price(market):
+    """
+    标记价格：围绕基准价缓慢摆动 (±2%)，持仓的 unrealized_pnl 仍按基准价计算，用于检验本地重算
+    """
+    i = MARKETS.index(market)
+    return BASE_PRICES[market] * (1 + 0.02 * math.sin(time.time() / 60 + i))
+
+class MockAccount:
+    """
+    单个模拟账户：成交按 ts 升序存放在列式数组中，分页时再按需生成 JSON
+    """
+    def __init__(self, index, n_fills, history_days, seed=0):
+        rng = random.Random(seed * 100003 + index)
+        self.index = index
+        self.address = "0x" + "".join(rng.choice("0123456789abcdef") for _ in range(62))
+        now_ms = int(time.time() * 1000)
+        start_ms = now_ms - history_days * DAY_MS
+
+        self.ts = array('q', sorted(rng.randint(start_ms, now_ms) for _ in range(n_fills)))
+        self.market = array('B', (rng.randrange(len(MARKETS)) for _ in range(n_fills)))
+        self.side = array('B', (rng.randrange(2) for _ in range(n_fills)))
+        self.maker = array('B', (rng.random() < 0.7 for _ in range(n_fills)))
+        self.size = array('d', (round(rng.uniform(0.01, 2.0), 4) for _ in range(n_fills)))
+        self.jitter = array('d', (rng.uniform(0.97, 1.03) for _ in range(n_fills)))
+        self.rpnl = array('d', (round(rng.gauss(0, 5), 6) for _ in range(n_fills)))
+
+        self.transfers = []
+        t = start_ms
+        for i in range(max(2, history_days // 30)):
+            t += rng.randint(1, max(2, (now_ms - t) // 3))
+            direction = "IN" if i == 0 or rng.random() < 0.7 else "OUT"
+            self.transfers.append({"id": f"tr-{index}-{i}", "created_at": min(t, now_ms), "status": "COMPLETED",
+                                   "direction": direction, "amount": str(round(rng.uniform(1000, 20000), 2))})
+        self.transfers.sort(key=lambda x: x["created_at"])
+
+        self.positions = []
+        for market in rng.sample(MARKETS, rng.randint(0, 3)):
+            size = round(rng.uniform(-3, 3), 3) or 0.5
+            entry = BASE_PRICES[market] * rng.uniform(0.95, 1.05)
+            mark = BASE_PRICES[market]
+            self.positions.append({"market": market, "side": "LONG" if size > 0 else "SHORT", "size": str(size),
+                                   "average_entry_price": str(round(entry, 4)),
+                                   "unrealized_pnl": str(round((mark - entry) * size, 4)), "status": "OPEN"})
+
+        net = sum(float(x["amount"]) * (1 if x["direction"] == "IN" else -1) for x in self.transfers)
+        self.account_value = round(net + sum(self.rpnl), 2)
+
+        self.xp_weeks = [{"week": w, "points": {"total": round(rng.uniform(100, 5000), 2)}}
+                         for w in range(1, history_days // 7 + 1)]
+        rng.shuffle(self.xp_weeks)
+        self.seq = {}  # 推送频道 -> 最近的 seq_no
+
+    def add_fill(self, rng):
+        """
+        追加一笔当前时间的成交并更新持仓与账户价值 (实时推送模拟)，返回 (成交下标, 变化后的持仓)
+        ts 最后追加：并发分页按 ts 定位，不会读到其他列还没写入的行
+        """
+        i = rng.randrange(len(MARKETS))
+        market = MARKETS[i]
+        buy, size = rng.randrange(2), round(rng.uniform(0.01, 2.0), 4)
+        jitter, rpnl = rng.uniform(0.97, 1.03), round(rng.gauss(0, 5), 6)
+        self.market.append(i)
+        self.side.append(buy)
+        self.maker.append(rng.random() < 0.7)
+        self.size.append(size)
+        self.jitter.append(jitter)
+        self.rpnl.append(rpnl)
+        self.ts.append(max(int(time.time() * 1000), self.ts[-1] if self.ts else 0))
+        self.account_value = round(self.account_value + rpnl, 2)
+
+        price = BASE_PRICES[market] * jitter
+        pos = next((p for p in self.positions if p["market"] == market), None)
+        if pos is None:
+            pos = {"market": market, "average_entry_price": str(round(price, 4))}
+            self.positions.append(pos)
+        new_size = round(float(pos.get("size", 0)) + (size if buy else -size), 4)
+        entry = float(pos["average_entry_price"])
+        pos.update({"side": "LONG" if new_size > 0 else "SHORT", "size": str(new_size),
+                    "unrealized_pnl": str(round((BASE_PRICES[market] - entry) * new_size, 4)),
+                    "status": "OPEN" if new_size else "CLOSED", "last_updated_at": self.ts[-1]})
+        return len(self.ts) - 1, dict(pos)
+
+    def fill_json(self, i):
+        market = MARKETS[self.market[i]]
+        price = BASE_PRICES[market] * self.jitter[i]
+        size = self.size[i]
+        return {
+            "id": f"{self.index}-{self.ts[i]}-{i}",
+            "created_at": self.ts[i],
+            "market": market,
+            "side": "BUY" if self.side[i] else "SELL",
+            "liquidity": "MAKER" if self.maker[i] else "TAKER",
+            "price": f"{price:.4f}",
+            "size": f"{size:.4f}",
+            "fee": f"{price * size * (0.0 if self.maker[i] else 0.0002):.6f}",
+            "realized_pnl": f"{self.rpnl[i]:.6f}",
+        }
+
+# ================= 分页 =================
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode()).decode()
+
+def decode_cursor(cursor):
+    return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["o"])
+
+def paginate(count, cursor, limit):
+    """
+    返回本页的 [lo, hi) 偏移 (按新->旧排列) 与下一页游标
+    """
+    offset = decode_cursor(cursor) if cursor else 0
+    hi = min(count, offset + limit)
+    nxt = encode_cursor(hi) if hi < count else None
+    return offset, hi, nxt
+
+# ================= WebSocket =================
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+class WsSession:
+    """
+    单个 WebSocket 连接：RFC 6455 的最小实现 (不分片的文本帧、ping/pong、close)，足够驱动 websocket-client
+    """
+    def __init__(self, sock, rfile, wfile):
+        self.sock, self.rfile, self.wfile = sock, rfile, wfile
+        self.account = None
+        self.channels = set()
+        self.closed = False
+        self._send_lock = threading.Lock()
+
+    def send_frame(self, opcode, payload=b""):
+        n = len(payload)
+        if n < 126: header = bytes([0x80 | opcode, n])
+        elif n < 65536: header = bytes([0x80 | opcode, 126]) + n.to_bytes(2, "big")
+        else: header = bytes([0x80 | opcode, 127]) + n.to_bytes(8, "big")
+        with self._send_lock:
+            if self.closed: return
+            try:
+                self.wfile.write(header + payload)
+                self.wfile.flush()
+            except OSError:
+                self.closed = True
+
+    def send_json(self, obj):
+        self.send_frame(0x1, json.dumps(obj).encode())
+
+    def recv_frame(self):
+        """
+        返回 (opcode, payload)，连接关闭时 opcode 为 None
+        """
+        head = self.rfile.read(2)
+        if len(head) < 2: return None, b""
+        n = head[1] & 0x7F
+        if n == 126: n = int.from_bytes(self.rfile.read(2), "big")
+        elif n == 127: n = int.from_bytes(self.rfile.read(8), "big")
+        mask = self.rfile.read(4) if head[1] & 0x80 else None
+        payload = self.rfile.read(n)
+        if mask: payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return head[0] & 0x0F, payload
+
+    def kick(self):
+        self.closed = True
+        try: self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError: pass
+
+# ================= HTTP 服务 =================
+
+class MockParadex:
+    """
+    模拟服务器状态与故障注入配置
+    """
+    def __init__(self, accounts=14, fills=20000, history_days=180, latency_ms=0.0, jitter_ms=0.0,
+                 error_rate=0.0, rate_429=0.0, retry_after=1, max_page=5000, default_page=100, seed=0,
+                 ws_drop_rate=0.0, tg_rate=1.0, tg_burst=3, tg_fail_rate=0.0):
+        self.accounts = [MockAccount(i, fills, history_days, seed) for i in range(accounts)]
+        self.ws_drop_rate = ws_drop_rate
+        self.sessions = set()
+        self.tg_rate = tg_rate
+        self.tg_burst = tg_burst
+        self.tg_fail_rate = tg_fail_rate
+        self.tg_buckets = {}   # chat_id -> (tokens, last)
+        self.tg_messages = []
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.max_page = max_page
+        self.default_page = default_page
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    def count(self, key):
+        """
+        按接口路径计数；注入的故障记在 __429 / __5xx 下
+        """
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def account_for(self, headers):
+        auth = headers.get("Authorization", "")
+        return self.account_for_token(auth[len("Bearer "):] if auth.startswith("Bearer ") else "")
+
+    def account_for_token(self, token):
+        if not token.startswith("mock-"): return None
+        try:
+            return self.accounts[int(token[len("mock-"):])]
+        except (ValueError, IndexError):
+            return None
+
+    def handle(self, path, query, headers):
+        """
+        返回 (status, body_dict, extra_headers)
+        """
+        if self.latency_ms or self.jitter_ms:
+            time.sleep(max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+        if self.rate_429 and self._rng.random() < self.rate_429:
+            self.count("__429")
+            return 429, {"error": "RATE_LIMIT_EXCEEDED"}, {"Retry-After": str(self.retry_after)}
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.count("__5xx")
+            return 503, {"error": "SERVICE_UNAVAILABLE"}, {}
+
+        if path == "/markets/summary":
+            return 200, {"results": [{"symbol": m, "mark_price": f"{mark_price(m):.4f}"} for m in MARKETS]}, {}
+
+        acc = self.account_for(headers)
+        if acc is None: return 401, {"error": "UNAUTHORIZED"}, {}
+
+        q = {k: v[-1] for k, v in query.items()}
+        limit = max(1, min(int(q.get("page_size") or self.default_page), self.max_page))
+        start_at = int(q["start_at"]) if q.get("start_at") else None
+        end_at = int(q["end_at"]) if q.get("end_at") else None
+
+        if path == "/fills":
+            lo = bisect_left(acc.ts, start_at) if start_at is not None else 0
+            hi = bisect_right(acc.ts, end_at) if end_at is not None else len(acc.ts)
+            hi = max(lo, hi)
+            try:
+                a, b, nxt = paginate(hi - lo, q.get("cursor"), limit)
+            except Exception:
+                return 400, {"error": "INVALID_CURSOR"}, {}
+            results = [acc.fill_json(hi - 1 - k) for k in range(a, b)]
+            return 200, {"next": nxt, "prev": None, "results": results}, {}
+
+        if path == "/transfers":
+            rows = [t for t in acc.transfers if (start_at is None or t["created_at"] >= start_at)
+                    and (end_at is None or t["created_at"] <= end_at)]
+            rows.reverse()
+            try:
+                a, b, nxt = paginate(len(rows), q.get("cursor"), limit)
+            except Exception:
+                return 400, {"error": "INVALID_CURSOR"}, {}
+            return 200, {"next": nxt, "prev": None, "results": rows[a:b]}, {}
+
+        if path == "/account/summary":
+            return 200, [{"account": acc.address, "account_value": str(acc.account_value)}], {}
+        if path == "/account/info":
+            return 200, {"results": [{"account": acc.address}]}, {}
+        if path == "/positions":
+            return 200, {"results": acc.positions}, {}
+        if path == "/xp/account-balance":
+            total = sum(w["points"]["total"] for w in acc.xp_weeks)
+            return 200, {"earned_xp": str(total), "transferrable_xp": str(round(total * 0.3, 2))}, {}
+        if path == "/campaigns/private/points/history/season2":
+            return 200, {"results": acc.xp_weeks}, {}
+        return 404, {"error": "NOT_FOUND"}, {}
+
+    # --- Telegram 存根 ---
+    def tg_send(self, token, body):
+        """
+        模拟 sendMessage：每个会话一个令牌桶 (tg_rate 条/秒，突发 tg_burst)，返回 (status, body)
+        """
+        if self.tg_fail_rate and self._rng.random() < self.tg_fail_rate:
+            self.count("__tg_5xx")
+            return 502, {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+        chat_id, text = body.get("chat_id"), body.get("text") or ""
+        if not chat_id: return 400, {"ok": False, "error_code": 400, "description": "Bad Request: chat not found"}
+        if not text: return 400, {"ok": False, "error_code": 400, "description": "Bad Request: message text is empty"}
+        if len(text) > 4096: return 400, {"ok": False, "error_code": 400, "description": "Bad Request: message is too long"}
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self.tg_buckets.get(chat_id, (self.tg_burst, now))
+            tokens = min(self.tg_burst, tokens + (now - last) * self.tg_rate)
+            if tokens < 1:
+                self.tg_buckets[chat_id] = (tokens, now)
+                self.counts["__tg_429"] = self.counts.get("__tg_429", 0) + 1
+                retry_after = max(1, math.ceil((1 - tokens) / self.tg_rate))
+                return 429, {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                             "parameters": {"retry_after": retry_after}}
+            self.tg_buckets[chat_id] = (tokens - 1, now)
+            message = {"message_id": len(self.tg_messages) + 1, "chat": {"id": chat_id}, "date": int(time.time()),
+                       "text": text, "parse_mode": body.get("parse_mode"), "token": token}
+            self.tg_messages.append(message)
+        return 200, {"ok": True, "result": message}
+
+    # --- WebSocket ---
+    def serve_ws(self, session):
+        with self._lock: self.sessions.add(session)
+        try:
+            while not session.closed:
+                opcode, payload = session.recv_frame()
+                if opcode is None or opcode == 0x8: break
+                if opcode == 0x9: session.send_frame(0xA, payload)
+                elif opcode == 0x1: self.ws_call(session, json.loads(payload))
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._lock: self.sessions.discard(session)
+            session.send_frame(0x8)
+            session.closed = True
+
+    def ws_call(self, session, msg):
+        method, params = msg.get("method"), msg.get("params") or {}
+        reply = {"jsonrpc": "2.0", "id": msg.get("id")}
+        if method == "auth":
+            session.account = self.account_for_token(str(params.get("bearer", "")))
+            if session.account is None: reply["error"] = {"code": 40110, "message": "NOT_AUTHORIZED"}
+            else: reply["result"] = {}
+        elif method == "subscribe":
+            channel = str(params.get("channel", ""))
+            if session.account is None: reply["error"] = {"code": 40110, "message": "NOT_AUTHORIZED"}
+            elif channel != "positions" and not channel.startswith("fills."):
+                reply["error"] = {"code": -32602, "message": "INVALID_CHANNEL"}
+            else:
+                session.channels.add(channel)
+                reply["result"] = {"channel": channel}
+        else:
+            reply["error"] = {"code": -32601, "message": "METHOD_NOT_FOUND"}
+        session.send_json(reply)
+
+    def publish(self, acc, channel, data):
+        """
+        推送给订阅了该账户频道的连接；每条消息带按账户、频道递增的 seq_no，丢弃的消息同样占用序号
+        """
+        with self._lock:
+            seq = acc.seq[channel] = acc.seq.get(channel, 0) + 1
+            targets = [s for s in self.sessions if s.account is acc and channel in s.channels]
+        msg = {"jsonrpc": "2.0", "method": "subscription", "params": {"channel": channel, "data": dict(data, seq_no=seq)}}
+        for session in targets:
+            if self.ws_drop_rate and self._rng.random() < self.ws_drop_rate:
+                self.count("__ws_drop")
+                continue
+            session.send_json(msg)
+
+    def trade(self, index=None, n=1):
+        """
+        为指定 (或随机) 账户生成 n 笔实时成交，推送 fills.ALL 与 positions
+        """
+        for _ in range(n):
+            acc = self.accounts[self._rng.randrange(len(self.accounts)) if index is None else index]
+            i, position = acc.add_fill(self._rng)
+            self.publish(acc, "fills.ALL", acc.fill_json(i))
+            self.publish(acc, "positions", position)
+
+    def kick(self):
+        with self._lock: sessions = list(self.sessions)
+        for session in sessions: session.kick()
+        return len(sessions)
+
+def make_handler(mock, prefix="/v1"):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, body, extra=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (extra or {}).items(): self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            path = parts.path
+            if self.headers.get("Upgrade", "").lower() == "websocket": return self._websocket()
+            if path == "/__stats":
+                with mock._lock: return self._send(200, dict(mock.counts))
+            if path == "/__reset":
+                with mock._lock: mock.counts.clear()
+                return self._send(200, {"ok": True})
+            if path == "/__trade":
+                q = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+                n = int(q.get("n", 1))
+                mock.trade(int(q["account"]) if "account" in q else None, n)
+                return self._send(200, {"fills": n})
+            if path == "/__kick":
+                return self._send(200, {"closed": mock.kick()})
+            if path == "/tg/__messages":
+                with mock._lock: return self._send(200, {"results": list(mock.tg_messages)})
+            if path.startswith(prefix): path = path[len(prefix):]
+            mock.count(path)
+            status, body, extra = mock.handle(path, parse_qs(parts.query), self.headers)
+            self._send(status, body, extra)
+
+        def do_POST(self):
+            path = urlsplit(self.path).path
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if not (path.startswith("/tg/bot") and path.endswith("/sendMessage")):
+                return self._send(404, {"error": "NOT_FOUND"})
+            mock.count("/tg/sendMessage")
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError:
+                return self._send(400, {"ok": False, "error_code": 400, "description": "Bad Request: invalid JSON"})
+            self._send(*mock.tg_send(path[len("/tg/bot"):-len("/sendMessage")], body))
+
+        def _websocket(self):
+            key = self.headers.get("Sec-WebSocket-Key", "")
+            accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+            self.send_response(101)
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.send_header("Sec-WebSocket-Accept", accept)
+            self.end_headers()
+            mock.count("/ws")
+            mock.serve_ws(WsSession(self.connection, self.rfile, self.wfile))
+            self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def start_server(mock, host="127.0.0.1", port=0):
+    """
+    在后台线程启动服务器，返回 (server, base_url)；port=0 时自动分配端口
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+def run_live_feed(mock, rate, stop=None):
+    """
+    按每秒 rate 笔的速率为随机账户生成实时成交 (后台线程)
+    """
+    stop = stop or threading.Event()
+    def loop():
+        while not stop.wait(random.expovariate(rate)): mock.trade()
+    threading.Thread(target=loop, daemon=True).start()
+    return stop
+
+def main():
+    parser = argparse.ArgumentParser(description="Paradex API 本地模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--accounts", type=int, default=14)
+    parser.add_argument("--fills", type=int, default=20000, help="每个账户的成交笔数")
+    parser.add_argument("--history-days", type=int, default=180)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的概率")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--max-page", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--live-rate", type=float, default=0.0, help="每秒生成并推送的实时成交笔数")
+    parser.add_argument("--ws-drop-rate", type=float, default=0.0, help="随机丢弃推送消息的概率")
+    parser.add_argument("--tg-rate", type=float, default=1.0, help="Telegram 存根每个会话每秒允许的消息数")
+    parser.add_argument("--tg-fail-rate", type=float, default=0.0, help="Telegram 存根返回 502 的概率")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    mock = MockParadex(args.accounts, args.fills, args.history_days, args.latency_ms, args.jitter_ms,
+                       args.error_rate, args.rate_429, args.retry_after, args.max_page, seed=args.seed,
+                       ws_drop_rate=args.ws_drop_rate, tg_rate=args.tg_rate, tg_fail_rate=args.tg_fail_rate)
+    if args.live_rate > 0: run_live_feed(mock, args.live_rate)
+    print(f"生成 {args.accounts} 个账户 x {args.fills:,} fills，用时 {time.time() - t0:.1f}s")
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(mock))
+    print(f"Mock Paradex API: http://{args.host}:{args.port}/v1  (API Key: mock-0 .. mock-{args.accounts - 1})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
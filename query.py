@@ -9,30 +9,48 @@ Paradex PnL Reader - Season 2 Ultimate Edition (v5.2)
 
 import os
 import sys
+import argparse
+import gzip
+import hashlib
 import json
+import pickle
+import queue
+import random
+import re
+import sqlite3
 import threading
 import time
+from array import array
+from collections import Counter, deque
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import unquote, urlsplit
 
-# 1. 依赖库检查与导入
+# 1. 依赖库检查与导入 (tkinter / openpyxl / pyarrow 只在 GUI 与导出时按需导入，命令行模式启动更快)
 try:
     import requests
+    from requests.adapters import HTTPAdapter
     from dotenv import load_dotenv
-    import tkinter as tk
-    from tkinter import scrolledtext, ttk, messagebox
-    import pandas as pd
 except ImportError as e:
     print(f"❌ 启动失败：缺少必要库 -> {e}")
-    print("请运行: pip install requests python-dotenv pandas openpyxl")
+    print("请运行: pip install requests python-dotenv openpyxl")
     sys.exit(1)
 
 # ================= 配置与环境加载 =================
 env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'para.env')
 load_dotenv(env_path)
 
-API_BASE_URL = "https://api.prod.paradex.trade/v1"
-CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs/stats_cache.json")
-EXCEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports")
+API_BASE_URL = os.getenv("PARADEX_API_BASE_URL", "https://api.prod.paradex.trade/v1")
+# 缓存与报表的根目录 (默认脚本所在目录；测试/基准可指向临时目录)
+DATA_DIR = os.getenv("PARADEX_DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
+CACHE_FILE = os.path.join(DATA_DIR, "logs/stats_cache.json")
+CACHE_DB = os.path.join(DATA_DIR, "logs/stats_cache.db")
+# 缓存后端: json (默认，单文件) / sqlite (WAL，按需加载成交，只写入新增行)
+CACHE_BACKEND = os.getenv("PARADEX_CACHE_BACKEND", "json").lower()
+EXCEL_DIR = os.path.join(DATA_DIR, "reports")
 
 # 账户组配置 (请全选覆盖，不要保留旧配置)
 GROUPS = [
@@ -90,6 +108,13 @@ GROUPS = [
 
 TG_BOT_TOKEN = os.getenv("TG_BOT_TOKEN")
 TG_CHAT_ID = os.getenv("TG_CHAT_ID")
+# Telegram Bot API 地址 (本地测试可指向 mock_server.py 的存根 http://127.0.0.1:8765/tg)
+TG_API_URL = os.getenv("PARADEX_TG_API_URL", "https://api.telegram.org").rstrip("/")
+# 推送队列：合并窗口 (秒，窗口内的多条消息合为一次发送)、相同内容的去重时间 (秒)、单条消息长度上限
+TG_COALESCE_SEC = float(os.getenv("PARADEX_TG_COALESCE_SEC", "2"))
+TG_DEDUPE_SEC = float(os.getenv("PARADEX_TG_DEDUPE_SEC", "300"))
+TG_MAX_LEN = 4096
+TG_PART_RETRIES = int(os.getenv("PARADEX_TG_PART_RETRIES", "2"))  # 单条发送失败后从该条重试的次数
 
 # ⚠️ 代理配置
 PROXY_CONFIG = {
@@ -98,7 +123,671 @@ PROXY_CONFIG = {
 }
 # PROXY_CONFIG = None 
 
+# 并发拉取账户的最大线程数 (可用 PARADEX_MAX_WORKERS 覆盖)
+MAX_WORKERS = int(os.getenv("PARADEX_MAX_WORKERS", "6"))
+# 命令行模式下把账户分片到 N 个子进程 (fork，仅 Linux / macOS)，每个进程有独立的连接池，限速按 1/N 分摊
+WORKER_PROCS = int(os.getenv("PARADEX_PROCS", "1"))
+
+# 账户注册表：PARADEX_ACCOUNTS_FILE 或 DATA_DIR 下的 accounts.json / .toml / .yaml 存在时取代上面的 GROUPS；
+# 环境变量 PARADEX_API_KEY_<组>_<序号> 中尚未配置的账户自动追加到对应组 (PARADEX_KEY_DISCOVERY=0 关闭)
+ACCOUNTS_FILE = os.getenv("PARADEX_ACCOUNTS_FILE")
+KEY_DISCOVERY = os.getenv("PARADEX_KEY_DISCOVERY", "1") == "1"
+KEY_ENV_PATTERN = re.compile(r"^PARADEX_API_KEY_(\d+)_(\d+)$")
+
+# 增量同步每隔多少页落盘一次断点
+SYNC_CHECKPOINT_PAGES = int(os.getenv("PARADEX_SYNC_CHECKPOINT_PAGES", "20"))
+# 两次断点落盘的最短间隔 (秒)，避免并发回填时反复整文件重写
+CHECKPOINT_MIN_SEC = float(os.getenv("PARADEX_CHECKPOINT_MIN_SEC", "5"))
+# 游标分页：首页 limit，整页返回时下一页翻倍直到上限 (接口最大 5000)；后台预取、尚未处理的页数上限
+PAGE_SIZE_START = 100
+PAGE_SIZE_MAX = int(os.getenv("PARADEX_PAGE_SIZE_MAX", "5000"))
+PAGE_PREFETCH = int(os.getenv("PARADEX_PAGE_PREFETCH", "2"))
+
+# 新账户历史回填：时间分片数 / 全局并发请求预算 / 历史起点 (默认 2023-09-01 UTC，早于主网上线)
+BACKFILL_SHARDS = int(os.getenv("PARADEX_BACKFILL_SHARDS", "8"))
+BACKFILL_CONCURRENCY = int(os.getenv("PARADEX_BACKFILL_CONCURRENCY", "8"))
+HISTORY_START_MS = int(os.getenv("PARADEX_HISTORY_START_MS", "1693526400000"))
+
+# 成交保留策略：超过 N 天的逐笔成交压缩为按天 (或按小时) 的聚合行，0 = 不压缩 (报表需要最近两周的逐笔数据，建议 >= 14)
+FILL_RETENTION_DAYS = int(os.getenv("PARADEX_FILL_RETENTION_DAYS", "0"))
+FILL_COMPACT_BUCKET = os.getenv("PARADEX_FILL_COMPACT_BUCKET", "day")   # day / hour
+# 压缩前把逐笔成交追加到 gzip 冷归档 (logs/archive/)
+FILL_ARCHIVE = os.getenv("PARADEX_FILL_ARCHIVE", "1") == "1"
+
+# Season 2 第 1 周的起点 (UTC 毫秒，默认 2024-10-04 周五 00:00)，之后每 7 天一周；用于把周分与成交额对齐，按实际赛季调整
+XP_SEASON_START_MS = int(os.getenv("PARADEX_XP_SEASON_START_MS", "1728000000000"))
+
+# 直连/代理路由探测结果的有效期 (秒)，过期后重新探测
+ROUTE_REPROBE_SEC = int(os.getenv("PARADEX_ROUTE_REPROBE_SEC", "600"))
+ROUTE_PROBE_TIMEOUT = 3
+
+# 各接口族的令牌桶限速: (每秒请求数, 突发容量)，可用 PARADEX_RATE_<FAMILY>=rate,burst 覆盖
+RATE_LIMITS = {
+    "fills": (10, 20),
+    "transfers": (5, 10),
+    "account": (10, 20),
+    "xp": (3, 6),
+    "telegram": (1, 3),
+    "default": (10, 20),
+}
+for _family in RATE_LIMITS:
+    _override = os.getenv(f"PARADEX_RATE_{_family.upper()}")
+    if _override: RATE_LIMITS[_family] = tuple(float(x) for x in _override.split(","))
+
+# 429 / 5xx / 超时的重试次数与指数退避参数 (秒)
+RETRY_MAX = int(os.getenv("PARADEX_RETRY_MAX", "5"))
+RETRY_BASE_SEC = 0.5
+RETRY_CAP_SEC = 30
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# 接口快照缓存的有效期 (秒)，可用 PARADEX_TTL_<KIND>=秒数 覆盖；连续点击多个报表时共用同一份数据
+SNAPSHOT_TTL = {
+    "summary": 30,       # /account/summary
+    "positions": 10,     # /positions
+    "markets": 5,        # /markets/summary 标记价格 (公共接口，全部账户共用一份)
+    "fills": 30,         # 成交增量同步
+    "transfers": 60,     # 出入金增量同步
+    "xp_balance": 300,   # /xp/account-balance
+    "xp_history": 3600,  # 赛季周分历史：只刷新未结算的最新一周，已结算的周本地冻结
+    "address": float("inf"),
+}
+for _kind in SNAPSHOT_TTL:
+    _override = os.getenv(f"PARADEX_TTL_{_kind.upper()}")
+    if _override: SNAPSHOT_TTL[_kind] = float(_override)
+
+# 运行指标：设置后每次操作结束写出 (.prom / .txt 为 Prometheus 文本格式，其余为 JSON)
+METRICS_FILE = os.getenv("PARADEX_METRICS_FILE")
+# 每次操作结束在日志中输出耗时分解
+SHOW_TIMINGS = os.getenv("PARADEX_TIMINGS", "0") == "1"
+
+# GUI 日志：每帧刷新间隔 (毫秒) 与滚动区保留行数；工作线程只入队，由 UI 线程按帧批量渲染
+GUI_LOG_FLUSH_MS = int(os.getenv("PARADEX_GUI_LOG_FLUSH_MS", "100"))
+GUI_LOG_MAX_LINES = int(os.getenv("PARADEX_GUI_LOG_LINES", "5000"))
+
+# 后台刷新 (GUI 勾选 / 命令行 watch；PARADEX_SCHEDULER=1 时 GUI 启动即开启)：
+# 活跃账户 (最近 N 小时有成交或有持仓) 与空闲账户的轮询间隔 (秒)，以及后台刷新每分钟的请求预算
+SCHEDULER_AUTOSTART = os.getenv("PARADEX_SCHEDULER", "0") == "1"
+SCHED_ACTIVE_SEC = float(os.getenv("PARADEX_SCHED_ACTIVE_SEC", "60"))
+SCHED_IDLE_SEC = float(os.getenv("PARADEX_SCHED_IDLE_SEC", "600"))
+SCHED_ACTIVE_HOURS = float(os.getenv("PARADEX_SCHED_ACTIVE_HOURS", "6"))
+SCHED_BUDGET_PER_MIN = float(os.getenv("PARADEX_SCHED_BUDGET", "120"))
+SCHED_WORKERS = 2
+
+# 实时推送 (WebSocket，需要 pip install websocket-client；GUI 勾选 / watch --stream，PARADEX_STREAM=1 时 GUI 启动即开启)：
+# 地址默认由 API_BASE_URL 推导；超过 WS_IDLE_SEC 秒没有消息先 ping，仍无响应则重连并用 REST 增量补齐；每 WS_RESYNC_SEC 秒用 REST 校对一次
+STREAM_AUTOSTART = os.getenv("PARADEX_STREAM", "0") == "1"
+WS_URL = os.getenv("PARADEX_WS_URL") or ("wss://ws.api.prod.paradex.trade/v1" if "api.prod.paradex.trade" in API_BASE_URL
+                                         else API_BASE_URL.replace("http", "ws", 1) + "/ws")
+WS_IDLE_SEC = float(os.getenv("PARADEX_WS_IDLE_SEC", "30"))
+WS_RESYNC_SEC = float(os.getenv("PARADEX_WS_RESYNC_SEC", "900"))
+
+# serve 模式 (本机 JSON 接口，供看板轮询)：监听地址与端口；结果缓存秒数，过期后后台重算，重算期间继续返回旧结果
+SERVE_HOST = os.getenv("PARADEX_SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("PARADEX_SERVE_PORT", "8787"))
+SERVE_MAX_AGE = float(os.getenv("PARADEX_SERVE_MAX_AGE", "5"))
+
+# 权益快照 (每次总资金 / 后台刷新记录余额、净充值、未结盈亏)：分钟级保留天数、小时级保留天数，日级永久保留
+EQUITY_MINUTE_DAYS = float(os.getenv("PARADEX_EQUITY_MINUTE_DAYS", "1"))
+EQUITY_HOUR_DAYS = float(os.getenv("PARADEX_EQUITY_HOUR_DAYS", "30"))
+
+# ================= 运行指标 =================
+
+class Metrics:
+    """
+    进程内运行指标：带标签的计数器与延迟直方图，可导出为 Prometheus 文本格式或 JSON。
+    同时按阶段累计当前操作的耗时 (多线程时为各线程耗时之和)，用于操作结束时的耗时分解。
+    账户标签取自线程本地变量，由 fan_out_accounts / 回填线程通过 bind() 绑定。
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, prefix="paradex"):
+        self.prefix = prefix
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> {"buckets": [...], "sum": s, "count": n}
+        self.phases = {}      # phase -> [seconds, count]，当前操作内累计
+        self.local = threading.local()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+    def bind(self, account):
+        self.local.account = account
+
+    def account(self):
+        return getattr(self.local, "account", None)
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, phase=None, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"buckets": [0] * (len(self.BUCKETS) + 1), "sum": 0.0, "count": 0}
+            hist["buckets"][bisect_left(self.BUCKETS, seconds)] += 1
+            hist["sum"] += seconds
+            hist["count"] += 1
+            if phase:
+                entry = self.phases.setdefault(phase, [0.0, 0])
+                entry[0] += seconds
+                entry[1] += 1
+
+    @contextmanager
+    def timer(self, name, phase=None, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, phase, **labels)
+
+    def reset(self):
+        """
+        清空全部指标 (多进程分片的子进程只回传本进程的增量)
+        """
+        self._lock = threading.Lock()
+        self.local = threading.local()
+        self.counters, self.histograms, self.phases = {}, {}, {}
+
+    def raw(self):
+        with self._lock:
+            return (dict(self.counters), {k: dict(h, buckets=list(h["buckets"])) for k, h in self.histograms.items()},
+                    {k: list(v) for k, v in self.phases.items()})
+
+    def merge(self, raw):
+        """
+        累加 raw() 的结果 (子进程的计数、直方图与阶段耗时)
+        """
+        counters, histograms, phases = raw
+        with self._lock:
+            for key, value in counters.items(): self.counters[key] = self.counters.get(key, 0) + value
+            for key, other in histograms.items():
+                hist = self.histograms.setdefault(key, {"buckets": [0] * (len(self.BUCKETS) + 1), "sum": 0.0, "count": 0})
+                hist["buckets"] = [a + b for a, b in zip(hist["buckets"], other["buckets"])]
+                hist["sum"] += other["sum"]
+                hist["count"] += other["count"]
+            for phase, (sec, cnt) in phases.items():
+                entry = self.phases.setdefault(phase, [0.0, 0])
+                entry[0] += sec
+                entry[1] += cnt
+
+    def begin_run(self):
+        """
+        开始一次操作：清空阶段累计，返回起始时间
+        """
+        with self._lock: self.phases = {}
+        return time.perf_counter()
+
+    def run_breakdown(self, wall):
+        """
+        返回本次操作的耗时分解文本行，按累计耗时降序
+        """
+        with self._lock: phases = sorted(self.phases.items(), key=lambda kv: -kv[1][0])
+        lines = [f"⏱ 耗时分解 (总 {wall:.2f}s，阶段耗时为各线程累计):"]
+        lines += [f"    {name:<28} {sec:>8.2f}s  ({cnt} 次)" for name, (sec, cnt) in phases]
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [{"name": f"{self.prefix}_{n}", "labels": dict(l), "value": v}
+                             for (n, l), v in sorted(self.counters.items())],
+                "histograms": [{"name": f"{self.prefix}_{n}", "labels": dict(l), "buckets": list(self.BUCKETS),
+                                "counts": list(h["buckets"]), "sum": h["sum"], "count": h["count"]}
+                               for (n, l), h in sorted(self.histograms.items())],
+            }
+
+    def to_prometheus(self):
+        def fmt(labels, extra=()):
+            items = [f'{k}="{v}"' for k, v in tuple(labels) + tuple(extra)]
+            return "{" + ",".join(items) + "}" if items else ""
+
+        lines, typed = [], set()
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                metric = f"{self.prefix}_{name}"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{fmt(labels)} {value:g}")
+            for (name, labels), hist in sorted(self.histograms.items()):
+                metric = f"{self.prefix}_{name}"
+                if metric not in typed:
+                    typed.add(metric)
+                    lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, n in zip(self.BUCKETS + ("+Inf",), hist["buckets"]):
+                    cumulative += n
+                    lines.append(f"{metric}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{metric}_sum{fmt(labels)} {hist['sum']:.6f}")
+                lines.append(f"{metric}_count{fmt(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        原子写出指标文件；.prom / .txt 写 Prometheus 文本格式 (可供 node_exporter textfile collector 采集)，其余写 JSON
+        """
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        text = self.to_prometheus() if path.endswith((".prom", ".txt")) else json.dumps(self.snapshot(), indent=2)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as f: f.write(text)
+            os.replace(tmp_path, path)
+        except Exception as e: print(f"Metrics write failed: {e}")
+
+METRICS = Metrics()
+
+# ================= 成交存储 =================
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+DAY_MS = 24 * HOUR_MS
+
+SIDES = ("", "BUY", "SELL")
+LIQUIDITY = ("", "MAKER", "TAKER")
+_SIDE_CODE = {name: i for i, name in enumerate(SIDES)}
+_LIQUIDITY_CODE = {name: i for i, name in enumerate(LIQUIDITY)}
+
+class FillStore:
+    """
+    单账户成交的列式存储
+    ts (int64) / vol / pnl / fee (float64) 连续数组 + 成交 id，按 ts 升序排列；
+    市场 (mkt) 为字典编码 (本账户的 markets 列表下标，uint16)，方向 (side) 与流动性 (liq) 为 int8 枚举 (SIDES / LIQUIDITY)，
+    这三列加 fee / cnt 每笔 16 字节，旧版缓存没有这些字段，编码为 0 ("")。
+    内存约 56 字节/笔 (数值列与前缀和) + 成交 id (列表指针 8 字节 + str 对象 49 字节 + id 长度)，
+    按 20~40 字符的 id 计合计约 130~150 字节/笔，其中一半以上是 id。
+    同时维护 vol/pnl 前缀和与按小时、按天 (UTC) 的预聚合桶，随新成交增量更新：
+    任意时间窗口 = 二分定位 + 前缀和相减，O(log n)；按天/小时分组 = O(桶数)。
+    compact() 把 compacted_until 之前的逐笔成交合并为聚合行 (id 为 ""，cnt 为合并的笔数)，总计保持精确。
+    对外的行格式为 (ts, vol, pnl, id, market, side, liquidity, fee, count)，缺少后几项的旧格式行按缺省值补齐。
+    """
+    __slots__ = ("ts", "vol", "pnl", "ids", "mkt", "side", "liq", "fee", "cnt", "markets", "_market_codes",
+                 "cvol", "cpnl", "hourly", "daily", "pending", "compacted_until", "rewrite_before")
+    ROW_DEFAULTS = ("", "", "", 0.0, 1)  # market, side, liquidity, fee, count
+
+    def __init__(self):
+        self.ts = array('q')
+        self.vol = array('d')
+        self.pnl = array('d')    # realized_pnl - fee
+        self.ids = []            # 成交 id，旧版缓存迁移来的行为 ""
+        self.mkt = array('H')
+        self.side = array('b')
+        self.liq = array('b')
+        self.fee = array('d')
+        self.cnt = array('I')    # 每行代表的成交笔数：逐笔为 1，聚合行为合并的笔数
+        self.markets = [""]      # 市场字典：code -> 名称
+        self._market_codes = {"": 0}
+        self.cvol = array('d')   # cvol[i] = sum(vol[:i+1])
+        self.cpnl = array('d')
+        self.hourly = {}         # bucket_ms -> [vol, pnl, count]
+        self.daily = {}
+        self.pending = []        # 上次保存后新增的行 (编码后)，供 SQLite 后端增量写入
+        self.compacted_until = 0 # 此前的成交已压缩为聚合行
+        self.rewrite_before = None  # 压缩后 SQLite 需要整段重写的范围 [0, rewrite_before)
+
+    def __len__(self):
+        return len(self.ts)
+
+    def market_code(self, name):
+        code = self._market_codes.get(name)
+        if code is None:
+            code = self._market_codes[name] = len(self.markets)
+            self.markets.append(name)
+        return code
+
+    def _encode(self, row):
+        ts, vol, pnl, fid, market, side, liq, fee, n = (*row, *self.ROW_DEFAULTS[len(row) - 4:])
+        return (int(ts), vol, pnl, fid or "", self.market_code(market or ""),
+                _SIDE_CODE.get(side, 0), _LIQUIDITY_CODE.get(liq, 0), fee, n)
+
+    def decode(self, row):
+        ts, vol, pnl, fid, mkt, side, liq, fee, n = row
+        return ts, vol, pnl, fid, self.markets[mkt], SIDES[side], LIQUIDITY[liq], fee, n
+
+    def _columns(self):
+        return self.ts, self.vol, self.pnl, self.ids, self.mkt, self.side, self.liq, self.fee, self.cnt
+
+    def _rollup(self, rows):
+        """
+        rows: (ts, vol, pnl, count)
+        """
+        for ts, vol, pnl, n in rows:
+            for buckets, size in ((self.hourly, HOUR_MS), (self.daily, DAY_MS)):
+                b = buckets.setdefault(ts - ts % size, [0.0, 0.0, 0])
+                b[0] += vol
+                b[1] += pnl
+                b[2] += n
+
+    def _rebuild_prefix(self, pos=0):
+        del self.cvol[pos:], self.cpnl[pos:]
+        acc_vol = self.cvol[-1] if self.cvol else 0.0
+        acc_pnl = self.cpnl[-1] if self.cpnl else 0.0
+        for i in range(pos, len(self.ts)):
+            acc_vol += self.vol[i]
+            acc_pnl += self.pnl[i]
+            self.cvol.append(acc_vol)
+            self.cpnl.append(acc_pnl)
+
+    def extend(self, rows):
+        """
+        追加成交行。新数据晚于已有数据时直接追加 (均摊 O(1))，否则归并到有序位置。
+        """
+        rows = sorted((self._encode(r) for r in rows), key=lambda r: r[0])
+        if not rows: return
+        self._rollup((r[0], r[1], r[2], r[8]) for r in rows)
+        self.pending.extend(rows)
+        columns = self._columns()
+        pos = len(self.ts)
+        if self.ts and rows[0][0] < self.ts[-1]:
+            pos = bisect_right(self.ts, rows[0][0])
+            tail = list(zip(*(col[pos:] for col in columns)))
+            rows = sorted(tail + rows, key=lambda r: r[0])
+            for col in columns: del col[pos:]
+        for row in rows:
+            for col, value in zip(columns, row): col.append(value)
+        self._rebuild_prefix(pos)
+
+    def dedupe(self, rows):
+        """
+        去掉 id 已存在的行 (含批内重复)，只比对 [min_ts, max_ts] 范围内的已有成交。
+        已有行没有 id (旧版缓存) 时按 ts 计数去重：同一毫秒已有几笔无 id 成交，就丢掉几笔同 ts 的新行。
+        重试、重叠分页和 last_ts 边界上的同毫秒成交因此都是幂等的。
+        """
+        if not rows: return []
+        lo = bisect_left(self.ts, min(r[0] for r in rows))
+        hi = bisect_right(self.ts, max(r[0] for r in rows))
+        seen = set(self.ids[lo:hi])
+        seen.discard("")
+        # 已压缩区间的聚合行也没有 id，不参与按 ts 计数
+        k = max(lo, bisect_left(self.ts, self.compacted_until)) if self.compacted_until else lo
+        bare = Counter(self.ts[i] for i in range(k, hi) if not self.ids[i])
+        out = []
+        for row in rows:
+            fid = row[3]
+            if fid and fid in seen: continue
+            if fid: seen.add(fid)
+            if bare[row[0]] > 0:
+                bare[row[0]] -= 1
+                continue
+            out.append(row)
+        return out
+
+    def bounds(self, start_ms=None, end_ms=None):
+        lo = bisect_left(self.ts, start_ms) if start_ms is not None else 0
+        hi = bisect_left(self.ts, end_ms) if end_ms is not None else len(self.ts)
+        return lo, max(lo, hi)
+
+    def rows(self, start_ms=None, end_ms=None):
+        """
+        按时间顺序逐行产出 [start_ms, end_ms) 内的 (ts, vol, pnl, id, market, side, liquidity, fee, count)，不复制整段数据
+        """
+        lo, hi = self.bounds(start_ms, end_ms)
+        columns = self._columns()
+        for i in range(lo, hi):
+            yield self.decode(tuple(col[i] for col in columns))
+
+    def window(self, start_ms=None, end_ms=None):
+        """
+        统计 [start_ms, end_ms) 内的 (成交额, 盈亏, 笔数)
+        """
+        lo, hi = self.bounds(start_ms, end_ms)
+        if hi == lo: return 0.0, 0.0, 0
+        vol = self.cvol[hi - 1] - (self.cvol[lo - 1] if lo else 0.0)
+        pnl = self.cpnl[hi - 1] - (self.cpnl[lo - 1] if lo else 0.0)
+        return vol, pnl, self.count(lo, hi)
+
+    def count(self, lo, hi):
+        """
+        行 [lo, hi) 代表的成交笔数：已压缩区间的聚合行按 cnt 累加，其余每行一笔
+        """
+        k = min(hi, bisect_left(self.ts, self.compacted_until)) if self.compacted_until else lo
+        return sum(self.cnt[lo:k]) + (hi - max(lo, k)) if k > lo else hi - lo
+
+    def compact(self, until_ms, bucket_ms=DAY_MS):
+        """
+        把 [compacted_until, until_ms) 内的逐笔成交合并为每个 (时间桶, 市场, 方向, 流动性) 一行的聚合行，
+        until_ms 向下对齐到桶边界；成交额 / 盈亏 / 手续费 / 笔数的总计与窗口统计保持精确 (压缩区间内精度为一个桶)。
+        返回被合并的行数
+        """
+        until_ms -= until_ms % bucket_ms
+        if until_ms <= self.compacted_until: return 0
+        lo = bisect_left(self.ts, self.compacted_until)
+        hi = bisect_left(self.ts, until_ms)
+        columns = self._columns()
+        groups = {}
+        for ts, vol, pnl, fid, mkt, side, liq, fee, n in zip(*(col[lo:hi] for col in columns)):
+            key = (ts - ts % bucket_ms, mkt, side, liq)
+            agg = groups.get(key)
+            if agg is None: groups[key] = [vol, pnl, fee, n]
+            else:
+                agg[0] += vol
+                agg[1] += pnl
+                agg[2] += fee
+                agg[3] += n
+        rows = sorted((b, vol, pnl, "", mkt, side, liq, fee, n) for (b, mkt, side, liq), (vol, pnl, fee, n) in groups.items())
+        rows += zip(*(col[hi:] for col in columns))
+        for col in columns: del col[lo:]
+        for row in rows:
+            for col, value in zip(columns, row): col.append(value)
+        self._rebuild_prefix(lo)
+        self.compacted_until = until_ms
+        self.pending = [r for r in self.pending if r[0] >= until_ms]
+        self.rewrite_before = until_ms
+        return hi - lo
+
+    def buckets(self, size_ms, start_ms=None, end_ms=None):
+        """
+        按小时/天分组统计 [start_ms, end_ms)，返回 {bucket_ms: (vol, pnl, count)}。
+        完整落在窗口内的桶直接读预聚合结果，只有首尾两个不完整的桶走二分。
+        """
+        rollup = self.hourly if size_ms == HOUR_MS else self.daily
+        if not self.ts: return {}
+        start_ms = self.ts[0] if start_ms is None else start_ms
+        end_ms = self.ts[-1] + 1 if end_ms is None else end_ms
+        out = {}
+        for b in range(start_ms - start_ms % size_ms, end_ms, size_ms):
+            if b >= start_ms and b + size_ms <= end_ms:
+                if b in rollup: out[b] = tuple(rollup[b])
+            else:
+                vol, pnl, cnt = self.window(max(b, start_ms), min(b + size_ms, end_ms))
+                if cnt: out[b] = (vol, pnl, cnt)
+        return out
+
+    def total_volume(self):
+        return self.cvol[-1] if self.cvol else 0.0
+
+    def total_count(self):
+        return self.count(0, len(self.ts))
+
+    def to_json(self):
+        obj = {"ts": self.ts.tolist(), "vol": self.vol.tolist(), "pnl": self.pnl.tolist(), "id": self.ids,
+               "mkt": self.mkt.tolist(), "markets": self.markets, "side": self.side.tolist(),
+               "liq": self.liq.tolist(), "fee": self.fee.tolist()}
+        if self.compacted_until: obj["n"] = self.cnt.tolist()
+        return obj
+
+    @classmethod
+    def from_columns(cls, ts, vol, pnl, ids=None, mkt=None, markets=None, side=None, liq=None, fee=None, cnt=None):
+        """
+        由已按 ts 升序排列的列数据构建；mkt 为 markets 字典的下标，缺失的列按缺省值补齐
+        """
+        store = cls()
+        store.ts.extend(int(x) for x in ts)
+        n = len(store.ts)
+        store.vol.extend(vol)
+        store.pnl.extend(pnl)
+        store.ids = [x or "" for x in ids] if ids else [""] * n
+        if markets:
+            store.markets = list(markets)
+            store._market_codes = {name: i for i, name in enumerate(store.markets)}
+        store.mkt.extend(mkt or [0] * n)
+        store.side.extend(side or [0] * n)
+        store.liq.extend(liq or [0] * n)
+        store.fee.extend(fee or [0.0] * n)
+        store.cnt.extend(cnt or [1] * n)
+        store._rollup(zip(store.ts, store.vol, store.pnl, store.cnt))
+        store._rebuild_prefix()
+        return store
+
+    @classmethod
+    def from_json(cls, obj):
+        """
+        兼容旧版缓存中的 [{"ts","vol","pnl"}] 列表和新版列式结构
+        """
+        if isinstance(obj, dict):
+            return cls.from_columns(obj.get("ts", []), obj.get("vol", []), obj.get("pnl", []), obj.get("id"),
+                                    obj.get("mkt"), obj.get("markets"), obj.get("side"), obj.get("liq"), obj.get("fee"),
+                                    obj.get("n"))
+        store = cls()
+        if obj:
+            store.extend((int(f["ts"]), f["vol"], f["pnl"], f.get("id", "")) for f in obj)
+            store.pending.clear()
+        return store
+
+def get_fill_store(cache_key):
+    """
+    返回账户的成交存储 (不存在时创建)
+    """
+    with CACHE_LOCK:
+        cached = STATS_CACHE.setdefault(cache_key, {})
+        store = cached.get("fills")
+        if isinstance(store, FillStore):
+            METRICS.inc("fill_store_lookups_total", result="hit")
+            return store
+    # 在锁外加载/转换，避免大账户阻塞其他线程的提交
+    METRICS.inc("fill_store_lookups_total", result="load")
+    with METRICS.timer("fill_store_load_seconds", phase="fill_store_load"):
+        if store is None and DB_CACHE: store = DB_CACHE.load_fills(cache_key)
+        else: store = FillStore.from_json(store)
+    store.compacted_until = cached.get("compacted_until", 0)
+    with CACHE_LOCK:
+        if not isinstance(cached.get("fills"), FillStore): cached["fills"] = store
+        return cached["fills"]
+
+def _fills_of(cache_key):
+    return get_fill_store(cache_key) if cache_key in STATS_CACHE else None
+
+def fill_window(cache_key, start_ms=None, end_ms=None):
+    store = _fills_of(cache_key)
+    if not store: return 0.0, 0.0, 0
+    with CACHE_LOCK:  # 同步线程可能正在改写列与前缀和
+        return store.window(start_ms, end_ms)
+
+def _group_key(group_by):
+    """
+    返回 (全部已配置账户的 cache_key 列表, cache_key -> 汇总键)
+    group_by: "account" 按账户 / "group" 按组名 / 其他一律汇总到 "total"
+    """
+    group_of = {key: group["name"] for group, _, key in iter_accounts()}
+    if group_by == "account": key_of = lambda cache_key: cache_key
+    elif group_by == "group": key_of = lambda cache_key: group_of.get(cache_key, "")
+    else: key_of = lambda cache_key: "total"
+    return list(group_of), key_of
+
+def query_fills(accounts=None, start_ms=None, end_ms=None, group_by="account"):
+    """
+    本地成交窗口查询
+    accounts: cache_key 列表，默认全部已配置账户
+    group_by: "account" / "group" / "day" / "hour" / None (只返回总计)
+    返回 {key: {"vol", "pnl", "count"}}，day/hour 的 key 为桶起始毫秒时间戳 (UTC)
+    """
+    all_accounts, key_of = _group_key(group_by)
+    if accounts is None: accounts = all_accounts
+    out = {}
+
+    def add(key, vol, pnl, cnt):
+        row = out.setdefault(key, {"vol": 0.0, "pnl": 0.0, "count": 0})
+        row["vol"] += vol
+        row["pnl"] += pnl
+        row["count"] += cnt
+
+    for cache_key in accounts:
+        store = _fills_of(cache_key)
+        if not store: continue
+        if group_by in ("day", "hour"):
+            size = DAY_MS if group_by == "day" else HOUR_MS
+            with CACHE_LOCK: buckets = store.buckets(size, start_ms, end_ms)
+            for b, (vol, pnl, cnt) in buckets.items():
+                add(b, vol, pnl, cnt)
+            continue
+        with CACHE_LOCK: window = store.window(start_ms, end_ms)
+        add(key_of(cache_key), *window)
+    if group_by in ("day", "hour"): out = dict(sorted(out.items()))
+    return out
+
+BREAKDOWN_DIMS = {"market": ("mkt", None), "side": ("side", SIDES), "liquidity": ("liq", LIQUIDITY)}
+
+def _sum_by_code(codes, values, size):
+    """
+    按编码分组求和；装有 numpy 时用 bincount 向量化，否则逐行累加
+    """
+    if not len(codes): return [0.0] * size
+    try:
+        import numpy as np
+    except ImportError:
+        out = [0.0] * size
+        for code, value in zip(codes, values): out[code] += value
+        return out
+    weights = np.frombuffer(values, dtype=values.typecode)
+    return np.bincount(np.frombuffer(codes, dtype=codes.typecode), weights=weights, minlength=size).tolist()
+
+def fill_breakdown(by="market", accounts=None, start_ms=None, end_ms=None, group_by="account"):
+    """
+    本地成交拆分统计 (不发请求)
+    by: "market" / "side" / "liquidity"；group_by: "account" / "group" / None (只返回总计)
+    返回 {key: {维度值: {"vol", "pnl", "fee", "count"}}}，旧缓存中缺少该字段的成交归入 ""
+    """
+    all_accounts, key_of = _group_key(group_by)
+    if accounts is None: accounts = all_accounts
+    attr, names = BREAKDOWN_DIMS[by]
+    out = {}
+
+    for cache_key in accounts:
+        store = _fills_of(cache_key)
+        if not store: continue
+        with CACHE_LOCK:
+            lo, hi = store.bounds(start_ms, end_ms)
+            codes = getattr(store, attr)[lo:hi]
+            columns = (store.vol[lo:hi], store.pnl[lo:hi], store.fee[lo:hi], store.cnt[lo:hi])
+            labels = list(names or store.markets)
+        vol, pnl, fee, cnt = (_sum_by_code(codes, col, len(labels)) for col in columns)
+        bucket = out.setdefault(key_of(cache_key), {})
+        for code, label in enumerate(labels):
+            if not cnt[code]: continue
+            row = bucket.setdefault(label, {"vol": 0.0, "pnl": 0.0, "fee": 0.0, "count": 0})
+            row["vol"] += vol[code]
+            row["pnl"] += pnl[code]
+            row["fee"] += fee[code]
+            row["count"] += int(cnt[code])
+    return out
+
+def fill_profile(accounts=None, start_ms=None, end_ms=None, group_by="account"):
+    """
+    Maker/Taker 占比与手续费拖累，返回 {key: {"vol", "pnl", "fee", "count", "maker_share", "fee_bps", "fee_share"}}
+    maker_share 按成交额计 (流动性未知的旧成交不计入)；fee_bps = 手续费 / 成交额 (基点)；
+    fee_share = 手续费 / 扣费前盈亏 (pnl + fee)，扣费前亏损时为 None
+    """
+    out = {}
+    for key, rows in fill_breakdown("liquidity", accounts, start_ms, end_ms, group_by).items():
+        row = {k: sum(r[k] for r in rows.values()) for k in ("vol", "pnl", "fee", "count")}
+        maker = rows.get("MAKER", {}).get("vol", 0.0)
+        known = maker + rows.get("TAKER", {}).get("vol", 0.0)
+        gross = row["pnl"] + row["fee"]
+        row["maker_share"] = maker / known if known else None
+        row["fee_bps"] = row["fee"] / row["vol"] * 10000 if row["vol"] else None
+        row["fee_share"] = row["fee"] / gross if gross > 0 else None
+        out[key] = row
+    return out
+
 # ================= 缓存管理 =================
+def _json_default(obj):
+    if isinstance(obj, (FillStore, EquitySeries)): return obj.to_json()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
 def load_json(filepath):
     if not os.path.exists(filepath): return {}
     try:
@@ -106,338 +795,2440 @@ def load_json(filepath):
     except: return {}
 
 def save_json(filepath, data):
+    """
+    原子写入：先写同目录临时文件并 fsync，再 os.replace 覆盖，中途崩溃不会留下截断的缓存文件
+    """
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp_path = f"{filepath}.tmp"
     try:
-        with open(filepath, 'w') as f: json.dump(data, f, indent=2)
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, separators=(",", ":"), default=_json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
     except Exception as e: print(f"Save failed: {e}")
 
-STATS_CACHE = load_json(CACHE_FILE)
+class SqliteCache:
+    """
+    SQLite 缓存后端 (WAL 模式)
+    - accounts: 每个账户一行，保存 net_deposits / last_*_ts 等标量与同步游标 (JSON)
+    - fills:    (account, ts) 索引的成交明细，首次访问某账户时才加载
+    - transfers: 出入金明细，(account, id) 主键去重
+    - equity:    每个账户一行权益序列 (JSON)，与 accounts 分开存放
+    启动只读 accounts / equity 表，与成交历史长度无关；保存时在一个事务内批量写入新增行，
+    账户状态与权益序列只在内容变化时重写。
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._saved_transfers = {}  # account -> 已写入的 transfers 条数
+        self._saved_state = {}      # account -> 上次写入的账户状态 JSON
+        self._saved_equity = {}     # account -> 上次写入时的 series.version
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS accounts (account TEXT PRIMARY KEY, state TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS fills (account TEXT NOT NULL, ts INTEGER NOT NULL, vol REAL NOT NULL, pnl REAL NOT NULL,
+                                              fid TEXT NOT NULL DEFAULT '', market TEXT NOT NULL DEFAULT '',
+                                              side TEXT NOT NULL DEFAULT '', liquidity TEXT NOT NULL DEFAULT '',
+                                              fee REAL NOT NULL DEFAULT 0, n INTEGER NOT NULL DEFAULT 1);
+            CREATE INDEX IF NOT EXISTS idx_fills_account_ts ON fills (account, ts);
+            CREATE TABLE IF NOT EXISTS transfers (account TEXT NOT NULL, id TEXT NOT NULL, ts INTEGER NOT NULL, amount REAL NOT NULL,
+                                                  PRIMARY KEY (account, id));
+            CREATE TABLE IF NOT EXISTS equity (account TEXT PRIMARY KEY, series TEXT NOT NULL);
+        """)
+        # 旧版数据库补齐新增列
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(fills)")}
+        for name, ddl in (("fid", "TEXT NOT NULL DEFAULT ''"), ("market", "TEXT NOT NULL DEFAULT ''"),
+                          ("side", "TEXT NOT NULL DEFAULT ''"), ("liquidity", "TEXT NOT NULL DEFAULT ''"),
+                          ("fee", "REAL NOT NULL DEFAULT 0"), ("n", "INTEGER NOT NULL DEFAULT 1")):
+            if name not in columns: self.conn.execute(f"ALTER TABLE fills ADD COLUMN {name} {ddl}")
 
-# ================= 核心 API 功能 =================
+    def load(self):
+        cache = {}
+        with self._lock:
+            for account, state in self.conn.execute("SELECT account, state FROM accounts"):
+                cache[account] = json.loads(state)
+                # 旧版把权益序列存在账户状态里：不记录 _saved_*，下次保存时迁移到 equity 表
+                if "equity" not in cache[account]: self._saved_state[account] = state
+            for account, series in self.conn.execute("SELECT account, series FROM equity"):
+                if account not in cache: continue
+                cache[account]["equity"] = json.loads(series)  # 首次访问时由 get_equity_series 转换
+                self._saved_equity[account] = 0
+            for account in cache:
+                rows = self.conn.execute("SELECT id, ts, amount FROM transfers WHERE account = ? ORDER BY ts", (account,)).fetchall()
+                cache[account]["transfers"] = [list(r) for r in rows]
+                self._saved_transfers[account] = len(rows)
+        return cache
+
+    def reopen(self):
+        """
+        fork 出的子进程中重新打开连接 (sqlite 连接不能跨进程使用)；多个进程写入时靠 WAL 与 busy timeout 排队
+        """
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA synchronous=NORMAL")
 
-def fetch_address_unified(api_key):
+    def load_fills(self, account):
+        with self._lock:
+            rows = self.conn.execute("SELECT ts, vol, pnl, fid, market, side, liquidity, fee, n FROM fills"
+                                     " WHERE account = ? ORDER BY ts", (account,)).fetchall()
+        store = FillStore()
+        store.extend(rows)
+        store.pending.clear()
+        return store
+
+    def save(self, cache, full=False):
+        """
+        写入有变化的账户状态 / 权益序列和新增行；full=True 时写入全部成交 (用于从 JSON 迁移)
+        """
+        with self._lock, self.conn:
+            for account, data in list(cache.items()):
+                state = json.dumps({k: v for k, v in data.items() if k not in ("fills", "transfers", "equity")},
+                                   default=_json_default)
+                if full or self._saved_state.get(account) != state:
+                    self.conn.execute("INSERT OR REPLACE INTO accounts (account, state) VALUES (?, ?)", (account, state))
+                    self._saved_state[account] = state
+
+                series = data.get("equity")
+                # 加载后尚未转换的 JSON 与刚转换出的序列 version 都是 0，即没有变化
+                version = series.version if isinstance(series, EquitySeries) else 0
+                if series is not None and (full or self._saved_equity.get(account) != version):
+                    self.conn.execute("INSERT OR REPLACE INTO equity (account, series) VALUES (?, ?)",
+                                      (account, json.dumps(series, default=_json_default)))
+                    self._saved_equity[account] = version
+
+                store = data.get("fills")
+                if isinstance(store, FillStore):
+                    insert = ("INSERT INTO fills (account, ts, vol, pnl, fid, market, side, liquidity, fee, n)"
+                              " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+                    if store.rewrite_before and not full:
+                        # 压缩后整段替换为聚合行
+                        self.conn.execute("DELETE FROM fills WHERE account = ? AND ts < ?", (account, store.rewrite_before))
+                        self.conn.executemany(insert, ((account, *row) for row in store.rows(None, store.rewrite_before)))
+                    rows = store.rows() if full else map(store.decode, store.pending)
+                    self.conn.executemany(insert, ((account, *row) for row in rows))
+                    store.pending.clear()
+                    store.rewrite_before = None
+
+                transfers = data.get("transfers", [])
+                saved = self._saved_transfers.get(account, 0)
+                self.conn.executemany("INSERT OR IGNORE INTO transfers (account, id, ts, amount) VALUES (?, ?, ?, ?)",
+                                      ((account, str(t[0]), int(t[1]), float(t[2])) for t in transfers[saved:]))
+                self._saved_transfers[account] = len(transfers)
+
+def migrate_json_to_sqlite(json_path=CACHE_FILE, db_path=CACHE_DB):
     """
-    [核心修复] 统一获取账户地址
-    只调用一次 API，同时供 UI 和 Excel 使用，避免限流。
+    一次性把旧版 stats_cache.json 迁移到 SQLite (原 JSON 文件保留不动)
     """
-    if not api_key: return ""
-    try:
-        endpoint = f"{API_BASE_URL}/account/info"
-        headers = {"Authorization": f"Bearer {api_key}"}
-        try:
-            resp = requests.get(endpoint, headers=headers, timeout=10)
-        except:
-            if PROXY_CONFIG: resp = requests.get(endpoint, headers=headers, proxies=PROXY_CONFIG, timeout=10)
-            else: raise
-        
-        if resp.status_code == 200:
-            data = resp.json()
-            if "results" in data and len(data["results"]) > 0:
-                return data["results"][0].get("account", "")
-    except:
-        return ""
-    return ""
+    data = load_json(json_path)
+    for acc_data in data.values():
+        if "fills" in acc_data: acc_data["fills"] = FillStore.from_json(acc_data["fills"])
+    db = SqliteCache(db_path)
+    db.save(data, full=True)
+    print(f"✅ 已迁移 {len(data)} 个账户: {json_path} -> {db_path}")
+    return db
 
-def fetch_xp_combined(api_key):
+def load_cache():
+    global DB_CACHE
+    with METRICS.timer("cache_load_seconds", phase="cache_load", backend=CACHE_BACKEND):
+        if CACHE_BACKEND != "sqlite":
+            cache = load_json(CACHE_FILE)
+            for data in cache.values():
+                if "fills" not in data: continue
+                data["fills"] = FillStore.from_json(data["fills"])
+                data["fills"].compacted_until = data.get("compacted_until", 0)
+            return cache
+        if not os.path.exists(CACHE_DB) and os.path.exists(CACHE_FILE):
+            DB_CACHE = migrate_json_to_sqlite()
+        else:
+            DB_CACHE = SqliteCache(CACHE_DB)
+        return DB_CACHE.load()
+
+def save_cache():
     """
-    获取 Season 2 XP 详情
+    落盘当前缓存 (同步过程中的断点也经由此处保存)；缓存尚未加载时不写，避免空缓存覆盖磁盘数据
     """
-    if not api_key: return 0.0, 0.0, 0, 0.0, 0.0
-    
-    total_xp = 0.0
-    earned_xp = 0.0
-    transferable_xp = 0.0
-    latest_week_xp = 0.0
-    latest_week_num = 0
-    
-    headers = {"Authorization": f"Bearer {api_key}"}
+    if not _cache_loaded: return
+    with CACHE_LOCK, METRICS.timer("cache_save_seconds", phase="cache_save", backend=CACHE_BACKEND):
+        if DB_CACHE:
+            DB_CACHE.save(STATS_CACHE)
+            return
+        for data in STATS_CACHE.values():
+            if isinstance(data.get("fills"), FillStore): data["fills"].pending.clear()
+        save_json(CACHE_FILE, STATS_CACHE)
 
-    # 1. 获取账户 XP 余额
-    try:
-        url_balance = f"{API_BASE_URL}/xp/account-balance?season=season2"
+def checkpoint_cache():
+    """
+    同步过程中的断点落盘，按 CHECKPOINT_MIN_SEC 节流
+    """
+    global _last_checkpoint
+    with CACHE_LOCK:
+        if time.time() - _last_checkpoint < CHECKPOINT_MIN_SEC: return
+        save_cache()
+        _last_checkpoint = time.time()
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, "logs/archive")
+
+def archive_fills(cache_key, rows):
+    """
+    把逐笔成交追加到冷归档 logs/archive/<cache_key>/<YYYY-MM>.jsonl.gz，每行一个 JSON 数组
+    (ts, vol, pnl, id, market, side, liquidity, fee, count)；gzip 多成员追加，gzip.open 可直接顺序读取
+    """
+    by_month = {}
+    for row in rows:
+        month = datetime.fromtimestamp(row[0] / 1000, timezone.utc).strftime("%Y-%m")
+        by_month.setdefault(month, []).append(row)
+    folder = os.path.join(ARCHIVE_DIR, cache_key)
+    os.makedirs(folder, exist_ok=True)
+    for month, month_rows in by_month.items():
+        with gzip.open(os.path.join(folder, f"{month}.jsonl.gz"), "at", encoding="utf-8") as f:
+            f.writelines(json.dumps(row, separators=(",", ":")) + "\n" for row in month_rows)
+
+def compact_fills(cache_key, log_func=print, retention_days=None):
+    """
+    按保留策略把超过 retention_days (默认 FILL_RETENTION_DAYS) 天的逐笔成交压缩为聚合行，压缩前按需写入冷归档。
+    压缩边界记录在账户状态 compacted_until 中 (两种缓存后端都会保存)。返回被压缩的成交行数
+    """
+    retention_days = FILL_RETENTION_DAYS if retention_days is None else retention_days
+    if retention_days <= 0: return 0
+    bucket_ms = HOUR_MS if FILL_COMPACT_BUCKET == "hour" else DAY_MS
+    store = get_fill_store(cache_key)
+    horizon = int(time.time() * 1000) - retention_days * DAY_MS
+    horizon -= horizon % bucket_ms
+    with CACHE_LOCK:
+        cached = STATS_CACHE[cache_key]
+        store.compacted_until = max(store.compacted_until, cached.get("compacted_until", 0))
+        if horizon <= store.compacted_until: return 0
+        raw = list(store.rows(store.compacted_until, horizon))
+    # 先归档再压缩：归档失败时保留逐笔数据
+    if raw and FILL_ARCHIVE: archive_fills(cache_key, raw)
+    with CACHE_LOCK:
+        before = len(store)
+        n = store.compact(horizon, bucket_ms)
+        cached["compacted_until"] = store.compacted_until
+    if n: log_func(f"    🗜 压缩 {n:,} 笔旧成交 -> 保留 {len(store):,} 行 (原 {before:,} 行)")
+    return n
+
+_last_checkpoint = 0.0
+DB_CACHE = None
+CACHE_LOCK = threading.RLock()   # 保护 STATS_CACHE 的写入与落盘
+STATS_CACHE = {}                 # 首次用到成交历史时由 ensure_cache() 加载
+_cache_loaded = False
+
+def ensure_cache():
+    """
+    首次需要本地历史 (成交 / 出入金 / 权益) 时加载缓存；持仓、--help 与 serve 启动不读盘。
+    加载前已写入的内存数据 (例如持仓查询顺带缓存的地址) 覆盖在磁盘数据之上
+    """
+    global _cache_loaded
+    if _cache_loaded: return
+    with CACHE_LOCK:
+        if _cache_loaded: return
+        for cache_key, data in load_cache().items():
+            data.update(STATS_CACHE.get(cache_key, {}))
+            STATS_CACHE[cache_key] = data
+        _cache_loaded = True
+
+# ================= HTTP 客户端 =================
+
+class TokenBucket:
+    """
+    线程安全令牌桶：令牌可以预支为负数，调用方按返回的等待时间排队，保证整体速率不超限。
+    收到 429 时用 block() 让整个接口族暂停到 Retry-After 之后。
+    """
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, n=1):
+        """
+        预留 n 个令牌 (n 为负数时退还)，返回需要等待的秒数
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= n
+            return max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+
+    def block(self, seconds):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class RateLimiter:
+    """
+    按接口族 (fills / transfers / account / xp / telegram) 分桶的全局限速器，并统计请求、重试、限流等待次数
+    """
+    COUNTERS = ("requests", "retries", "throttled", "throttle_sec", "http_429", "failed")
+
+    def __init__(self, limits):
+        self.buckets = {name: TokenBucket(*cfg) for name, cfg in limits.items()}
+        self.stats = {name: dict.fromkeys(self.COUNTERS, 0) for name in limits}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def family(url):
+        if url.startswith(TG_API_URL): return "telegram"
+        path = urlsplit(url).path
+        if path.endswith("/fills"): return "fills"
+        if path.endswith("/transfers"): return "transfers"
+        if "/xp/" in path or "/campaigns/" in path: return "xp"
+        if "/account" in path or path.endswith("/positions"): return "account"
+        return "default"
+
+    def count(self, family, key, n=1):
+        with self._lock:
+            self.stats[family][key] += n
+
+    def acquire(self, family):
+        wait = self.buckets[family].reserve()
+        if wait > 0:
+            self.count(family, "throttled")
+            self.count(family, "throttle_sec", wait)
+            time.sleep(wait)
+        self.count(family, "requests")
+        self._local.requests = getattr(self._local, "requests", 0) + 1
+
+    def thread_requests(self):
+        """
+        当前线程累计发出的请求数 (后台刷新据此按实际用量结算请求预算)
+        """
+        return getattr(self._local, "requests", 0)
+
+    def charge_thread(self, n):
+        """
+        把其他线程代发的请求 (分页预取) 记到当前线程
+        """
+        self._local.requests = getattr(self._local, "requests", 0) + n
+
+    def block(self, family, seconds):
+        self.buckets[family].block(seconds)
+
+    def totals(self):
+        with self._lock:
+            return {k: sum(st[k] for st in self.stats.values()) for k in self.COUNTERS}
+
+    def merge(self, stats):
+        """
+        累加其他进程 (多进程分片) 的计数
+        """
+        with self._lock:
+            for family, counters in stats.items():
+                mine = self.stats.setdefault(family, dict.fromkeys(self.COUNTERS, 0))
+                for k, v in counters.items(): mine[k] += v
+
+    def summary(self, before=None):
+        """
+        返回一行统计文本；before 为先前的 totals()，用于只统计本次操作
+        """
+        now = self.totals()
+        d = {k: now[k] - (before or {}).get(k, 0) for k in self.COUNTERS}
+        return (f"请求 {d['requests']} | 重试 {d['retries']} | 限流等待 {d['throttled']} 次 ({d['throttle_sec']:.1f}s)"
+                f" | 429 {d['http_429']} | 失败 {d['failed']}")
+
+def retry_after_seconds(resp):
+    """
+    解析 Retry-After (秒数或 HTTP 日期)，无法解析时返回 None
+    """
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value and resp is not None and resp.status_code == 429:
+        # Telegram 把等待秒数放在响应体 {"parameters": {"retry_after": N}}
         try:
-            resp = requests.get(url_balance, headers=headers, timeout=10)
+            value = resp.json()["parameters"]["retry_after"]
         except:
-            if PROXY_CONFIG: resp = requests.get(url_balance, headers=headers, proxies=PROXY_CONFIG, timeout=10)
-            else: raise
-        
-        if resp.status_code == 200:
-            data = resp.json()
-            earned_xp = float(data.get("earned_xp", 0))
-            transferable_xp = float(data.get("transferrable_xp", 0))
-            total_xp = earned_xp
-    except: pass
-
-    # 2. 获取历史周分
+            pass
+    if not value: return None
     try:
-        url_history = f"{API_BASE_URL}/campaigns/private/points/history/season2"
+        return max(0.0, float(value))
+    except ValueError:
         try:
-            resp = requests.get(url_history, headers=headers, timeout=10)
-        except:
-            if PROXY_CONFIG: resp = requests.get(url_history, headers=headers, proxies=PROXY_CONFIG, timeout=10)
-            else: raise
-            
-        if resp.status_code == 200:
-            results = resp.json().get("results", [])
-            if results:
-                results.sort(key=lambda x: int(x.get("week", 0)))
-                latest = results[-1]
-                latest_week_num = int(latest.get("week", 0))
-                latest_week_xp = float(latest.get("points", {}).get("total", 0))
-    except: pass
-    
-    return total_xp, latest_week_xp, latest_week_num, earned_xp, transferable_xp
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
 
-def fetch_transfers_incremental(api_key, cache_key, log_func=print):
-    if not api_key: return 0.0
-    cached = STATS_CACHE.get(cache_key, {})
-    total_net = cached.get("net_deposits", 0.0)
-    last_ts = cached.get("last_transfer_ts", 0)
-    cursor, latest_ts = None, last_ts
-    
-    try:
-        while True:
-            endpoint = f"{API_BASE_URL}/transfers"
-            headers = {"Authorization": f"Bearer {api_key}"}
-            params = {"cursor": cursor}
-            if last_ts > 0: params["start_at"] = last_ts + 1
-            
-            try:
-                resp = requests.get(endpoint, headers=headers, params=params, timeout=10)
-            except:
-                if PROXY_CONFIG: resp = requests.get(endpoint, headers=headers, params=params, proxies=PROXY_CONFIG, timeout=15)
-                else: raise
-            
-            resp.raise_for_status()
-            data = resp.json()
-            results = data.get("results", [])
-            if not results: break
-
-            for item in results:
-                if item.get("status") == "COMPLETED":
-                    amt = float(item.get("amount", 0))
-                    direction = item.get("direction", "")
-                    ts = int(item.get("created_at", 0))
-                    if direction == "IN": total_net += amt
-                    elif direction == "OUT": total_net -= amt
-                    if ts > latest_ts: latest_ts = ts
-            
-            cursor = data.get("next")
-            if not cursor: break
-            
-        if cache_key not in STATS_CACHE: STATS_CACHE[cache_key] = {}
-        STATS_CACHE[cache_key]["net_deposits"] = total_net
-        STATS_CACHE[cache_key]["last_transfer_ts"] = latest_ts
-        return total_net
-    except Exception as e:
-        log_func(f"  [!] Transfer err: {str(e)[:30]}")
-        return cached.get("net_deposits", 0.0)
+def backoff_delay(attempt):
+    """
+    指数退避 + 全抖动
+    """
+    return random.uniform(0, min(RETRY_CAP_SEC, RETRY_BASE_SEC * (2 ** attempt)))
 
-def fetch_fills_incremental(api_key, cache_key, log_func=print):
-    if not api_key: return 0.0
-    cached = STATS_CACHE.get(cache_key, {})
-    if "fills" not in cached: cached["fills"] = []
-    
-    fills_list = cached["fills"]
-    last_ts = cached.get("last_fill_ts", 0)
-    cursor, latest_ts = None, last_ts
-    new_fills = []
-    
-    try:
-        while True:
-            endpoint = f"{API_BASE_URL}/fills"
-            headers = {"Authorization": f"Bearer {api_key}"}
-            params = {"cursor": cursor, "limit": 100}
-            if last_ts > 0: params["start_at"] = last_ts + 1
-            
+def endpoint_label(url):
+    """
+    指标用的接口标签：去掉 API_BASE_URL 前缀的路径；Telegram 请求路径含 Bot Token，统一记为 telegram
+    """
+    if url.startswith(TG_API_URL): return "telegram"
+    parts = urlsplit(url)
+    base = urlsplit(API_BASE_URL).path
+    return parts.path[len(base):] if base and parts.path.startswith(base) else parts.path
+
+class HttpClient:
+    """
+    全局共享 HTTP 客户端
+    1. 直连 / 代理各持有一个 Session，按 host 复用 keep-alive 连接池，避免重复 TCP+TLS 握手。
+    2. 按 host 记住可用路由，后续请求直接走该路由，不再每次先等直连超时。
+    3. 路由记录过期 (ROUTE_REPROBE_SEC) 后重新探测；当前路由断开时自动切换并记住新路由。
+    """
+    def __init__(self, proxies=None, pool_sizes=None, default_pool=4, reprobe_sec=ROUTE_REPROBE_SEC, limiter=None):
+        self.proxies = proxies
+        self.limiter = limiter
+        self.pool_sizes = pool_sizes or {}
+        self.default_pool = default_pool
+        self.reprobe_sec = reprobe_sec
+        self._sessions = {}
+        self._routes = {}       # origin -> (route, checked_at)
+        self._probe_locks = {}  # origin -> Lock，同一 origin 只探测一次
+        self._lock = threading.Lock()
+
+    def _session(self, route):
+        with self._lock:
+            session = self._sessions.get(route)
+            if session is None:
+                session = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=self.default_pool))
+                for origin, size in self.pool_sizes.items():
+                    session.mount(origin, HTTPAdapter(pool_connections=1, pool_maxsize=size))
+                if route == "proxy": session.proxies.update(self.proxies)
+                self._sessions[route] = session
+            return session
+
+    def reset_after_fork(self, limiter):
+        """
+        多进程分片的子进程中调用：丢弃从父进程继承的连接池 (socket 不能跨进程共用)，换用本进程的限速器；路由探测结果保留
+        """
+        self._sessions = {}
+        self._probe_locks = {}
+        self._lock = threading.Lock()
+        self.limiter = limiter
+
+    def _candidates(self):
+        return ["direct", "proxy"] if self.proxies else ["direct"]
+
+    def _probe(self, origin):
+        with METRICS.timer("route_probe_seconds", phase="route_probe", origin=origin):
+            for route in self._candidates():
+                try:
+                    self._session(route).head(origin, timeout=ROUTE_PROBE_TIMEOUT)
+                    return route
+                except requests.exceptions.RequestException:
+                    continue
+        return None
+
+    def route_for(self, origin):
+        """
+        返回 origin (scheme://host) 当前记住的路由，未知或过期时先探测一次
+        """
+        entry = self._routes.get(origin)
+        if entry and time.time() - entry[1] < self.reprobe_sec: return entry[0]
+        with self._lock:
+            probe_lock = self._probe_locks.setdefault(origin, threading.Lock())
+        with probe_lock:
+            entry = self._routes.get(origin)
+            if entry and time.time() - entry[1] < self.reprobe_sec: return entry[0]
+            route = self._probe(origin)
+            if route: self._routes[origin] = (route, time.time())
+            return route
+
+    def request(self, method, url, **kwargs):
+        """
+        经限速器发送请求；429 / 5xx / 超时按 Retry-After 或指数退避重试，
+        429 会让同一接口族的所有线程一起暂停。重试耗尽后返回最后的响应 (或抛出异常)。
+        """
+        endpoint = endpoint_label(url)
+        if not self.limiter: return self._timed_send(method, url, endpoint, **kwargs)
+        family = self.limiter.family(url)
+        for attempt in range(RETRY_MAX + 1):
+            self.limiter.acquire(family)
             try:
-                resp = requests.get(endpoint, headers=headers, params=params, timeout=10)
-            except:
-                if PROXY_CONFIG: resp = requests.get(endpoint, headers=headers, params=params, proxies=PROXY_CONFIG, timeout=15)
-                else: raise
-            
-            resp.raise_for_status()
-            data = resp.json()
-            results = data.get("results", [])
-            if not results: break
-
-            for fill in results:
-                price = float(fill.get("price", 0))
-                size = float(fill.get("size", 0))
-                ts = int(fill.get("created_at", 0))
-                vol = price * size
-                pnl = float(fill.get("realized_pnl", 0)) - float(fill.get("fee", 0))
-                
-                new_fills.append({"ts": ts, "vol": vol, "pnl": pnl})
-                if ts > latest_ts: latest_ts = ts
-            
-            cursor = data.get("next")
-            if not cursor: break
-            
-        if new_fills:
-            new_fills.sort(key=lambda x: x["ts"])
-            fills_list.extend(new_fills)
-            if cache_key not in STATS_CACHE: STATS_CACHE[cache_key] = {}
-            STATS_CACHE[cache_key]["fills"] = fills_list
-            STATS_CACHE[cache_key]["last_fill_ts"] = latest_ts
-            STATS_CACHE[cache_key]["total_volume"] = sum(f["vol"] for f in fills_list)
-            log_func(f"    + {len(new_fills)} fills")
-        
-        return cached.get("total_volume", 0.0)
-    except Exception as e:
-        log_func(f"  [!] Fills err: {str(e)[:30]}")
-        return cached.get("total_volume", 0.0)
+                resp = self._timed_send(method, url, endpoint, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= RETRY_MAX:
+                    self.limiter.count(family, "failed")
+                    METRICS.inc("http_failures_total", endpoint=endpoint)
+                    raise
+                delay = backoff_delay(attempt)
+            else:
+                if resp.status_code not in RETRY_STATUS: return resp
+                if resp.status_code == 429: self.limiter.count(family, "http_429")
+                if attempt >= RETRY_MAX:
+                    self.limiter.count(family, "failed")
+                    METRICS.inc("http_failures_total", endpoint=endpoint)
+                    return resp
+                delay = retry_after_seconds(resp)
+                if delay is None: delay = backoff_delay(attempt)
+                if resp.status_code == 429: self.limiter.block(family, delay)
+            self.limiter.count(family, "retries")
+            METRICS.inc("http_retries_total", endpoint=endpoint)
+            time.sleep(delay)
 
-def fetch_account_summary(api_key):
-    if not api_key: return None
-    try:
-        endpoint = f"{API_BASE_URL}/account/summary"
-        headers = {"Authorization": f"Bearer {api_key}"}
+    def _timed_send(self, method, url, endpoint, **kwargs):
+        """
+        单次发送并记录延迟与状态码 (连接失败/超时记为 error)
+        """
+        status = "error"
+        t0 = time.perf_counter()
         try:
-            resp = requests.get(endpoint, headers=headers, timeout=10)
-        except:
-            if PROXY_CONFIG: resp = requests.get(endpoint, headers=headers, proxies=PROXY_CONFIG, timeout=10)
-            else: raise
-        resp.raise_for_status()
-        data = resp.json()
-        return data[0] if data and isinstance(data, list) else None
-    except: return None
+            resp = self._send(method, url, **kwargs)
+            status = resp.status_code
+            return resp
+        finally:
+            METRICS.observe("http_request_seconds", time.perf_counter() - t0, phase=f"http {endpoint}",
+                            endpoint=endpoint, account=METRICS.account())
+            METRICS.inc("http_requests_total", endpoint=endpoint, status=status)
 
-def fetch_positions(api_key):
+    def _send(self, method, url, **kwargs):
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        preferred = self.route_for(origin)
+        routes = self._candidates()
+        if preferred in routes: routes = [preferred] + [r for r in routes if r != preferred]
+
+        last_err = None
+        for route in routes:
+            try:
+                resp = self._session(route).request(method, url, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                last_err = e
+                continue
+            if route != preferred:
+                self._routes[origin] = (route, time.time())
+                METRICS.inc("route_switches_total", origin=origin, route=route)
+            return resp
+        self._routes.pop(origin, None)
+        raise last_err
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+LIMITER = RateLimiter(RATE_LIMITS)
+HTTP = HttpClient(PROXY_CONFIG, limiter=LIMITER, pool_sizes={
+    "{0.scheme}://{0.netloc}".format(urlsplit(API_BASE_URL)): MAX_WORKERS * 2,
+    "{0.scheme}://{0.netloc}".format(urlsplit(TG_API_URL)): 2,
+})
+
+def api_get(path, api_key, params=None, timeout=10):
     """
-    获取账户当前持仓信息
+    通过共享客户端请求 Paradex 私有接口
     """
-    if not api_key: return []
-    try:
-        endpoint = f"{API_BASE_URL}/positions"
-        headers = {"Authorization": f"Bearer {api_key}"}
+    headers = {"Authorization": f"Bearer {api_key}"}
+    return HTTP.get(f"{API_BASE_URL}{path}", headers=headers, params=params, timeout=timeout)
+
+# ================= 快照缓存 =================
+
+class SnapshotCache:
+    """
+    按 (账户, 数据类型) 缓存接口结果，每种类型有独立 TTL (SNAPSHOT_TTL)。
+    同一 key 的并发请求合并为一次调用 (single-flight)：后到的线程等待先到的线程，直接复用其结果。
+    loader 返回 None 视为失败，不缓存，下次调用重新请求。
+    后台刷新运行期间由调度器负责更新的类型 (HOLD_KINDS) 至少保留 hold_sec 秒，报表直接读取本地数据，
+    标记价格、持仓等其余类型仍按各自 TTL 过期；
+    实时推送在线期间对应的快照被钉住 (pin)，由推送直接写入 (put)，不会过期。
+    local_only (serve 模式) 时 get 不再调用 loader，只返回已有快照 (过期也返回，没有时为 None)；
+    只有调度器在 loading() 内照常加载，请求处理线程不会访问上游。
+    """
+    HOLD_KINDS = ("fills", "transfers", "summary")
+
+    def __init__(self, ttls):
+        self.ttls = ttls
+        self.hold_sec = 0
+        self.local_only = False
+        self._local = threading.local()
+        self._data = {}       # (account, kind) -> (loaded_monotonic, loaded_wall, value)
+        self._flights = {}    # (account, kind) -> Lock
+        self._pinned = set()  # (account, kind)
+        self._lock = threading.Lock()
+
+    def _fresh(self, key):
+        entry = self._data.get(key)
+        if entry and key in self._pinned: return entry
+        ttl = self.ttls.get(key[1], 0)
+        if key[1] in self.HOLD_KINDS: ttl = max(ttl, self.hold_sec)
+        return entry if entry and time.monotonic() - entry[0] < ttl else None
+
+    def _flight(self, key):
+        with self._lock:
+            return self._flights.setdefault(key, threading.Lock())
+
+    def get(self, account, kind, loader):
+        key = (account, kind)
+        entry = self._fresh(key)
+        if entry:
+            METRICS.inc("snapshot_lookups_total", kind=kind, result="hit")
+            return entry[2]
+        if self.local_only and not getattr(self._local, "loading", False):
+            METRICS.inc("snapshot_lookups_total", kind=kind, result="local")
+            return self.peek(account, kind)
+        with self._flight(key):
+            entry = self._fresh(key)
+            if entry:
+                METRICS.inc("snapshot_lookups_total", kind=kind, result="coalesced")
+                return entry[2]
+            METRICS.inc("snapshot_lookups_total", kind=kind, result="miss")
+            value = loader()
+            if value is not None: self._data[key] = (time.monotonic(), time.time(), value)
+            return value
+
+    @contextmanager
+    def loading(self):
+        """
+        当前线程在 local_only 模式下照常按 TTL 加载 (调度器刷新用)
+        """
+        self._local.loading = True
         try:
-            resp = requests.get(endpoint, headers=headers, timeout=10)
-        except:
-            if PROXY_CONFIG: resp = requests.get(endpoint, headers=headers, proxies=PROXY_CONFIG, timeout=10)
-            else: raise
-        
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("results", [])
-    except: return []
+            yield
+        finally:
+            self._local.loading = False
 
-def send_tg_msg(message):
-    if not TG_BOT_TOKEN or not TG_CHAT_ID: return
-    try:
-        url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage"
-        requests.post(url, json={"chat_id": TG_CHAT_ID, "text": message, "parse_mode": "HTML"}, proxies=PROXY_CONFIG, timeout=15)
-    except: pass
+    def refresh(self, account, kind, loader):
+        """
+        忽略 TTL 强制重新加载 (后台刷新用)；失败时保留旧值并返回 None
+        """
+        key = (account, kind)
+        with self._flight(key):
+            METRICS.inc("snapshot_lookups_total", kind=kind, result="refresh")
+            value = loader()
+            if value is not None: self._data[key] = (time.monotonic(), time.time(), value)
+            return value
 
-# ================= UI 应用程序类 =================
+    def put(self, account, kind, value):
+        self._data[(account, kind)] = (time.monotonic(), time.time(), value)
 
-class ParadexStatsApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Paradex 统计助手 v5.2 (Fix Excel Addr)")
-        self.root.geometry("1100x600")
-        
-        style = ttk.Style()
-        style.configure("TButton", font=("Arial", 10), padding=5)
-        
-        btn_frame = ttk.Frame(root, padding=10)
-        btn_frame.pack(fill=tk.X)
-        
-        self.btn_total = ttk.Button(btn_frame, text="📊 总资金 (Total Stats)", command=self.run_total_thread)
-        self.btn_total.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
-        
-        self.btn_weekly = ttk.Button(btn_frame, text="📅 最新周报 + 💾 Excel", command=self.run_weekly_thread)
-        self.btn_weekly.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+    def pin(self, account, kind, pinned=True):
+        with self._lock:
+            if pinned: self._pinned.add((account, kind))
+            else: self._pinned.discard((account, kind))
 
-        self.btn_vol = ttk.Button(btn_frame, text="📉 本周表现 (UTC Fri)", command=self.run_volume_thread)
-        self.btn_vol.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+    def pinned(self, account, kind):
+        return (account, kind) in self._pinned
+
+    def export(self, accounts):
+        return {key: entry for key, entry in self._data.items() if key[0] in accounts}
+
+    def merge(self, entries):
+        self._data.update(entries)
+
+    def peek(self, account, kind):
+        """
+        返回已缓存的值 (不论是否过期，不触发加载)，没有时返回 None
+        """
+        entry = self._data.get((account, kind))
+        return entry[2] if entry else None
+
+    def as_of(self, *keys):
+        """
+        keys 为若干 (account, kind)；返回其中最旧一份快照的加载时间 (time.time())，任一缺失时返回 None
+        """
+        times = [self._data.get(key, (None, None))[1] for key in keys]
+        return None if not times or None in times else min(times)
+
+    def invalidate(self, account=None, kind=None):
+        with self._lock:
+            for key in [k for k in self._data if account in (None, k[0]) and kind in (None, k[1])]:
+                del self._data[key]
+
+    def clear(self):
+        self.invalidate()
+
+# 远端快照 (summary / positions / xp_balance / address) 以 api_key 为账户键；本地同步 (fills / transfers / xp_history) 以 cache_key 为键
+SNAPSHOTS = SnapshotCache(SNAPSHOT_TTL)
+
+def format_age(ts):
+    """
+    数据时效：'12s 前' / '5 分钟前'，没有快照时返回 '-'
+    """
+    if ts is None: return "-"
+    age = max(0.0, time.time() - ts)
+    return f"{age:.0f}s 前" if age < 120 else f"{age / 60:.0f} 分钟前"
+
+# ================= 核心 API 功能 =================
+
+def _load_address(api_key):
+    resp = api_get("/account/info", api_key)
+    resp.raise_for_status()
+    data = resp.json()
+    if "results" in data and len(data["results"]) > 0:
+        return data["results"][0].get("account", "") or None
+    return None
+
+def fetch_address_unified(api_key, cache_key=None):
+    """
+    [核心修复] 统一获取账户地址
+    只调用一次 API，同时供 UI 和 Excel 使用，避免限流。
+    地址不会变化：传入 cache_key 时永久保存在账户缓存中 (随缓存落盘)，之后不再请求。
+    """
+    if not api_key: return ""
+    cached = STATS_CACHE.get(cache_key, {}) if cache_key else {}
+    if cached.get("address"): return cached["address"]
+    address = SNAPSHOTS.get(api_key, "address", lambda: _load_address(api_key)) or ""
+    if address and cache_key:
+        with CACHE_LOCK: STATS_CACHE.setdefault(cache_key, {})["address"] = address
+    return address
+
+def _load_xp_balance(api_key):
+    resp = api_get("/xp/account-balance", api_key, params={"season": "season2"})
+    resp.raise_for_status()
+    data = resp.json()
+    return float(data.get("earned_xp", 0)), float(data.get("transferrable_xp", 0))
+
+def _sync_xp_history(api_key, cache_key):
+    """
+    把赛季周分历史合并进本地 STATS_CACHE[cache_key]["xp_weeks"] ({"周数": XP}，随缓存落盘)。
+    最新一周之前的周视为已结算 (xp_settled)，冻结不再改写；每次只更新未结算的周。
+    距上次同步 (xp_checked_at，已落盘) 不足 SNAPSHOT_TTL["xp_history"] 时直接用本地数据，重启后也不重复请求。
+    成功返回本地周分字典，失败返回 None。
+    """
+    cached = STATS_CACHE.setdefault(cache_key, {})
+    if "xp_weeks" in cached and time.time() - cached.get("xp_checked_at", 0) < SNAPSHOT_TTL["xp_history"]:
+        return cached["xp_weeks"]
+    try:
+        resp = api_get("/campaigns/private/points/history/season2", api_key)
+        if resp.status_code != 200: return None
+        results = resp.json().get("results", [])
+    except: return None
+
+    with CACHE_LOCK:
+        weeks = cached.setdefault("xp_weeks", {})
+        settled = cached.get("xp_settled", 0)
+        latest = 0
+        for item in results:
+            week = int(item.get("week", 0))
+            latest = max(latest, week)
+            if week > settled: weeks[str(week)] = float(item.get("points", {}).get("total", 0))
+        cached["xp_settled"] = max(settled, latest - 1)
+        cached["xp_checked_at"] = time.time()
+    return weeks
+
+def fetch_xp_history(api_key, cache_key):
+    """
+    返回账户的周分历史 {周数: XP} (按周升序)，必要时只刷新未结算的一周
+    """
+    if api_key: SNAPSHOTS.get(cache_key, "xp_history", lambda: _sync_xp_history(api_key, cache_key))
+    weeks = STATS_CACHE.get(cache_key, {}).get("xp_weeks", {})
+    return {int(w): xp for w, xp in sorted(weeks.items(), key=lambda kv: int(kv[0]))}
+
+def fetch_xp_combined(api_key, cache_key):
+    """
+    获取 Season 2 XP 详情
+    """
+    if not api_key: return 0.0, 0.0, 0, 0.0, 0.0
+
+    # 1. 获取账户 XP 余额
+    earned_xp, transferable_xp = SNAPSHOTS.get(api_key, "xp_balance", lambda: _load_xp_balance(api_key)) or (0.0, 0.0)
+    total_xp = earned_xp
+
+    # 2. 历史周分 (本地增量同步)
+    weeks = fetch_xp_history(api_key, cache_key)
+    latest_week_num = max(weeks, default=0)
+    latest_week_xp = weeks.get(latest_week_num, 0.0)
+    
+    return total_xp, latest_week_xp, latest_week_num, earned_xp, transferable_xp
+
+def paginate(path, api_key, params=None, cursor=None, page_size=PAGE_SIZE_START, sem=None, account=None, timeout=15):
+    """
+    流水线游标分页，逐页生成 (results, next_cursor)
+    后台线程取回一页、解析出游标后立即请求下一页，调用方处理本页时下一页已在路上 (最多预取 PAGE_PREFETCH 页)；
+    某页返回满 page_size 条时下一页 page_size 翻倍，直到 PAGE_SIZE_MAX。空页或没有游标时结束。
+    sem 为每个请求占用的并发名额 (历史回填)；请求失败时在调用方抛出 requests.HTTPError。
+    """
+    account = account or METRICS.account()
+    pages = queue.Queue(maxsize=max(1, PAGE_PREFETCH))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(cursor, page_size):
+        METRICS.bind(account)
+        try:
+            while not stop.is_set():
+                before = LIMITER.thread_requests()
+                with sem or nullcontext():
+                    resp = api_get(path, api_key, params=dict(params or {}, page_size=page_size, cursor=cursor), timeout=timeout)
+                resp.raise_for_status()
+                data = resp.json()
+                results = data.get("results", [])
+                cursor = data.get("next") if results else None
+                METRICS.inc("pages_total", endpoint=path, account=account)
+                METRICS.inc("rows_total", len(results), endpoint=path, account=account)
+                if not put((results, cursor, LIMITER.thread_requests() - before)) or not cursor: return
+                if len(results) >= page_size: page_size = min(page_size * 2, PAGE_SIZE_MAX)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=produce, args=(cursor, page_size), name=f"paginate {path}", daemon=True).start()
+    try:
+        while True:
+            item = pages.get()
+            if isinstance(item, Exception): raise item
+            results, cursor, used = item
+            LIMITER.charge_thread(used)
+            yield results, cursor
+            if not cursor: return
+    finally:
+        stop.set()
+
+def resumable_sync(api_key, cache_key, state_key, path, start_at, commit_page, base_params=None, log_func=print):
+    """
+    可断点续传的游标分页同步 (经由 paginate 流水线翻页)
+    同步状态 {start_at, cursor, hw_ts} 存于 STATS_CACHE[cache_key][state_key]。
+    接口按新 -> 旧翻页，逐页写入会让每页都插到已有数据中间；因此每 SYNC_CHECKPOINT_PAGES 页 (及最后一页) 攒成一批，
+    与游标一起在锁内提交一次，再调用 checkpoint_cache() 原子落盘。游标只随已提交的数据前进，中断后下次从保存的游标继续。
+    commit_page(results) 负责去重并写入一批数据，返回其中最大 ts。
+    全部翻页完成后删除同步状态并返回高水位 ts。
+    """
+    cached = STATS_CACHE[cache_key]
+    sync = cached.get(state_key)
+    if sync and sync.get("cursor"):
+        log_func(f"    ↻ 续传 {path} (自断点继续)")
+    else:
+        sync = {"start_at": start_at, "cursor": None, "hw_ts": start_at}
+    cursor_retried = False
+    pages = 0
+
+    while True:
+        params = dict(base_params or {})
+        if sync["start_at"] > 0: params["start_at"] = sync["start_at"]
+        batch = []
+        try:
+            for results, cursor in paginate(path, api_key, params, cursor=sync["cursor"], account=cache_key):
+                batch.extend(results)
+                pages += 1
+                if cursor and pages % SYNC_CHECKPOINT_PAGES: continue
+                with CACHE_LOCK:
+                    if batch: sync["hw_ts"] = max(sync["hw_ts"], commit_page(batch))
+                    sync["cursor"] = cursor
+                    cached[state_key] = sync
+                batch = []
+                if cursor: checkpoint_cache()
+            break
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 0
+            if not sync["cursor"] or cursor_retried or not 400 <= status < 500 or status == 429: raise
+            # 保存的游标已失效：从 start_at 重新翻页，已提交的行按 id 去重 (未提交的一批丢弃重拉)
+            cursor_retried = True
+            sync["cursor"] = None
+
+    with CACHE_LOCK: cached.pop(state_key, None)
+    return sync["hw_ts"]
+
+def fetch_transfers_incremental(api_key, cache_key, log_func=print):
+    """
+    增量同步出入金并返回净充值，同步失败返回 None (本地净充值可能不完整)；
+    SNAPSHOT_TTL["transfers"] 秒内的重复或并发调用只同步一次
+    """
+    if not api_key: return 0.0
+    if SNAPSHOTS.get(cache_key, "transfers", lambda: _sync_transfers(api_key, cache_key, log_func)) is None: return None
+    return STATS_CACHE.get(cache_key, {}).get("net_deposits", 0.0)
+
+def _sync_transfers(api_key, cache_key, log_func):
+    """
+    成功返回净充值，失败返回 None (不写入快照缓存)
+    高水位只随 COMPLETED 记录推进；仍在处理中的转账 (非 COMPLETED / FAILED) 记下最早的 ts (transfer_pending_ts，随断点落盘)，
+    下次从它开始重新扫描，完成后按 id 去重计入
+    """
+    with CACHE_LOCK:
+        cached = STATS_CACHE.setdefault(cache_key, {})
+        transfers = cached.setdefault("transfers", [])
+    last_ts = cached.get("last_transfer_ts", 0)
+    # 旧版缓存没有明细 id，无法去重，只能沿用 last_ts + 1
+    start_at = last_ts if transfers or not last_ts else last_ts + 1
+    seen = {t[0] for t in transfers}
+    added = [0]
+
+    def commit_page(results):
+        latest = 0
+        for item in results:
+            ts = int(item.get("created_at", 0))
+            status = item.get("status")
+            if status not in ("COMPLETED", "FAILED"):
+                cached["transfer_pending_ts"] = min(cached.get("transfer_pending_ts") or ts, ts)
+            if status != "COMPLETED": continue
+            latest = max(latest, ts)
+            tid = str(item.get("id", ""))
+            if tid and tid in seen: continue
+            amt = float(item.get("amount", 0))
+            direction = item.get("direction", "")
+            signed = amt if direction == "IN" else -amt if direction == "OUT" else 0.0
+            if tid: seen.add(tid)
+            transfers.append([tid, ts, signed])
+            cached["net_deposits"] = cached.get("net_deposits", 0.0) + signed
+            added[0] += 1
+        return latest
+
+    try:
+        hw_ts = resumable_sync(api_key, cache_key, "transfer_sync", "/transfers", start_at, commit_page, log_func=log_func)
+        with CACHE_LOCK:
+            transfers.sort(key=lambda t: t[1])
+            hw_ts = max(last_ts, hw_ts)
+            pending_ts = cached.pop("transfer_pending_ts", None)
+            cached["last_transfer_ts"] = min(hw_ts, pending_ts - 1) if pending_ts else hw_ts
+        return cached.get("net_deposits", 0.0)
+    except Exception as e:
+        log_func(f"  [!] Transfer err: {str(e)[:30]}")
+        return None
+
+def parse_fill(fill):
+    """
+    API 成交记录 -> (ts, vol, pnl, id, market, side, liquidity, fee)
+    """
+    price = float(fill.get("price", 0))
+    size = float(fill.get("size", 0))
+    ts = int(fill.get("created_at", 0))
+    vol = price * size
+    fee = float(fill.get("fee", 0))
+    pnl = float(fill.get("realized_pnl", 0)) - fee
+    return (ts, vol, pnl, str(fill.get("id", "")), fill.get("market", ""), fill.get("side", ""),
+            fill.get("liquidity", ""), fee)
+
+def fetch_fills_incremental(api_key, cache_key, log_func=print):
+    """
+    增量同步成交并返回累计成交额，同步失败返回 None (本地成交可能不完整)；
+    SNAPSHOT_TTL["fills"] 秒内的重复或并发调用只同步一次
+    """
+    if not api_key: return 0.0
+    if SNAPSHOTS.get(cache_key, "fills", lambda: _sync_fills(api_key, cache_key, log_func)) is None: return None
+    return STATS_CACHE.get(cache_key, {}).get("total_volume", 0.0)
+
+def _sync_fills(api_key, cache_key, log_func):
+    """
+    成功返回累计成交额，失败返回 None (不写入快照缓存)
+    """
+    store = get_fill_store(cache_key)
+    cached = STATS_CACHE[cache_key]
+    cached_count = store.total_count()
+    try:
+        # 新账户 (或未完成的回填) 先走分片并发回填，再增量补齐
+        if cached.get("backfill") or (not cached.get("last_fill_ts") and not store and not cached.get("fill_sync")):
+            backfill_fills(api_key, cache_key, log_func)
+    except Exception as e:
+        log_func(f"  [!] Backfill err: {str(e)[:30]}")
+        return None
+
+    last_ts = cached.get("last_fill_ts", 0)
+    # 从 last_ts 本身开始拉取并按 id / ts 去重，避免丢掉同一毫秒的成交 (旧版无 id 缓存同样适用)
+    start_at = last_ts
+    added = [0]
+
+    def commit_page(results):
+        rows = [parse_fill(fill) for fill in results]
+        latest = max(r[0] for r in rows)
+        with CACHE_LOCK:  # 实时推送的成交也写入同一个 store
+            rows = store.dedupe(rows)
+            store.extend(rows)
+            cached["total_volume"] = store.total_volume()
+        added[0] += len(rows)
+        return latest
+
+    try:
+        hw_ts = resumable_sync(api_key, cache_key, "fill_sync", "/fills", start_at, commit_page, log_func=log_func)
+        with CACHE_LOCK:
+            cached["last_fill_ts"] = max(last_ts, hw_ts)
+        compact_fills(cache_key, log_func)
+        METRICS.inc("fills_total", cached_count, source="cache", account=cache_key)
+        METRICS.inc("fills_total", store.total_count() - cached_count, source="network", account=cache_key)
+        if added[0]: log_func(f"    + {added[0]} fills")
+        return cached.get("total_volume", 0.0)
+    except Exception as e:
+        log_func(f"  [!] Fills err: {str(e)[:30]}")
+        return None
+
+def _load_account_summary(api_key):
+    resp = api_get("/account/summary", api_key)
+    resp.raise_for_status()
+    data = resp.json()
+    return data[0] if data and isinstance(data, list) else None
+
+def fetch_account_summary(api_key):
+    """
+    账户概要；请求失败时抛出异常 (requests.RequestException)，由调用方把该账户标记为失败，而不是当作余额 0
+    """
+    if not api_key: return None
+    return SNAPSHOTS.get(api_key, "summary", lambda: _load_account_summary(api_key))
+
+def _load_positions(api_key):
+    resp = api_get("/positions", api_key)
+    resp.raise_for_status()
+    data = resp.json()
+    return data.get("results", [])
+
+def fetch_positions(api_key):
+    """
+    获取账户当前持仓信息；请求失败时抛出异常，local_only 模式下还没有快照时返回 None
+    """
+    if not api_key: return []
+    return SNAPSHOTS.get(api_key, "positions", lambda: _load_positions(api_key))
+
+# ================= 持仓风险 =================
+
+def _load_mark_prices():
+    try:
+        resp = HTTP.get(f"{API_BASE_URL}/markets/summary", params={"market": "ALL"}, timeout=10)
+        resp.raise_for_status()
+        return {m["symbol"]: float(m["mark_price"]) for m in resp.json().get("results", [])
+                if m.get("symbol") and m.get("mark_price")}
+    except: return None
+
+def fetch_mark_prices():
+    """
+    全市场标记价格 {market: mark_price}；公共接口，所有账户共用一份快照
+    """
+    return SNAPSHOTS.get("", "markets", _load_mark_prices) or {}
+
+def position_risk(positions, marks):
+    """
+    用标记价格一次性重算所有账户的持仓，装有 numpy 时整批向量化
+    positions: [{"market", "size" (多正空负), "entry_price", "upnl" (接口返回值)}, ...]
+    返回逐仓列 {"mark", "upnl", "exposure" (带方向的名义价值), "notional"}；
+    缺少标记价格的市场沿用接口 uPnL，名义价值按开仓价估算 (mark 为 None)
+    """
+    size = array('d', (p["size"] for p in positions))
+    entry = array('d', (p["entry_price"] for p in positions))
+    reported = array('d', (p["upnl"] for p in positions))
+    mark = array('d', (marks.get(p["market"], float("nan")) for p in positions))
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    if np is None or not positions:
+        known = [m == m for m in mark]
+        price = [m if k else e for m, e, k in zip(mark, entry, known)]
+        exposure = [s * p for s, p in zip(size, price)]
+        return {"mark": [m if k else None for m, k in zip(mark, known)],
+                "upnl": [(m - e) * s if k else r for m, e, s, r, k in zip(mark, entry, size, reported, known)],
+                "exposure": exposure, "notional": [abs(x) for x in exposure]}
+    s, e, r, m = (np.frombuffer(col, dtype="d") for col in (size, entry, reported, mark))
+    known = ~np.isnan(m)
+    exposure = s * np.where(known, m, e)
+    return {"mark": [float(x) if k else None for x, k in zip(m, known)],
+            "upnl": np.where(known, (m - e) * s, r).tolist(),
+            "exposure": exposure.tolist(), "notional": np.abs(exposure).tolist()}
+
+def market_exposure(positions, risk):
+    """
+    按市场汇总全部账户的净敞口 / 总名义价值，并拆到各组
+    返回 {market: {"net", "gross", "groups": {group: net}}}，按总名义价值降序
+    """
+    markets = sorted({p["market"] for p in positions})
+    groups = [g["name"] for g in GROUPS]
+    m_code = {name: i for i, name in enumerate(markets)}
+    g_code = {name: i for i, name in enumerate(groups)}
+    codes = array('l', (m_code[p["market"]] for p in positions))
+    cells = array('l', (g_code.get(p["group"], 0) * len(markets) + m_code[p["market"]] for p in positions))
+    exposure, notional = array('d', risk["exposure"]), array('d', risk["notional"])
+    net = _sum_by_code(codes, exposure, len(markets))
+    gross = _sum_by_code(codes, notional, len(markets))
+    by_group = _sum_by_code(cells, exposure, len(markets) * len(groups))
+    out = {market: {"net": net[i], "gross": gross[i],
+                    "groups": {g: by_group[j * len(markets) + i] for j, g in enumerate(groups)}}
+           for i, market in enumerate(markets)}
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]["gross"]))
+
+# ================= 权益快照 =================
+
+class EquitySeries:
+    """
+    单账户权益时间序列：余额 (account_value，含未结盈亏)、净充值、未结盈亏，列式数组存放
+    三档分辨率：分钟档保留 EQUITY_MINUTE_DAYS 天，小时档保留 EQUITY_HOUR_DAYS 天，日档永久；
+    每次记录同时写入三档，同一时间桶内后到的快照覆盖先到的 (ts 为桶内最后一次快照的时间)，
+    lo / hi 记录桶内盈亏的最低 / 最高点，降采样后回撤计算不会漏掉桶内低点。
+    盈亏 = 余额 - 净充值，查询时计算，不单独存储。
+    version 每次记录加一，SQLite 后端据此只重写有变化的序列。
+    """
+    TIERS = (("m", MINUTE_MS), ("h", HOUR_MS), ("d", DAY_MS))
+    FIELDS = ("bal", "net", "upnl", "lo", "hi")
+
+    def __init__(self):
+        self.tiers = {name: {"ts": array('q'), **{f: array('d') for f in self.FIELDS}} for name, _ in self.TIERS}
+        self.version = 0
+
+    def __len__(self):
+        return sum(len(tier["ts"]) for tier in self.tiers.values())
+
+    def last(self):
+        """
+        最近一次快照 (ts, bal, net, upnl)，没有时返回 None
+        """
+        tier = self.tiers["m"] if self.tiers["m"]["ts"] else self.tiers["d"]
+        if not tier["ts"]: return None
+        return tier["ts"][-1], tier["bal"][-1], tier["net"][-1], tier["upnl"][-1]
+
+    def record(self, ts, bal, net, upnl):
+        pnl = bal - net
+        for name, width in self.TIERS:
+            tier = self.tiers[name]
+            if tier["ts"] and tier["ts"][-1] // width == ts // width:
+                if ts < tier["ts"][-1]: continue
+                tier["ts"][-1], tier["bal"][-1], tier["net"][-1], tier["upnl"][-1] = ts, bal, net, upnl
+                tier["lo"][-1] = min(tier["lo"][-1], pnl)
+                tier["hi"][-1] = max(tier["hi"][-1], pnl)
+            elif not tier["ts"] or ts > tier["ts"][-1]:
+                for key, value in zip(("ts",) + self.FIELDS, (ts, bal, net, upnl, pnl, pnl)): tier[key].append(value)
+            # 早于最后一个桶的快照 (时钟回拨 / 迟到的旧快照) 忽略
+        self.version += 1
+        self.prune(ts)
+
+    def prune(self, now_ms):
+        for name, days in (("m", EQUITY_MINUTE_DAYS), ("h", EQUITY_HOUR_DAYS)):
+            tier = self.tiers[name]
+            cut = bisect_left(tier["ts"], now_ms - days * DAY_MS)
+            if cut:
+                for column in tier.values(): del column[:cut]
+
+    def points(self, start_ms=None, end_ms=None, resolution=None):
+        """
+        [start_ms, end_ms) 内的 (ts, bal, net, upnl, lo, hi, 桶宽) 列表，按时间升序
+        resolution 为 "m" / "h" / "d" 时只取该档；默认由细到粗拼接：分钟档覆盖的时段用分钟点，更早的用小时点，再早的用日点
+        """
+        names = [resolution] if resolution else ["m", "h", "d"]
+        widths = dict(self.TIERS)
+        out, cutoff = [], end_ms
+        for name in names:
+            tier = self.tiers[name]
+            lo = bisect_left(tier["ts"], start_ms) if start_ms else 0
+            hi = bisect_left(tier["ts"], cutoff) if cutoff is not None else len(tier["ts"])
+            if lo >= hi: continue
+            out[:0] = zip(tier["ts"][lo:hi], tier["bal"][lo:hi], tier["net"][lo:hi], tier["upnl"][lo:hi],
+                          tier["lo"][lo:hi], tier["hi"][lo:hi], [widths[name]] * (hi - lo))
+            cutoff = tier["ts"][lo]
+        return out
+
+    def to_json(self):
+        return {name: {key: [round(x, 2) for x in column] if key != "ts" else column.tolist()
+                       for key, column in tier.items()} for name, tier in self.tiers.items()}
+
+    @classmethod
+    def from_json(cls, obj):
+        series = cls()
+        for name, tier in (obj or {}).items():
+            if name not in series.tiers: continue
+            for key, column in series.tiers[name].items(): column.extend(tier.get(key, []))
+        return series
+
+def get_equity_series(cache_key):
+    """
+    返回账户的权益序列 (不存在时创建；缓存文件中的 JSON 在首次访问时转换)
+    """
+    with CACHE_LOCK:
+        cached = STATS_CACHE.setdefault(cache_key, {})
+        series = cached.get("equity")
+        if not isinstance(series, EquitySeries): series = cached["equity"] = EquitySeries.from_json(series)
+        return series
+
+def _equity_of(cache_key):
+    return get_equity_series(cache_key) if "equity" in STATS_CACHE.get(cache_key, {}) else None
+
+def record_equity(cache_key, api_key, summary, positions=None):
+    """
+    记录一次权益快照 (不发请求)：余额取 summary 快照，时间为该快照的加载时间，同一份快照重复记录不会产生新点；
+    未结盈亏取 positions (或已缓存的持仓快照)，都没有时沿用上一次的值
+    """
+    if not summary: return
+    as_of = SNAPSHOTS.as_of((api_key, "summary")) or time.time()
+    if positions is None: positions = SNAPSHOTS.peek(api_key, "positions")
+    series = get_equity_series(cache_key)
+    with CACHE_LOCK:
+        if positions is not None: upnl = sum(float(p.get("unrealized_pnl", 0)) for p in positions)
+        else: upnl = series.last()[3] if series.last() else 0.0
+        series.record(int(as_of * 1000), float(summary.get("account_value", 0)),
+                      STATS_CACHE[cache_key].get("net_deposits", 0.0), upnl)
+
+def equity_curve(accounts=None, start_ms=None, end_ms=None, group_by="account", resolution=None):
+    """
+    本地权益曲线查询 (不发请求)
+    accounts: cache_key 列表，默认全部已配置账户
+    group_by: "account" / "group" / None (全部账户合计)
+    返回 {key: {"ts", "balance", "net_deposits", "pnl", "upnl", "pnl_lo", "pnl_hi"}} (列表列，按时间升序)；
+    合计时各账户按所在档位的时间桶对齐并向前填充 (账户首个快照之前不计入)，pnl_lo / pnl_hi 取收盘值
+    """
+    all_accounts, key_of = _group_key(group_by)
+    if accounts is None: accounts = all_accounts
+    members = {}
+    for cache_key in accounts:
+        series = _equity_of(cache_key)
+        if not series: continue
+        with CACHE_LOCK: rows = series.points(start_ms, end_ms, resolution)
+        if rows: members.setdefault(key_of(cache_key), []).append(rows)
+
+    out = {}
+    for key, member_rows in members.items():
+        if group_by == "account":
+            rows = member_rows[0]
+        else:
+            buckets = {}
+            for i, account_rows in enumerate(member_rows):
+                for row in account_rows: buckets.setdefault(row[0] - row[0] % row[6], {})[i] = row
+            rows, latest = [], {}
+            for bucket in sorted(buckets):
+                latest.update(buckets[bucket])
+                bal = sum(r[1] for r in latest.values())
+                net = sum(r[2] for r in latest.values())
+                rows.append((bucket, bal, net, sum(r[3] for r in latest.values()), bal - net, bal - net))
+        out[key] = {"ts": [r[0] for r in rows], "balance": [r[1] for r in rows], "net_deposits": [r[2] for r in rows],
+                    "pnl": [r[1] - r[2] for r in rows], "upnl": [r[3] for r in rows],
+                    "pnl_lo": [r[4] for r in rows], "pnl_hi": [r[5] for r in rows]}
+    return out
+
+def max_drawdown(curve):
+    """
+    盈亏曲线 (已扣除净充值，出入金不影响) 的最大回撤：每个点的桶内低点对比此前的最高点
+    返回 {"drawdown", "drawdown_pct" (相对峰值时的余额), "peak_ts", "trough_ts"}
+    """
+    best = {"drawdown": 0.0, "drawdown_pct": None, "peak_ts": None, "trough_ts": None}
+    peak = peak_ts = peak_bal = None
+    for ts, bal, lo, hi in zip(curve["ts"], curve["balance"], curve["pnl_lo"], curve["pnl_hi"]):
+        if peak is not None and peak - lo > best["drawdown"]:
+            best = {"drawdown": peak - lo, "drawdown_pct": (peak - lo) / peak_bal * 100 if peak_bal > 0 else None,
+                    "peak_ts": peak_ts, "trough_ts": ts}
+        if peak is None or hi > peak: peak, peak_ts, peak_bal = hi, ts, bal
+    return best
+
+def return_series(curve):
+    """
+    逐点收益：change 为盈亏变化，return_pct 为 change / 上一点余额，cumulative_pct 为复利累计收益率
+    返回 {"ts", "change", "return_pct", "cumulative_pct"} (从第二个点开始)
+    """
+    out = {"ts": [], "change": [], "return_pct": [], "cumulative_pct": []}
+    growth = 1.0
+    pnl, bal = curve["pnl"], curve["balance"]
+    for i in range(1, len(pnl)):
+        change = pnl[i] - pnl[i - 1]
+        ret = change / bal[i - 1] if bal[i - 1] > 0 else 0.0
+        growth *= 1 + ret
+        out["ts"].append(curve["ts"][i])
+        out["change"].append(change)
+        out["return_pct"].append(ret * 100)
+        out["cumulative_pct"].append((growth - 1) * 100)
+    return out
+
+# ================= Telegram 推送 =================
+
+def split_tg_message(text, limit=TG_MAX_LEN):
+    """
+    按 Telegram 单条长度上限切分：优先在空行 (段落) 处断开，其次在换行处，单行超长时硬切
+    """
+    parts, current = [], ""
+    for block in text.split("\n\n"):
+        piece = "\n\n" + block if current else block
+        if len(current) + len(piece) <= limit:
+            current += piece
+            continue
+        if current: parts.append(current)
+        current = ""
+        for line in block.split("\n"):
+            piece = "\n" + line if current else line
+            if len(current) + len(piece) <= limit:
+                current += piece
+                continue
+            if current: parts.append(current)
+            while len(line) > limit:
+                parts.append(line[:limit])
+                line = line[limit:]
+            current = line
+    if current: parts.append(current)
+    return parts
+
+class TgDelivery:
+    """
+    一次 submit 的投递结果
+    status: queued / sent / duplicate (近期已发送过相同内容) / replaced (被同 key 的新消息取代) /
+            partial (切分后的前 sent_parts 条已发出，其余失败) / failed / disabled
+    ok 在结束后为 True / False；wait() 阻塞到结束并返回 ok。on_done(delivery) 在发送线程中回调。
+    """
+    def __init__(self, text, key=None, on_done=None):
+        self.text = text
+        self.key = key
+        self.on_done = on_done
+        self.status = "queued"
+        self.ok = None
+        self.error = None
+        self.parts = 0       # 切分后的条数
+        self.sent_parts = 0  # 已成功发出的条数
+        self._done = threading.Event()
+
+    def finish(self, status, ok, error=None):
+        self.status, self.ok, self.error = status, ok, error
+        self._done.set()
+        METRICS.inc("telegram_messages_total", status=status)
+        if self.on_done:
+            try:
+                self.on_done(self)
+            except Exception:
+                pass
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.ok
+
+class TelegramDispatcher:
+    """
+    Telegram 发送队列：submit() 立即返回，由独立线程发送，报表线程不再等待网络
+    1. 合并：第一条消息到达后等待 TG_COALESCE_SEC，窗口内的全部消息合成一次发送 (空行分隔)；
+       同一 key 只保留最新一条 (例如连续两次总资金推送)，完全相同的文本只发一次。
+    2. 去重：TG_DEDUPE_SEC 内已成功发送过的相同内容直接跳过 (告警类推送不会刷屏)。
+    3. 超过 TG_MAX_LEN 的内容按段落切分为多条依次发送；限速 (telegram 接口族) 与 429 retry_after 重试由 HTTP 客户端处理，
+       HTML 解析失败时改为纯文本重发一次。
+    4. 按条记录进度：某条失败时从这一条重试 (TG_PART_RETRIES 次)，已发出的不重发；
+       仍失败时，全部内容已发出的消息照常报告成功，只发出一部分的报告 partial。
+    5. 每条 submit 的真实结果经 TgDelivery 回报给调用方。
+    """
+    def __init__(self, token, chat_id, api_url=TG_API_URL, coalesce_sec=TG_COALESCE_SEC, dedupe_sec=TG_DEDUPE_SEC):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = api_url
+        self.coalesce_sec = coalesce_sec
+        self.dedupe_sec = dedupe_sec
+        self.pending = deque()
+        self.recent = {}  # 文本 -> 最近一次成功发送的时间
+        self._cond = threading.Condition()
+        self._busy = False
+        self._flushing = False
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return bool(self.token and self.chat_id)
+
+    def submit(self, text, key=None, on_done=None):
+        delivery = TgDelivery(text, key, on_done)
+        if not self.enabled:
+            delivery.finish("disabled", False, "未配置 TG_BOT_TOKEN / TG_CHAT_ID")
+            return delivery
+        with self._cond:
+            self.pending.append(delivery)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="telegram", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return delivery
+
+    def flush(self, timeout=None):
+        """
+        跳过合并窗口，等待队列发送完毕 (命令行退出前调用)；超时返回 False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            try:
+                while self.pending or self._busy:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0: return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flushing = False
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self.pending: self._cond.wait()
+                deadline = time.monotonic() + self.coalesce_sec
+                while not self._flushing and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                batch = list(self.pending)
+                self.pending.clear()
+                self._busy = True
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                for delivery in batch:
+                    if delivery.status == "queued": delivery.finish("failed", False, str(e)[:80])
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _dispatch(self, batch):
+        # 同一 key (或相同文本) 合为一条，保留最新内容
+        slots = {}
+        for delivery in batch: slots.setdefault(delivery.key or delivery.text, []).append(delivery)
+        now = time.time()
+        self.recent = {text: ts for text, ts in self.recent.items() if now - ts < self.dedupe_sec}
+        fresh = [slot[-1] for slot in slots.values() if slot[-1].text not in self.recent]
+
+        error = None
+        for text, owners in self._plan(fresh):
+            error = self._send_part(text)
+            if error: break
+            for delivery, n in owners.items(): delivery.sent_parts += n
+        for slot in slots.values():
+            latest = slot[-1]
+            if latest not in fresh: latest.finish("duplicate", True)
+            elif latest.sent_parts == latest.parts:
+                self.recent[latest.text] = time.time()
+                latest.finish("sent", True)
+            elif latest.sent_parts: latest.finish("partial", False, error)
+            else: latest.finish("failed", False, error)
+            # 被取代的旧消息跟随取代者的结果
+            for older in slot[:-1]: older.finish("replaced", latest.ok, latest.error)
+
+    @staticmethod
+    def _plan(deliveries):
+        """
+        各条消息分别切分后按顺序装箱 (每条 <= TG_MAX_LEN，不同消息之间空行分隔)，
+        返回 [(发送文本, {delivery: 其中包含的片段数})]，发送成功后据此累计每条消息的进度
+        """
+        plan = []
+        for delivery in deliveries:
+            pieces = split_tg_message(delivery.text)
+            delivery.parts = len(pieces)
+            for piece in pieces:
+                if plan and len(plan[-1][0]) + 2 + len(piece) <= TG_MAX_LEN:
+                    plan[-1] = (plan[-1][0] + "\n\n" + piece, plan[-1][1])
+                else:
+                    plan.append((piece, {}))
+                owners = plan[-1][1]
+                owners[delivery] = owners.get(delivery, 0) + 1
+        return plan
+
+    def _send_part(self, text):
+        """
+        发送一条，失败时只重试这一条 (指数退避)；成功返回 None，否则返回最后一次的错误描述
+        """
+        for attempt in range(TG_PART_RETRIES + 1):
+            error = self._send(text)
+            if not error: return None
+            if attempt < TG_PART_RETRIES:
+                METRICS.inc("telegram_part_retries_total")
+                time.sleep(min(RETRY_CAP_SEC, RETRY_BASE_SEC * 2 ** (attempt + 1)))
+        return error
+
+    def _send(self, text):
+        """
+        发送一条 (<= TG_MAX_LEN)，成功返回 None，否则返回错误描述
+        """
+        url = f"{self.api_url}/bot{self.token}/sendMessage"
+        payload = {"chat_id": self.chat_id, "text": text, "parse_mode": "HTML"}
+        try:
+            with METRICS.timer("telegram_seconds"):
+                resp = HTTP.post(url, json=payload, timeout=15)
+                if resp.status_code == 400 and "parse" in resp.text:
+                    payload.pop("parse_mode")
+                    resp = HTTP.post(url, json=payload, timeout=15)
+        except Exception as e:
+            return str(e)[:80]
+        try:
+            body = resp.json()
+        except ValueError:
+            body = {}
+        if resp.status_code == 200 and body.get("ok"): return None
+        return body.get("description") or f"HTTP {resp.status_code}"
+
+TG_QUEUE = TelegramDispatcher(TG_BOT_TOKEN, TG_CHAT_ID)
+
+def send_tg_msg(message, key=None, on_done=None):
+    """
+    把消息放入 Telegram 发送队列，立即返回 TgDelivery
+    """
+    return TG_QUEUE.submit(message, key=key, on_done=on_done)
+
+# ================= XP 趋势 =================
+
+def season_week_bounds(week):
+    """
+    第 week 周的 [start_ms, end_ms)
+    """
+    start = XP_SEASON_START_MS + (week - 1) * 7 * DAY_MS
+    return start, start + 7 * DAY_MS
+
+def xp_trend(accounts=None, group_by="account", last=None):
+    """
+    本地 XP 趋势查询 (不发请求)：周分来自本地 xp_weeks，周成交额来自 FillStore
+    accounts: cache_key 列表，默认全部已配置账户
+    group_by: "account" / "group" / None (只返回总计)
+    last: 只保留最近 N 周
+    返回 {key: [{"week", "xp", "volume", "xp_per_m", "delta", "delta_pct"}, ...]} (按周升序)，
+    xp_per_m 为每 $1M 成交对应的 XP，delta / delta_pct 为与上一周相比的变化
+    """
+    all_accounts, key_of = _group_key(group_by)
+    if accounts is None: accounts = all_accounts
+    sums = {}  # key -> {week: [xp, volume]}
+
+    for cache_key in accounts:
+        weeks = STATS_CACHE.get(cache_key, {}).get("xp_weeks", {})
+        if not weeks: continue
+        bucket = sums.setdefault(key_of(cache_key), {})
+        store = _fills_of(cache_key)
+        for week, xp in weeks.items():
+            week = int(week)
+            vol = fill_window(cache_key, *season_week_bounds(week))[0] if store else 0.0
+            row = bucket.setdefault(week, [0.0, 0.0])
+            row[0] += xp
+            row[1] += vol
+
+    out = {}
+    for key, bucket in sums.items():
+        rows, prev = [], None
+        for week in sorted(bucket):
+            xp, vol = bucket[week]
+            delta = xp - prev if prev is not None else None
+            rows.append({"week": week, "xp": xp, "volume": vol,
+                         "xp_per_m": xp / (vol / 1000000) if vol > 0 else None,
+                         "delta": delta, "delta_pct": delta / prev * 100 if delta is not None and prev else None})
+            prev = xp
+        out[key] = rows[-last:] if last else rows
+    return out
+
+# ================= 历史回填 =================
+
+BACKFILL_SEM = threading.BoundedSemaphore(BACKFILL_CONCURRENCY)
+
+def _fetch_fill_shard(api_key, start_ms, end_ms):
+    """
+    翻页拉取 [start_ms, end_ms) 内的全部成交；每个请求占用一个全局回填预算
+    """
+    rows = []
+    for results, _ in paginate("/fills", api_key, {"start_at": start_ms, "end_at": end_ms - 1}, sem=BACKFILL_SEM):
+        rows.extend(parse_fill(fill) for fill in results)
+    return rows
+
+def backfill_fills(api_key, cache_key, log_func=print, shards=BACKFILL_SHARDS):
+    """
+    新账户历史回填
+    把 [HISTORY_START_MS, now) 切成等长时间分片并发拉取 (总并发受 BACKFILL_CONCURRENCY 限制)，
+    每个分片完成后去重合并进 FillStore 并落盘断点；中断后只重拉未完成的分片。
+    完成后 last_fill_ts 置为回填终点，剩余部分由常规增量同步补齐。
+    """
+    store = get_fill_store(cache_key)
+    cached = STATS_CACHE[cache_key]
+    with CACHE_LOCK:
+        state = cached.get("backfill") or {
+            "start_at": HISTORY_START_MS, "end_at": int(time.time() * 1000), "shards": shards, "done": []}
+        cached["backfill"] = state
+    n = state["shards"]
+    span = max(1, (state["end_at"] - state["start_at"]) // n)
+    edges = [state["start_at"] + i * span for i in range(n)] + [state["end_at"]]
+    todo = [i for i in range(n) if i not in state["done"]]
+    log_func(f"    ⏬ 历史回填: {len(todo)}/{n} 个分片待拉取")
+
+    t0 = time.time()
+    fetched = [0]
+
+    def run(i):
+        METRICS.bind(cache_key)
+        rows = _fetch_fill_shard(api_key, edges[i], edges[i + 1])
+        with CACHE_LOCK:
+            rows = store.dedupe(rows)
+            store.extend(rows)
+            cached["total_volume"] = store.total_volume()
+            state["done"].append(i)
+            fetched[0] += len(rows)
+            rate = fetched[0] / max(time.time() - t0, 1e-6)
+            log_func(f"    [回填] 分片 {len(state['done'])}/{n} 完成 | 累计 {fetched[0]:,} fills | {rate:,.0f} fills/s")
+        checkpoint_cache()
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=len(todo)) as pool:
+            list(pool.map(run, todo))
+
+    with CACHE_LOCK:
+        cached.pop("backfill", None)
+        cached["last_fill_ts"] = max(cached.get("last_fill_ts", 0), state["end_at"])
+    elapsed = time.time() - t0
+    log_func(f"    ✅ 回填完成: {fetched[0]:,} fills / {elapsed:.1f}s ({fetched[0] / max(elapsed, 1e-6):,.0f} fills/s)")
+    return fetched[0]
+
+# ================= 账户注册表 =================
+
+def _read_registry(path):
+    """
+    读取账户配置文件 (.json / .toml / .yaml)，格式:
+    {"groups": [{"id": 0, "name": "Group 0", "tags": [...],
+                 "accounts": [{"name": "Acc 0.1", "key_env": "PARADEX_API_KEY_0_1", "tags": [...]}, ...]}]}
+    账户用 key 直接写 Key，或用 key_env 指定环境变量名 (推荐，Key 不落在配置文件里)
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f: raw = f.read()
+    if ext == ".toml":
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        data = tomllib.loads(raw.decode("utf-8"))
+    elif ext in (".yaml", ".yml"):
+        import yaml
+        data = yaml.safe_load(raw)
+    else:
+        data = json.loads(raw)
+
+    groups = []
+    for i, g in enumerate(data.get("groups", [])):
+        gid = g.get("id", i)
+        accounts = []
+        for j, a in enumerate(g.get("accounts", [])):
+            key = a.get("key") or (os.getenv(a["key_env"]) if a.get("key_env") else None)
+            accounts.append({"name": a.get("name", f"Acc {gid}.{j + 1}"), "key": key, "tags": list(a.get("tags", []))})
+        groups.append({"id": gid, "name": g.get("name", f"Group {gid} "), "tags": list(g.get("tags", [])),
+                       "accounts": accounts})
+    return groups
+
+def _discover_env_accounts(groups):
+    """
+    把 PARADEX_API_KEY_<组>_<序号> 中尚未配置的账户追加到对应组 (账户名 Acc <组>.<序号>，组不存在时新建)；
+    Key 已被任一账户使用 (例如配置文件中用 key_env 引用了同一个变量) 时跳过，避免同一账户被统计两次
+    """
+    by_id = {g["id"]: g for g in groups}
+    used_keys = {acc["key"] for g in groups for acc in g["accounts"] if acc.get("key")}
+    found = sorted((int(m.group(1)), int(m.group(2)), name) for name in os.environ
+                   for m in [KEY_ENV_PATTERN.match(name)] if m and os.environ[name])
+    for gid, n, env_name in found:
+        group = by_id.get(gid)
+        if group is None:
+            group = by_id[gid] = {"id": gid, "name": f"Group {gid} ", "tags": [], "accounts": []}
+            groups.append(group)
+        name = f"Acc {gid}.{n}"
+        key = os.environ[env_name]
+        if key in used_keys or any(acc["name"] == name for acc in group["accounts"]): continue
+        used_keys.add(key)
+        group["accounts"].append({"name": name, "key": key, "tags": []})
+
+def load_account_registry(path=None, defaults=None):
+    """
+    返回账户组列表：配置文件优先 (path / PARADEX_ACCOUNTS_FILE / DATA_DIR 下的 accounts.*)，否则用 defaults；
+    再按 KEY_DISCOVERY 补充环境变量中的账户。同一组内账户名重复 (cache_key 冲突) 时报错。
+    """
+    candidates = [os.path.join(DATA_DIR, f"accounts{ext}") for ext in (".json", ".toml", ".yaml", ".yml")]
+    path = path or ACCOUNTS_FILE or next((p for p in candidates if os.path.exists(p)), None)
+    groups = _read_registry(path) if path else [dict(g, accounts=[dict(a) for a in g["accounts"]]) for g in defaults or []]
+    if KEY_DISCOVERY: _discover_env_accounts(groups)
+
+    seen = set()
+    for group in groups:
+        for acc in group["accounts"]:
+            cache_key = f"g{group['id']}_{acc['name']}"
+            if cache_key in seen: raise ValueError(f"账户配置重复: 组 {group['id']} 中有两个 {acc['name']}")
+            seen.add(cache_key)
+    return groups
+
+def select_accounts(tags):
+    """
+    只保留带任一指定标签的账户 (组标签对组内全部账户生效)，原地修改 GROUPS
+    """
+    tags = set(tags)
+    selected = []
+    for group in GROUPS:
+        accounts = [a for a in group["accounts"] if tags & (set(group.get("tags", ())) | set(a.get("tags", ())))]
+        if accounts: selected.append(dict(group, accounts=accounts))
+    GROUPS[:] = selected
+
+GROUPS[:] = load_account_registry(defaults=GROUPS)
+
+# ================= 并发调度 =================
+
+def iter_accounts(groups=None):
+    """
+    按 GROUPS 顺序遍历已配置 Key 的账户，返回 (group, acc, cache_key)
+    """
+    for group in (GROUPS if groups is None else groups):
+        for acc in group["accounts"]:
+            if not acc["key"]: continue
+            yield group, acc, f"g{group['id']}_{acc['name']}"
+
+def fan_out_accounts(task, max_workers=None, on_status=None, procs=None):
+    """
+    用有界线程池并发执行 task(group, acc, cache_key, log_func)。
+    每个账户的日志先写入独立缓冲区，返回 {cache_key: (result, logs)}，
+    由调用方按 GROUPS 顺序回放，保证输出与汇总顺序和串行版本一致。
+    on_status(cache_key, **cells) 在每个账户开始与结束时回调 (GUI 状态表实时更新)。
+    procs > 1 (默认 WORKER_PROCS) 且可以安全 fork 时，账户分片到多个子进程执行，见 _fan_out_procs。
+    """
+    jobs = list(iter_accounts())
+    if not jobs: return {}
+    workers = max(1, min(max_workers or MAX_WORKERS, len(jobs)))
+    report = on_status or (lambda cache_key, **cells: None)
+    procs = min(procs or WORKER_PROCS, len(jobs))
+    if procs > 1 and can_fork(): return _fan_out_procs(task, jobs, workers, procs, report)
+    return _run_jobs(task, jobs, workers, report)
+
+def _run_jobs(task, jobs, workers, report):
+    def run(job):
+        group, acc, cache_key = job
+        METRICS.bind(cache_key)
+        report(cache_key, status="⏳ 同步中")
+        t0 = time.perf_counter()
+        logs = []
+        log_func = lambda message, level="INFO": logs.append((message, level))
+        try:
+            result = task(group, acc, cache_key, log_func)
+        except Exception as e:
+            log_func(f"  [!] {acc['name']} err: {str(e)[:30]}", "ERROR")
+            result = None
+        failed = any(level == "ERROR" for _, level in logs)
+        report(cache_key, status="❌ 出错" if failed else "✅ 完成",
+               elapsed=f"{time.perf_counter() - t0:.1f}s", updated=time.strftime("%H:%M:%S"))
+        return cache_key, result, logs
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return {key: (result, logs) for key, result, logs in pool.map(run, jobs)}
+
+# ================= 多进程分片 =================
+
+def can_fork():
+    """
+    多进程分片依赖 fork (Linux / macOS)；有其他线程在运行 (GUI、后台刷新) 时 fork 可能继承被占用的锁，退回线程池
+    """
+    return hasattr(os, "fork") and threading.active_count() == 1
+
+def _fan_out_procs(task, jobs, workers, procs, report):
+    """
+    fork 出 procs 个子进程，第 i 个处理 jobs[i::procs]，进程内仍用线程池。
+    子进程结束时交回 {cache_key: (result, logs)}、本分片账户的缓存状态 (含成交库)、快照与计数，
+    父进程合并进 STATS_CACHE / SNAPSHOTS / LIMITER / METRICS，调用方按原流程汇总与落盘。
+    """
+    import multiprocessing
+    ctx = multiprocessing.get_context("fork")
+    children = []
+    for i in range(procs):
+        shard = jobs[i::procs]
+        recv, send = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_shard_main, args=(send, task, shard, workers, procs), daemon=True)
+        proc.start()
+        send.close()
+        children.append((proc, recv, shard))
+
+    out = {}
+    for proc, recv, shard in children:
+        try:
+            payload = pickle.loads(recv.recv_bytes())
+        except EOFError:
+            payload = {"error": f"exit {proc.exitcode}"}
+        proc.join()
+        if "error" in payload:
+            for _, acc, cache_key in shard:
+                out[cache_key] = (None, [(f"  [!] {acc['name']} err: 分片进程失败 ({payload['error'][:40]})", "ERROR")])
+                report(cache_key, status="❌ 出错")
+            continue
+        with CACHE_LOCK:
+            for cache_key, state in payload["state"].items(): STATS_CACHE.setdefault(cache_key, {}).update(state)
+        SNAPSHOTS.merge(payload["snapshots"])
+        LIMITER.merge(payload["limiter"])
+        METRICS.merge(payload["metrics"])
+        for cache_key, (result, logs) in payload["results"].items():
+            out[cache_key] = (result, logs)
+            report(cache_key, status="❌ 出错" if any(level == "ERROR" for _, level in logs) else "✅ 完成",
+                   updated=time.strftime("%H:%M:%S"))
+    METRICS.inc("shard_procs_total", procs)
+    return out
+
+def _bulk_sizes(data):
+    fills = data.get("fills")
+    return {"fills": (len(fills.ts), fills.compacted_until, fills.rewrite_before) if isinstance(fills, FillStore) else None,
+            "transfers": len(data.get("transfers", []))}
+
+def _changed_state(data, before):
+    """
+    子进程回传的账户状态：成交与转账没有变化时省略 (父进程保留自己的副本)，避免每次报表都序列化整个成交库
+    """
+    after = _bulk_sizes(data)
+    if before is None: return data
+    return {k: v for k, v in data.items() if k not in after or after[k] is None or after[k] != before[k]}
+
+def _shard_main(conn, task, jobs, workers, procs):
+    """
+    分片子进程入口 (fork 之后)：只保留本分片账户的缓存，重建连接池并按 1/procs 分摊限速。
+    SQLite 后端由子进程自己做断点落盘 (独立连接)；JSON 单文件不能多进程同时写，交给父进程合并后统一保存。
+    """
+    global LIMITER, CHECKPOINT_MIN_SEC
+    try:
+        own = {cache_key for _, _, cache_key in jobs}
+        with CACHE_LOCK:
+            for cache_key in [k for k in STATS_CACHE if k not in own]: del STATS_CACHE[cache_key]
+            before = {k: _bulk_sizes(STATS_CACHE[k]) for k in STATS_CACHE}
+        METRICS.reset()
+        LIMITER = RateLimiter({name: (rate / procs, max(1.0, burst / procs)) for name, (rate, burst) in RATE_LIMITS.items()})
+        HTTP.reset_after_fork(LIMITER)
+        if DB_CACHE: DB_CACHE.reopen()
+        else: CHECKPOINT_MIN_SEC = float("inf")
+
+        results = _run_jobs(task, jobs, workers, lambda cache_key, **cells: None)
+        payload = {"results": results, "state": {k: _changed_state(STATS_CACHE[k], before.get(k)) for k in own if k in STATS_CACHE},
+                   "snapshots": SNAPSHOTS.export(own | {acc["key"] for _, acc, _ in jobs}),
+                   "limiter": LIMITER.stats, "metrics": METRICS.raw()}
+    except Exception as e:
+        payload = {"error": repr(e)}
+    try:
+        conn.send_bytes(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+    finally:
+        conn.close()
+        os._exit(0)
+
+# ================= 后台刷新 =================
+
+class RefreshScheduler:
+    """
+    后台刷新：每个账户按各自的间隔错峰轮询 (成交 / 出入金增量同步 + 账户概要 + 持仓)，结果写入快照缓存与本地成交库。
+    最近有成交或有持仓的账户按 active_sec 刷新，其余按 idle_sec；间隔带 ±10% 抖动，避免账户重新对齐成同一时刻。
+    所有刷新共用一个按分钟计的请求预算 (令牌桶)：按上次实际用量预留，刷新完成后多退少补。
+    serve 模式 (SNAPSHOTS.local_only) 下报表不再自行请求，调度器顺带按各自 TTL 刷新标记价格、XP 与地址。
+    """
+    def __init__(self, active_sec=SCHED_ACTIVE_SEC, idle_sec=SCHED_IDLE_SEC, budget_per_min=SCHED_BUDGET_PER_MIN,
+                 log_func=None, on_status=None, verbose=False):
+        self.active_sec = active_sec
+        self.idle_sec = idle_sec
+        self.budget = TokenBucket(budget_per_min / 60.0, max(budget_per_min / 6.0, 8))
+        self.log = log_func or (lambda message, level="INFO": None)
+        self.on_status = on_status or (lambda cache_key, **cells: None)
+        self.verbose = verbose
+        self.due = {}        # cache_key -> 下次刷新时刻 (monotonic)
+        self.cost = {}       # cache_key -> 上次刷新的请求数
+        self.active = {}     # cache_key -> 是否活跃
+        self.fresh = {}      # cache_key -> 最近一次完整刷新成功的时间 (time.time())
+        self.refreshes = 0
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive(): return self
+        ensure_cache()
+        self._stop.clear()
+        SNAPSHOTS.hold_sec = self.idle_sec * 1.5
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait=False):
+        """
+        停止调度 (正在进行的刷新会跑完并落盘)；wait=False 时不阻塞调用线程 (GUI)
+        """
+        self._stop.set()
+        SNAPSHOTS.hold_sec = 0
+        if wait and self._thread: self._thread.join()
+
+    def running(self):
+        return bool(self._thread and self._thread.is_alive() and not self._stop.is_set())
+
+    def _loop(self):
+        jobs = {cache_key: (group, acc) for group, acc, cache_key in iter_accounts()}
+        # 首轮在一个活跃间隔内均匀错开
+        now = time.monotonic()
+        for i, cache_key in enumerate(jobs):
+            self.due.setdefault(cache_key, now + i * self.active_sec / max(len(jobs), 1))
+        with ThreadPoolExecutor(max_workers=SCHED_WORKERS) as pool:
+            while not self._stop.is_set():
+                with self._lock:
+                    busy = len(self._running) >= SCHED_WORKERS
+                    waiting = [(due, key) for key, due in self.due.items() if key not in self._running]
+                if busy or not waiting:
+                    self._stop.wait(0.1)
+                    continue
+                due, cache_key = min(waiting)
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._stop.wait(min(delay, 1.0))
+                    continue
+                estimate = self.cost.get(cache_key, 4)
+                wait = self.budget.reserve(estimate)
+                if wait > 0:
+                    METRICS.inc("scheduler_budget_waits_total")
+                    if self._stop.wait(wait): break
+                with self._lock:
+                    self._running.add(cache_key)
+                pool.submit(self._refresh, cache_key, *jobs[cache_key], estimate)
+        save_cache()
+
+    def _refresh(self, cache_key, group, acc, estimate):
+        METRICS.bind(cache_key)
+        api_key = acc["key"]
+        errors = []
+        log = lambda message, level="INFO": errors.append(message.strip()) if "[!]" in message or level == "ERROR" else None
+        before = LIMITER.thread_requests()
+        t0 = time.perf_counter()
+        self.on_status(cache_key, status="🔄 刷新中")
+        summary = positions = None
+        try:
+            with METRICS.timer("scheduler_refresh_seconds", account=cache_key):
+                # 实时推送在线时成交与持仓由推送维护，不再轮询
+                if not SNAPSHOTS.pinned(cache_key, "fills"):
+                    SNAPSHOTS.refresh(cache_key, "fills", lambda: _sync_fills(api_key, cache_key, log))
+                SNAPSHOTS.refresh(cache_key, "transfers", lambda: _sync_transfers(api_key, cache_key, log))
+                summary = SNAPSHOTS.refresh(api_key, "summary", lambda: _load_account_summary(api_key))
+                if SNAPSHOTS.pinned(api_key, "positions"): positions = fetch_positions(api_key)
+                else: positions = SNAPSHOTS.refresh(api_key, "positions", lambda: _load_positions(api_key))
+                if SNAPSHOTS.local_only:
+                    with SNAPSHOTS.loading():
+                        fetch_mark_prices()
+                        fetch_xp_combined(api_key, cache_key)
+                        fetch_address_unified(api_key, cache_key)
+            checkpoint_cache()
+        except Exception as e:
+            errors.append(str(e)[:30])
+        finally:
+            used = LIMITER.thread_requests() - before
+            self.budget.reserve(used - estimate)
+            self.cost[cache_key] = max(used, 1)
+
+        ok = not errors and summary is not None and positions is not None
+        cached = STATS_CACHE.get(cache_key, {})
+        recent = cached.get("last_fill_ts", 0) >= time.time() * 1000 - SCHED_ACTIVE_HOURS * HOUR_MS
+        open_positions = [p for p in positions or [] if float(p.get("size", 0)) != 0]
+        active = self.active[cache_key] = bool(recent or open_positions)
+        interval = self.active_sec if active else self.idle_sec
+        if not ok: interval = min(interval, self.active_sec * 2)  # 失败的账户尽快重试，但不挤占预算
+        with self._lock:
+            self.due[cache_key] = time.monotonic() + interval * random.uniform(0.9, 1.1)
+            self._running.discard(cache_key)
+        self.refreshes += 1
+        METRICS.inc("scheduler_refreshes_total", result="ok" if ok else "error", activity="active" if active else "idle")
+        if ok: self.fresh[cache_key] = time.time()
+
+        cells = {"status": ("⚡ 活跃" if active else "💤 空闲") if ok else "❌ 出错",
+                 "elapsed": f"{time.perf_counter() - t0:.1f}s", "updated": time.strftime("%H:%M:%S")}
+        if summary is not None:
+            record_equity(cache_key, api_key, summary, positions)
+            val = float(summary.get("account_value", 0))
+            cells.update(balance=val, pnl=val - cached.get("net_deposits", 0.0), volume=cached.get("total_volume", 0.0))
+        if positions is not None:
+            cells["upnl"] = sum(float(p.get("unrealized_pnl", 0)) for p in open_positions)
+        self.on_status(cache_key, **cells)
+        if errors:
+            self.log(f"  [!] 后台刷新 {acc['name']}: {errors[0]}", "ERROR")
+        elif self.verbose:
+            self.log(f"  [{time.strftime('%H:%M:%S')}] {acc['name']}: {'活跃' if active else '空闲'} | {used} req"
+                     f" | 下次 {interval:.0f}s 后", "INFO")
+
+# ================= 实时推送 =================
+
+def ws_connect_options():
+    """
+    WebSocket 连接沿用 REST 的直连 / 代理路由探测结果
+    """
+    parts = urlsplit(WS_URL)
+    origin = f"{'https' if parts.scheme == 'wss' else 'http'}://{parts.netloc}"
+    if not PROXY_CONFIG or HTTP.route_for(origin) != "proxy": return {}
+    proxy = urlsplit(PROXY_CONFIG["https"])
+    return {"http_proxy_host": proxy.hostname, "http_proxy_port": proxy.port, "proxy_type": "http"}
+
+class AccountStream:
+    """
+    单个账户的私有推送连接：订阅 fills.ALL 与 positions，写入与 REST 路径相同的成交库和持仓快照。
+    每次连接先订阅、再用 REST 增量补齐，两者重叠的部分由成交 id 去重；
+    seq_no 不连续 (丢消息)、心跳超时或断线重连时视为缺口，重新补齐。
+    last_fill_ts 只由 REST 同步推进，推送的成交在下一次 REST 同步时得到确认。
+    """
+    CHANNELS = ("fills.ALL", "positions")
+
+    def __init__(self, group, acc, cache_key, log_func, on_status):
+        self.acc = acc
+        self.api_key = acc["key"]
+        self.cache_key = cache_key
+        self.log = log_func
+        self.on_status = on_status
+        self.positions = {}   # market -> 持仓
+        self.seq = {}         # channel -> 最近的 seq_no
+        self.live = False
+        self.messages = 0
+        self.gaps = 0
+        self._ws = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive(): return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        ws = self._ws
+        if ws:
+            try: ws.close()
+            except Exception: pass
+
+    def join(self, timeout=None):
+        if self._thread: self._thread.join(timeout)
+
+    def _run(self):
+        import websocket
+        METRICS.bind(self.cache_key)
+        delay = 1
+        while not self._stop.is_set():
+            try:
+                self._session(websocket)
+                delay = 1
+            except Exception as e:
+                if self._stop.is_set(): break
+                METRICS.inc("ws_disconnects_total", account=self.cache_key)
+                self.log(f"  [!] 推送 {self.acc['name']} 断开: {str(e)[:40]}，{delay}s 后重连", "WARNING")
+            finally:
+                self._set_live(False)
+            if self._stop.wait(delay): break
+            delay = min(delay * 2, 30)
+
+    def _call(self, ws, method, params, req_id):
+        """
+        发送 JSON-RPC 请求并等待对应的响应；期间到达的推送照常处理
+        """
+        ws.send(json.dumps({"jsonrpc": "2.0", "method": method, "params": params, "id": req_id}))
+        while True:
+            msg = json.loads(ws.recv())
+            if msg.get("id") != req_id:
+                self._on_message(msg)
+                continue
+            if "error" in msg: raise ConnectionError(f"{method}: {msg['error']}")
+            return msg.get("result")
+
+    def _session(self, websocket):
+        ws = self._ws = websocket.create_connection(WS_URL, timeout=WS_IDLE_SEC, **ws_connect_options())
+        try:
+            self._call(ws, "auth", {"bearer": self.api_key}, 0)
+            for i, channel in enumerate(self.CHANNELS, 1): self._call(ws, "subscribe", {"channel": channel}, i)
+            self.seq.clear()
+            self.catch_up("connect")
+            self._set_live(True)
+            waiting_pong = False
+            last_resync = time.monotonic()
+            while not self._stop.is_set():
+                try:
+                    opcode, data = ws.recv_data(control_frame=True)
+                except websocket.WebSocketTimeoutException:
+                    if waiting_pong: raise ConnectionError("心跳超时")
+                    waiting_pong = True
+                    ws.ping()
+                    continue
+                waiting_pong = False
+                if opcode == websocket.ABNF.OPCODE_CLOSE: raise ConnectionError("服务端关闭连接")
+                if opcode == websocket.ABNF.OPCODE_TEXT: self._on_message(json.loads(data))
+                if time.monotonic() - last_resync > WS_RESYNC_SEC:
+                    self.catch_up("resync")
+                    last_resync = time.monotonic()
+        finally:
+            self._ws = None
+            ws.close()
+
+    def _on_message(self, msg):
+        if msg.get("method") != "subscription": return
+        params = msg.get("params") or {}
+        channel, data = params.get("channel", ""), params.get("data") or {}
+        self.messages += 1
+        METRICS.inc("ws_messages_total", channel=channel.split(".")[0])
+        gap = False
+        if data.get("seq_no") is not None:
+            seq, last = int(data["seq_no"]), self.seq.get(channel)
+            self.seq[channel] = seq
+            gap = last is not None and seq > last + 1
+        if channel.startswith("fills."): self._apply_fill(data)
+        elif channel == "positions": self._apply_position(data)
+        if gap:
+            self.gaps += 1
+            METRICS.inc("ws_gaps_total", channel=channel.split(".")[0])
+            self.log(f"  [!] 推送 {self.acc['name']} {channel} 序号不连续，REST 补齐", "WARNING")
+            self.catch_up("gap")
+
+    def _apply_fill(self, data):
+        store = get_fill_store(self.cache_key)
+        with CACHE_LOCK:
+            rows = store.dedupe([parse_fill(data)])
+            store.extend(rows)
+            cached = STATS_CACHE[self.cache_key]
+            cached["total_volume"] = store.total_volume()
+        if rows:
+            SNAPSHOTS.put(self.cache_key, "fills", cached["total_volume"])
+            self._report()
+
+    def _apply_position(self, data):
+        if not data.get("market"): return
+        self.positions[data["market"]] = data
+        SNAPSHOTS.put(self.api_key, "positions", list(self.positions.values()))
+        self._report()
+
+    def catch_up(self, reason):
+        """
+        REST 增量补齐成交并重新加载持仓 (连接建立、缺口、定期校对)
+        """
+        METRICS.inc("ws_catchups_total", reason=reason)
+        log = lambda message, level="INFO": self.log(message, "ERROR") if "[!]" in message else None
+        SNAPSHOTS.refresh(self.cache_key, "fills", lambda: _sync_fills(self.api_key, self.cache_key, log))
+        try:
+            positions = SNAPSHOTS.refresh(self.api_key, "positions", lambda: _load_positions(self.api_key))
+        except requests.RequestException as e:
+            self.log(f"  [!] 推送 {self.acc['name']} 持仓补齐失败: {str(e)[:30]}", "ERROR")
+            positions = None
+        if positions is not None: self.positions = {p.get("market"): p for p in positions}
+        checkpoint_cache()
+        self._report()
+
+    def _set_live(self, live):
+        if live == self.live: return
+        self.live = live
+        SNAPSHOTS.pin(self.cache_key, "fills", live)
+        SNAPSHOTS.pin(self.api_key, "positions", live)
+        self.on_status(self.cache_key, status="📡 推送中" if live else "⚠️ 推送断开")
+
+    def _report(self):
+        upnl = sum(float(p.get("unrealized_pnl", 0)) for p in self.positions.values() if float(p.get("size", 0)) != 0)
+        week_start_ms = int(volume_week_start().timestamp() * 1000)
+        self.on_status(self.cache_key, upnl=upnl, week_vol=fill_window(self.cache_key, week_start_ms)[0],
+                       volume=STATS_CACHE.get(self.cache_key, {}).get("total_volume", 0.0),
+                       updated=time.strftime("%H:%M:%S"))
+
+class StreamManager:
+    """
+    为每个已配置账户维护一条推送连接
+    """
+    def __init__(self, log_func=None, on_status=None):
+        self.log = log_func or (lambda message, level="INFO": None)
+        self.on_status = on_status or (lambda cache_key, **cells: None)
+        self.streams = {}
+
+    def start(self):
+        import websocket  # noqa: F401  缺少依赖时在这里报错，而不是在每个连接线程里
+        ensure_cache()
+        for group, acc, cache_key in iter_accounts():
+            stream = self.streams.get(cache_key)
+            if stream is None: stream = self.streams[cache_key] = AccountStream(group, acc, cache_key, self.log, self.on_status)
+            stream.start()
+        return self
+
+    def stop(self, wait=False):
+        for stream in self.streams.values(): stream.stop()
+        if wait:
+            for stream in self.streams.values(): stream.join(5)
+
+    def stats(self):
+        return {key: {"live": s.live, "messages": s.messages, "gaps": s.gaps} for key, s in self.streams.items()}
+
+# ================= 报表导出 =================
+
+EXCEL_MAX_ROWS = 1048576  # 单个工作表的行数上限 (含表头)
+EXPORT_CHUNK_ROWS = 10000  # 逐行导出时每次在 CACHE_LOCK 内复制的行数
+
+def week_start(ts_ms):
+    """
+    ts 所在交易周的起点 (本地时间周五 08:00，与周报的统计区间一致)，返回 datetime
+    """
+    t = datetime.fromtimestamp(ts_ms / 1000)
+    start = (t - timedelta(days=(t.weekday() - 4) % 7)).replace(hour=8, minute=0, second=0, microsecond=0)
+    return start - timedelta(days=7) if t < start else start
+
+def volume_week_start():
+    """
+    “本周表现”的统计起点：最近一个 UTC 周五 00:00
+    """
+    now_utc = datetime.now(timezone.utc)
+    last_friday = now_utc - timedelta(days=(now_utc.weekday() - 4) % 7)
+    return last_friday.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def iter_fill_rows(accounts=None, start_ms=None, end_ms=None):
+    """
+    按账户依次逐行产出 (cache_key, group_name, ts, vol, pnl, id, market, side, liquidity, fee, count)，不在内存中拼整张明细表
+    已压缩区间产出的是聚合行 (id 为空，count 为合并的笔数)。
+    每次在 CACHE_LOCK 内复制 EXPORT_CHUNK_ROWS 行，按 ts 续读 (块在毫秒边界处切分)，导出期间同步线程照常写入
+    """
+    all_accounts, group_of = _group_key("group")
+    for cache_key in (all_accounts if accounts is None else accounts):
+        store = _fills_of(cache_key)
+        if not store: continue
+        group = group_of(cache_key).strip()
+        cursor = start_ms
+        while True:
+            with CACHE_LOCK:
+                lo, hi = store.bounds(cursor, end_ms)
+                if lo == hi: break
+                cut = lo + EXPORT_CHUNK_ROWS
+                if cut < hi:
+                    hi = bisect_left(store.ts, store.ts[cut], lo, hi)
+                    if hi == lo: hi = bisect_right(store.ts, store.ts[lo], lo)
+                chunk = list(store.rows(store.ts[lo], store.ts[hi - 1] + 1))
+                cursor = store.ts[hi - 1] + 1
+            for row in chunk:
+                yield (cache_key, group, *row)
+
+def export_excel_report(filepath, summary_rows, start_ms=None, end_ms=None, detail=True):
+    """
+    流式写出 Excel：openpyxl write-only 模式下行直接写入临时文件，内存占用与明细行数无关
+    - Summary: 账户汇总行 (dict 列表，列名取第一行的 key)
+    - Groups:  各组在 [start_ms, end_ms) 内的成交额 / 盈亏 / 笔数 / 效率
+    - Fills:   逐笔明细，超过单表行数上限时续写到 Fills 2、Fills 3 ...
+    返回写出的明细行数
+    """
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+
+    if summary_rows:
+        ws = wb.create_sheet("Summary")
+        ws.append(list(summary_rows[0]))
+        for row in summary_rows: ws.append(list(row.values()))
+
+    ws = wb.create_sheet("Groups")
+    ws.append(["Group", "Volume ($)", "PnL ($)", "Trades Count", "Efficiency ($/M)"])
+    for name, row in query_fills(start_ms=start_ms, end_ms=end_ms, group_by="group").items():
+        eff = row["pnl"] / (row["vol"] / 1000000) if row["vol"] > 0 else 0
+        ws.append([name.strip(), row["vol"], row["pnl"], row["count"], eff])
+
+    count = 0
+    if detail:
+        header = ["Time (UTC)", "Account", "Group", "Fill ID", "Market", "Side", "Liquidity", "Volume ($)", "Fee ($)", "PnL ($)",
+                  "Count"]
+        sheet_rows, sheet_no = EXCEL_MAX_ROWS, 0
+        for key, group, ts, vol, pnl, fid, market, side, liq, fee, n in iter_fill_rows(None, start_ms, end_ms):
+            if sheet_rows >= EXCEL_MAX_ROWS:
+                sheet_no += 1
+                ws = wb.create_sheet("Fills" if sheet_no == 1 else f"Fills {sheet_no}")
+                ws.append(header)
+                sheet_rows = 1
+            ws.append([datetime.fromtimestamp(ts / 1000, timezone.utc).replace(tzinfo=None), key, group, fid,
+                       market, side, liq, vol, fee, pnl, n])
+            sheet_rows += 1
+            count += 1
+
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+    wb.save(filepath)
+    return count
+
+def export_parquet(out_dir, accounts=None, start_ms=None, end_ms=None):
+    """
+    按 week=<交易周起点 (周五) 日期>/account=<cache_key> 分区写出成交明细 (Hive 风格目录，pandas.read_parquet / pyarrow.dataset 可直接读取)。
+    每个分区一个文件，重复导出会覆盖同一分区；内存占用以单个分区为上限。返回 (文件数, 行数)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from urllib.parse import quote
+
+    all_accounts, group_of = _group_key("group")
+    files = rows = 0
+    for cache_key in (all_accounts if accounts is None else accounts):
+        store = _fills_of(cache_key)
+        if not store: continue
+        cursor = start_ms
+        while True:
+            # 每个分区在 CACHE_LOCK 内复制一份列切片，按周起点续读，导出期间同步线程照常写入
+            with CACHE_LOCK:
+                lo, hi = store.bounds(cursor, end_ms)
+                if lo == hi: break
+                week = week_start(store.ts[lo])
+                cursor = int((week + timedelta(days=7)).timestamp() * 1000)
+                end = bisect_left(store.ts, cursor, lo, hi)
+                ts, ids, mkt, side, liq, vol, fee, pnl, cnt = (col[lo:end] for col in (
+                    store.ts, store.ids, store.mkt, store.side, store.liq, store.vol, store.fee, store.pnl, store.cnt))
+                markets = list(store.markets)
+            table = pa.table({
+                "ts": pa.array(ts.tolist(), pa.int64()).cast(pa.timestamp("ms", tz="UTC")),
+                "fill_id": pa.array(ids, pa.string()),
+                "market": pa.DictionaryArray.from_arrays(pa.array(mkt.tolist(), pa.int32()), markets),
+                "side": pa.DictionaryArray.from_arrays(pa.array(side.tolist(), pa.int32()), list(SIDES)),
+                "liquidity": pa.DictionaryArray.from_arrays(pa.array(liq.tolist(), pa.int32()), list(LIQUIDITY)),
+                "volume": pa.array(vol.tolist(), pa.float64()),
+                "fee": pa.array(fee.tolist(), pa.float64()),
+                "pnl": pa.array(pnl.tolist(), pa.float64()),
+                "count": pa.array(cnt.tolist(), pa.uint32()),
+                "group": pa.array([group_of(cache_key).strip()] * (end - lo), pa.string()),
+            })
+            week_label = week.strftime("%Y-%m-%d")
+            part_dir = os.path.join(out_dir, f"week={week_label}", f"account={quote(cache_key, safe='')}")
+            os.makedirs(part_dir, exist_ok=True)
+            pq.write_table(table, os.path.join(part_dir, "part-0.parquet"))
+            files += 1
+            rows += end - lo
+    return files, rows
 
-        self.btn_pos = ttk.Button(btn_frame, text="📈 持仓监控 (Positions)", command=self.run_positions_thread)
-        self.btn_pos.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+# ================= 报表逻辑 =================
 
-        self.btn_clear = ttk.Button(btn_frame, text="🧹 清屏", command=self.clear_log)
-        self.btn_clear.pack(side=tk.RIGHT, padx=5)
-        
-        self.log_area = scrolledtext.ScrolledText(root, state='disabled', font=("Consolas", 10))
-        self.log_area.pack(expand=True, fill=tk.BOTH, padx=10, pady=10)
-        
-        self.log_area.tag_config("INFO", foreground="black")
-        self.log_area.tag_config("SUCCESS", foreground="green")
-        self.log_area.tag_config("WARNING", foreground="#FF8C00")
-        self.log_area.tag_config("ERROR", foreground="red")
-        self.log_area.tag_config("HEADER", foreground="blue", font=("Consolas", 10, "bold"))
-        self.log_area.tag_config("SUBHEADER", foreground="purple", font=("Consolas", 10, "bold"))
-        
-        self.log_safe("系统就绪。点击'最新周报'会自动导出Excel。", "INFO")
+class ReportLogic:
+    """
+    四个报表的核心逻辑，GUI 与命令行模式共用。
+    子类按需覆盖 log_safe(message, level) (默认直接打印)；每个 logic_* 方法返回可序列化为 JSON 的结果字典。
+    """
+    export_excel = True
+    push_tg = True
+    save_state = True     # 报表结束后落盘本地缓存；serve 模式由后台刷新负责落盘
+    show_timings = SHOW_TIMINGS
 
     def log_safe(self, message, level="INFO"):
-        self.root.after(0, lambda: self._log_impl(message, level))
+        print(message, flush=True)
 
-    def _log_impl(self, message, level):
-        try:
-            self.log_area.configure(state='normal')
-            self.log_area.insert(tk.END, message + "\n", level)
-            self.log_area.see(tk.END)
-            self.log_area.configure(state='disabled')
-        except: pass
+    def toggle_buttons(self, state):
+        pass
 
-    def clear_log(self):
-        self.log_area.configure(state='normal')
-        self.log_area.delete(1.0, tk.END)
-        self.log_area.configure(state='disabled')
+    def account_status(self, cache_key, **cells):
+        """
+        账户状态表的单元格更新 (status / balance / pnl / volume / week_vol / upnl / elapsed / updated)，仅 GUI 实现
+        """
+        pass
 
-    def toggle_buttons(self, state):
-        self.root.after(0, lambda: self._toggle_impl(state))
+    def replay_logs(self, logs):
+        for message, level in logs:
+            self.log_safe(message, level)
 
-    def _toggle_impl(self, state):
-        s = tk.NORMAL if state else tk.DISABLED
-        self.btn_total.config(state=s)
-        self.btn_weekly.config(state=s)
-        self.btn_vol.config(state=s)
-        self.btn_pos.config(state=s)
+    def incomplete_note(self, failed, reason="获取失败，未计入"):
+        """
+        有账户获取失败时提示合计不完整 (失败账户已在明细中以 [!] 标记且不计入合计)，返回提示文本 (无失败时为空串)
+        """
+        if not failed: return ""
+        note = f"⚠️ 合计不完整: {len(failed)} 个账户{reason} ({', '.join(failed)})"
+        self.log_safe(note, "WARNING")
+        return note
 
-    # --- Threads ---
-    def run_total_thread(self):
-        self.toggle_buttons(False)
-        self.clear_log()
-        threading.Thread(target=self.logic_total_stats, daemon=True).start()
+    def sync_all_fills(self):
+        """
+        并发增量同步全部账户的成交；同步失败的账户回放日志并标记出错，返回 {cache_key: 账户名}
+        """
+        results = fan_out_accounts(lambda group, acc, cache_key, log: fetch_fills_incremental(acc["key"], cache_key, log),
+                                   on_status=self.account_status)
+        failed = {}
+        for _, acc, cache_key in iter_accounts():
+            volume, logs = results[cache_key]
+            if volume is not None: continue
+            self.replay_logs(logs)
+            self.account_status(cache_key, status="❌ 出错")
+            failed[cache_key] = acc["name"]
+        return failed
 
-    def run_weekly_thread(self):
-        self.toggle_buttons(False)
-        self.clear_log()
-        threading.Thread(target=self.logic_weekly_stats, daemon=True).start()
+    @staticmethod
+    def age_note(as_of):
+        """
+        数据来自后台刷新 / 快照缓存 (超过 5 秒) 时在日志行尾标注时效
+        """
+        return f" | 数据 {format_age(as_of)}" if as_of and time.time() - as_of >= 5 else ""
 
-    def run_volume_thread(self):
-        self.toggle_buttons(False)
-        self.clear_log()
-        threading.Thread(target=self.logic_volume_stats, daemon=True).start()
+    @staticmethod
+    def as_of_cell(as_of):
+        return {"updated": time.strftime("%H:%M:%S", time.localtime(as_of))} if as_of else {}
 
-    def run_positions_thread(self):
-        self.toggle_buttons(False)
-        self.clear_log()
-        threading.Thread(target=self.logic_positions, daemon=True).start()
+    def begin_action(self):
+        """
+        记录操作起点：API 计数快照与耗时分解起点
+        """
+        return LIMITER.totals(), METRICS.begin_run()
+
+    def tg_result(self, delivery):
+        """
+        Telegram 投递结果回调 (发送线程中执行)
+        """
+        if delivery.status == "sent":
+            self.log_safe("✅ TG 推送成功" + (f" ({delivery.parts} 条)" if delivery.parts > 1 else ""), "SUCCESS")
+        elif delivery.status == "duplicate":
+            self.log_safe("⏭ TG 内容与近期推送相同，已跳过", "INFO")
+        elif delivery.status == "partial":
+            self.log_safe(f"❌ TG 推送不完整: 已发送 {delivery.sent_parts}/{delivery.parts} 条，其余失败: {delivery.error}", "ERROR")
+        elif delivery.status == "failed":
+            self.log_safe(f"❌ TG 推送失败: {delivery.error}", "ERROR")
+
+    def end_action(self, action, started):
+        """
+        操作收尾：输出 API 统计与 (可选) 耗时分解，写出指标文件并恢复按钮
+        """
+        http_before, t0 = started
+        wall = time.perf_counter() - t0
+        METRICS.observe("action_seconds", wall, action=action)
+        self.log_safe(f"🌐 API: {LIMITER.summary(http_before)}", "INFO")
+        if self.show_timings:
+            for line in METRICS.run_breakdown(wall): self.log_safe(line, "INFO")
+        if METRICS_FILE: METRICS.write(METRICS_FILE)
+        self.toggle_buttons(True)
+
+    # --- Logic: Watch (后台刷新，命令行前台运行) ---
+    def logic_watch(self, duration=None, stream=False):
+        self.log_safe(f"🔄 后台刷新: 活跃 {SCHED_ACTIVE_SEC:.0f}s / 空闲 {SCHED_IDLE_SEC:.0f}s，"
+                      f"预算 {SCHED_BUDGET_PER_MIN:.0f} 请求/分钟 (Ctrl+C 退出)", "HEADER")
+        started = self.begin_action()
+        streams = None
+        if stream:
+            try:
+                streams = StreamManager(log_func=self.log_safe, on_status=self.account_status).start()
+                self.log_safe(f"📡 实时推送: {WS_URL}", "INFO")
+            except ImportError as e:
+                self.log_safe(f"❌ 无法开启实时推送，缺少依赖: {e} (pip install websocket-client)", "ERROR")
+        scheduler = RefreshScheduler(log_func=self.log_safe, on_status=self.account_status, verbose=True).start()
+        try:
+            deadline = time.monotonic() + duration if duration else None
+            while scheduler.running() and (deadline is None or time.monotonic() < deadline):
+                time.sleep(0.5 if deadline is None else max(0.0, min(0.5, deadline - time.monotonic())))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if streams: streams.stop(wait=True)
+            scheduler.stop(wait=True)
+        stream_stats = streams.stats() if streams else {}
+        result = {"action": "watch", "refreshes": scheduler.refreshes, "accounts": [
+            {"account": cache_key, "name": acc["name"], "active": scheduler.active.get(cache_key),
+             "as_of": scheduler.fresh.get(cache_key), "stream": stream_stats.get(cache_key)}
+            for _, acc, cache_key in iter_accounts()]}
+        self.log_safe(f"⏹ 后台刷新已停止，共刷新 {scheduler.refreshes} 次", "SUCCESS")
+        self.end_action("watch", started)
+        return result
+
+    # --- Logic: Serve (本机 JSON 接口 + 后台刷新，命令行前台运行) ---
+    def logic_serve(self, host=None, port=None, max_age=None, duration=None, stream=False):
+        from http.server import ThreadingHTTPServer
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 128  # 默认 5，大量看板同时轮询时连接会排队等 SYN 重传
+
+        server = ReportServer(SERVE_MAX_AGE if max_age is None else max_age)
+        httpd = Server((host or SERVE_HOST, SERVE_PORT if port is None else port), make_serve_handler(server))
+        # 视图只读调度器刷新的快照，请求处理线程不访问上游
+        SNAPSHOTS.local_only = True
+        threading.Thread(target=httpd.serve_forever, name="serve", daemon=True).start()
+        host, port = httpd.server_address[:2]
+        self.log_safe(f"🌐 JSON 接口: http://{host}:{port}/  ({', '.join(ReportServer.PATHS)}，"
+                      f"结果缓存 {server.max_age:g}s)", "HEADER")
+        try:
+            result = self.logic_watch(duration=duration, stream=stream)
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            SNAPSHOTS.local_only = False
+        result.update(action="serve", served={f"{view} {status}": n for (view, status), n in sorted(server.hits.items())})
+        return result
 
     # --- Logic: Total ---
     def logic_total_stats(self):
         self.log_safe("🚀 开始获取实时总资产统计...", "HEADER")
+        started = self.begin_action()
+        ensure_cache()
+        result = {"action": "total", "groups": []}
         grand_total_val, grand_total_pnl, grand_total_vol = 0, 0, 0
+        failed = []
         tg_msg = "🚀 <b>[Paradex 实时总汇总]</b>\n\n"
         
+        def task(group, acc, cache_key, log):
+            log(f"  - 更新 {acc['name']}...", "INFO")
+            net = fetch_transfers_incremental(acc["key"], cache_key, log)
+            vol = fetch_fills_incremental(acc["key"], cache_key, log)
+            # 净充值或成交额同步失败时本地数据不完整，按获取失败处理
+            if net is None or vol is None: return None
+            return fetch_account_summary(acc["key"])
+
+        self.log_safe(f"⚡ 并发拉取账户数据 (workers={MAX_WORKERS})...", "INFO")
+        results = fan_out_accounts(task, on_status=self.account_status)
+
         for group in GROUPS:
             self.log_safe(f"\nProcessing {group['name']}...", "INFO")
             g_val, g_net, g_vol = 0, 0, 0
+            g_accounts = []
             
-            for acc in group["accounts"]:
-                api_key = acc["key"]
-                if not api_key: continue
-                cache_key = f"g{group['id']}_{acc['name']}"
-                
-                self.log_safe(f"  - 更新 {acc['name']}...", "INFO")
-                fetch_transfers_incremental(api_key, cache_key, self.log_safe)
-                fetch_fills_incremental(api_key, cache_key, self.log_safe)
-                summ = fetch_account_summary(api_key)
+            for _, acc, cache_key in iter_accounts([group]):
+                summ, logs = results[cache_key]
+                self.replay_logs(logs)
+                if summ is None:
+                    # 余额或净充值未知：不能按 0 计入，否则盈亏会变成 -净充值 (或整个余额)
+                    failed.append(acc["name"])
+                    self.log_safe(f"    [!] {acc['name']} 数据获取失败，不计入合计", "ERROR")
+                    self.account_status(cache_key, status="❌ 出错")
+                    g_accounts.append({"account": cache_key, "name": acc["name"], "balance": None, "error": True})
+                    continue
                 
-                val = float(summ.get("account_value", 0)) if summ else 0.0
+                val = float(summ.get("account_value", 0))
                 net = STATS_CACHE.get(cache_key, {}).get("net_deposits", 0.0)
                 vol = STATS_CACHE.get(cache_key, {}).get("total_volume", 0.0)
                 
@@ -446,33 +3237,46 @@ class ParadexStatsApp:
                 g_vol += vol
                 
                 pnl = val - net
-                self.log_safe(f"    余额: ${val:,.0f} | 净充: ${net:,.0f} | 盈亏: ${pnl:,.0f}", "INFO")
+                record_equity(cache_key, acc["key"], summ)
+                as_of = SNAPSHOTS.as_of((cache_key, "fills"), (cache_key, "transfers"), (acc["key"], "summary"))
+                self.log_safe(f"    余额: ${val:,.0f} | 净充: ${net:,.0f} | 盈亏: ${pnl:,.0f}{self.age_note(as_of)}", "INFO")
+                self.account_status(cache_key, balance=val, pnl=pnl, volume=vol, **self.as_of_cell(as_of))
+                g_accounts.append({"account": cache_key, "name": acc["name"], "balance": val,
+                                   "net_deposits": net, "pnl": pnl, "volume": vol, "as_of": as_of})
 
             g_pnl = g_val - g_net
             eff = (g_pnl / (g_vol / 1000000)) if g_vol > 0 else 0
             self.log_safe(f"> {group['name']} 汇总: 余额${g_val:,.0f} | 盈亏${g_pnl:,.0f}", "SUCCESS")
             
             tg_msg += f"📦 <b>{group['name']}</b>\n├ 余额: ${g_val:,.0f}\n├ 盈亏: ${g_pnl:,.2f}\n└ 效率: ${eff:,.2f}/M\n\n"
+            result["groups"].append({"name": group["name"], "balance": g_val, "pnl": g_pnl, "volume": g_vol,
+                                     "efficiency": eff, "accounts": g_accounts})
             grand_total_val += g_val
             grand_total_pnl += g_pnl
             grand_total_vol += g_vol
 
-        save_json(CACHE_FILE, STATS_CACHE)
+        if self.save_state: save_cache()
         
         total_eff = (grand_total_pnl / (grand_total_vol / 1000000)) if grand_total_vol > 0 else 0
         summary_str = f"💰 总余额: ${grand_total_val:,.2f}\n💹 总盈亏: ${grand_total_pnl:,.2f}\n📊 总成交: ${grand_total_vol:,.0f}\n⚡ 总效率: ${total_eff:.2f}/M"
         self.log_safe("\n" + "="*40 + "\n" + summary_str, "HEADER")
+        note = self.incomplete_note(failed)
+        result["total"] = {"balance": grand_total_val, "pnl": grand_total_pnl,
+                           "volume": grand_total_vol, "efficiency": total_eff, "failed": failed}
         
-        tg_msg += "━━━━━━━━━━━━━━\n" + summary_str.replace("\n", "\n")
-        if TG_BOT_TOKEN:
-            send_tg_msg(tg_msg)
-            self.log_safe("✅ TG 推送成功", "SUCCESS")
+        tg_msg += "━━━━━━━━━━━━━━\n" + summary_str.replace("\n", "\n") + (f"\n{note}" if note else "")
+        if TG_BOT_TOKEN and self.push_tg:
+            send_tg_msg(tg_msg, key="total", on_done=self.tg_result)
+            self.log_safe("📨 TG 推送已加入发送队列", "INFO")
         
-        self.toggle_buttons(True)
+        self.end_action("total", started)
+        return result
 
     # --- Logic: Weekly + XP History + Excel ---
     def logic_weekly_stats(self):
         self.log_safe("📅 开始计算上周统计 & 准备导出 Excel...", "HEADER")
+        started = self.begin_action()
+        ensure_cache()
         self.log_safe("[1/2] 更新数据与XP...", "INFO")
         account_data = {}
         total_xp_pool = 0
@@ -480,46 +3284,53 @@ class ParadexStatsApp:
         current_week_num = 0
         
         excel_rows = []
+        failed = []
+        result = {"action": "weekly", "accounts": []}
 
-        for group in GROUPS:
-            for acc in group["accounts"]:
-                api_key = acc["key"]
-                if not api_key: continue
-                cache_key = f"g{group['id']}_{acc['name']}"
-                
-                self.log_safe(f"  Checking {acc['name']}...", "INFO")
-                # 更新交易数据
-                fetch_fills_incremental(api_key, cache_key, lambda x: None)
-                summ = fetch_account_summary(api_key)
-                balance = float(summ.get("account_value", 0)) if summ else 0.0
-                
-                # 获取 XP & Address (统一调用一次)
-                xp_total, xp_week, week_num, xp_earned, xp_avail = fetch_xp_combined(api_key)
-                full_address = fetch_address_unified(api_key) # [修复] 只获取一次原始地址
+        def task(group, acc, cache_key, log):
+            api_key = acc["key"]
+            log(f"  Checking {acc['name']}...", "INFO")
+            # 更新交易数据；成交同步失败时本周成交额不完整，余额记为未知
+            if fetch_fills_incremental(api_key, cache_key, log) is None: return None
+            summ = fetch_account_summary(api_key)
+            # 获取 XP & Address (统一调用一次)
+            xp = fetch_xp_combined(api_key, cache_key)
+            full_address = fetch_address_unified(api_key, cache_key) # [修复] 地址永久缓存，只请求一次
+            return summ, xp, full_address
 
-                if week_num > current_week_num:
-                    current_week_num = week_num
-                
-                account_data[cache_key] = {
-                    "balance": balance, 
-                    "xp": xp_total, 
-                    "xp_week": xp_week,
-                    "week_num": week_num,
-                    "xp_earned": xp_earned, 
-                    "xp_avail": xp_avail,
-                    "full_address": full_address
-                }
+        results = fan_out_accounts(task, on_status=self.account_status)
+
+        for _, acc, cache_key in iter_accounts():
+            res, logs = results[cache_key]
+            self.replay_logs(logs)
+            summ, xp, full_address = res or (None, (0.0, 0.0, 0, 0.0, 0.0), "")
+            # 获取失败的账户余额记为 None (显示 $--)，XP 不计入合计
+            balance = float(summ.get("account_value", 0)) if summ else None
+            if res is None or summ is None: failed.append(acc["name"])
+            xp_total, xp_week, week_num, xp_earned, xp_avail = xp
+
+            if week_num > current_week_num:
+                current_week_num = week_num
+            
+            account_data[cache_key] = {
+                "balance": balance, 
+                "failed": res is None or summ is None,
+                "xp": xp_total, 
+                "xp_week": xp_week,
+                "week_num": week_num,
+                "xp_earned": xp_earned, 
+                "xp_avail": xp_avail,
+                "full_address": full_address
+            }
+            if not account_data[cache_key]["failed"]:
                 total_xp_pool += xp_total
                 total_latest_week_xp += xp_week
         
-        save_json(CACHE_FILE, STATS_CACHE)
+        if self.save_state: save_cache()
 
         self.log_safe(f"\n[2/2] 统计汇总 (最新已结算周: Week {current_week_num})", "INFO")
         
-        now = datetime.now()
-        this_friday_8am = (now - timedelta(days=(now.weekday() - 4) % 7)).replace(hour=8, minute=0, second=0, microsecond=0)
-        if now < this_friday_8am: end = this_friday_8am - timedelta(days=7)
-        else: end = this_friday_8am
+        end = week_start(time.time() * 1000)
         start = end - timedelta(days=7)
         start_ms = int(start.timestamp() * 1000)
         end_ms = int(end.timestamp() * 1000)
@@ -527,12 +3338,7 @@ class ParadexStatsApp:
         tot_vol, tot_pnl, tot_cnt = 0, 0, 0
         
         for key, data in sorted(STATS_CACHE.items()):
-            fills = data.get("fills", [])
-            weekly_fills = [f for f in fills if start_ms <= f["ts"] < end_ms]
-            
-            vol = sum(f["vol"] for f in weekly_fills)
-            pnl = sum(f["pnl"] for f in weekly_fills)
-            count = len(weekly_fills)
+            vol, pnl, count = fill_window(key, start_ms, end_ms)
             
             acc_info = account_data.get(key, {})
             if not acc_info: continue
@@ -545,8 +3351,10 @@ class ParadexStatsApp:
             # UI 输出
             week_label = f"W{acc_info['week_num']}" if acc_info['week_num'] > 0 else "W--"
             xp_str = f"Tot:{acc_info['xp']:.0f} (Earn:{acc_info['xp_earned']:.0f} | Avail:{acc_info['xp_avail']:.0f} | {week_label}:+{acc_info['xp_week']:.0f})"
-            res_str = f"• {key} [{short_addr}]: ${acc_info['balance']:,.0f} | XP: {xp_str} | Vol ${vol:,.0f} | PnL ${pnl:+.2f}"
-            self.log_safe(res_str, "INFO")
+            balance_str = f"${acc_info['balance']:,.0f}" if acc_info["balance"] is not None else "$--"
+            res_str = f"• {key} [{short_addr}]: {balance_str} | XP: {xp_str} | Vol ${vol:,.0f} | PnL ${pnl:+.2f}"
+            if acc_info["failed"]: res_str = f"[!] {res_str} (获取失败，不计入合计)"
+            self.log_safe(res_str, "ERROR" if acc_info["failed"] else "INFO")
             
             # Excel 数据收集 (写入完整地址)
             excel_rows.append({
@@ -563,6 +3371,14 @@ class ParadexStatsApp:
                 "Trades Count": count
             })
 
+            result["accounts"].append({
+                "account": key, "address": raw_addr, "balance": acc_info['balance'], "error": acc_info["failed"],
+                "xp": acc_info['xp'], "xp_earned": acc_info['xp_earned'], "xp_avail": acc_info['xp_avail'],
+                "week_num": acc_info['week_num'], "xp_week": acc_info['xp_week'],
+                "volume": vol, "pnl": pnl, "count": count
+            })
+
+            if acc_info["failed"]: continue
             tot_vol += vol
             tot_pnl += pnl
             tot_cnt += count
@@ -570,35 +3386,55 @@ class ParadexStatsApp:
         tot_eff = (tot_pnl / (tot_vol / 1000000)) if tot_vol > 0 else 0
         summary = f"\n📊 交易周汇总 ({start.strftime('%m-%d')}~{end.strftime('%m-%d')}):\n交易笔数: {tot_cnt}\n周成交额: ${tot_vol:,.0f}\n周总盈亏: ${tot_pnl:+.2f}\n资金效率: ${tot_eff:.2f}/M\n\n⭐ XP官方数据:\n总 XP池: {total_xp_pool:,.0f}\n最新周(Week {current_week_num})增量: +{total_latest_week_xp:,.0f}"
         self.log_safe(summary, "SUCCESS")
+        self.incomplete_note(failed)
+        result["week"] = {"start": start.isoformat(), "end": end.isoformat()}
+        result["total"] = {"volume": tot_vol, "pnl": tot_pnl, "count": tot_cnt, "efficiency": tot_eff,
+                           "xp_pool": total_xp_pool, "latest_week": current_week_num,
+                           "latest_week_xp": total_latest_week_xp, "failed": failed}
+
+        # XP 趋势：周分与周成交额均来自本地数据，不额外请求
+        trend = xp_trend(group_by="group", last=4)
+        if trend:
+            self.log_safe("\n📈 XP 趋势 (最近 4 周 | 每 $1M 成交 XP | 环比):", "INFO")
+            for name, rows in trend.items():
+                cells = []
+                for r in rows:
+                    cell = f"W{r['week']} {r['xp']:,.0f}"
+                    if r["xp_per_m"] is not None: cell += f" ({r['xp_per_m']:,.0f}/M)"
+                    if r["delta_pct"] is not None: cell += f" {r['delta_pct']:+.0f}%"
+                    cells.append(cell)
+                self.log_safe(f"  {name.strip()}: " + " | ".join(cells), "INFO")
+        result["xp_trend"] = trend
+        result["excel"] = None
         
         # --- 导出 Excel ---
         try:
-            if excel_rows:
-                if not os.path.exists(EXCEL_DIR):
-                    os.makedirs(EXCEL_DIR)
-                
-                df = pd.DataFrame(excel_rows)
+            if not self.export_excel:
+                pass
+            elif excel_rows:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 filename = f"paradex_report_{timestamp}.xlsx"
                 filepath = os.path.join(EXCEL_DIR, filename)
                 
-                df.to_excel(filepath, index=False)
+                with METRICS.timer("excel_export_seconds", phase="excel_export"):
+                    export_excel_report(filepath, excel_rows, start_ms, end_ms, detail=False)
+                result["excel"] = filepath
                 self.log_safe(f"\n💾 Excel 已成功保存: {filepath}", "SUCCESS")
             else:
                 self.log_safe("\n⚠️ 没有数据可导出。", "WARNING")
         except Exception as e:
             self.log_safe(f"\n❌ Excel 导出失败: {e}", "ERROR")
 
-        self.toggle_buttons(True)
+        self.end_action("weekly", started)
+        return result
 
     # --- Logic: Volume Stats (Real-time PnL/Eff) ---
     def logic_volume_stats(self):
         self.log_safe("📈 开始计算本周表现 (Since UTC Friday 00:00)...", "HEADER")
+        started = self.begin_action()
+        ensure_cache()
         
-        now_utc = datetime.now(timezone.utc)
-        diff = (now_utc.weekday() - 4) % 7
-        last_friday = now_utc - timedelta(days=diff)
-        start_date = last_friday.replace(hour=0, minute=0, second=0, microsecond=0)
+        start_date = volume_week_start()
         start_ms = int(start_date.timestamp() * 1000)
         
         self.log_safe(f"🕒 统计起始时间 (UTC): {start_date.strftime('%Y-%m-%d %H:%M:%S')}", "INFO")
@@ -606,34 +3442,39 @@ class ParadexStatsApp:
 
         grand_total_vol = 0
         grand_total_pnl = 0
+        result = {"action": "volume", "start": start_date.isoformat(), "groups": []}
         
+        failed = self.sync_all_fills()
+        week = query_fills(start_ms=start_ms, group_by="account")
+
         for group in GROUPS:
             g_vol, g_pnl = 0, 0
+            g_accounts = []
             self.log_safe(f"Processing {group['name']}...", "INFO")
             
-            for acc in group["accounts"]:
-                api_key = acc["key"]
-                if not api_key: continue
-                cache_key = f"g{group['id']}_{acc['name']}"
-                
-                fetch_fills_incremental(api_key, cache_key, lambda x: None)
-                cached = STATS_CACHE.get(cache_key, {})
-                fills = cached.get("fills", [])
-                
-                weekly_fills = [f for f in fills if f["ts"] >= start_ms]
-                
-                acc_vol = sum(f["vol"] for f in weekly_fills)
-                acc_pnl = sum(f["pnl"] for f in weekly_fills)
+            for _, acc, cache_key in iter_accounts([group]):
+                if cache_key in failed:
+                    self.log_safe(f"  [!] {acc['name']}: 成交同步失败，不计入合计", "ERROR")
+                    g_accounts.append({"account": cache_key, "name": acc["name"], "volume": None, "error": True})
+                    continue
+                row = week.get(cache_key, {})
+                acc_vol, acc_pnl = row.get("vol", 0.0), row.get("pnl", 0.0)
                 
                 g_vol += acc_vol
                 g_pnl += acc_pnl
                 
-                self.log_safe(f"  - {acc['name']}: Vol ${acc_vol:,.0f} | PnL ${acc_pnl:+.2f}", "INFO")
+                as_of = SNAPSHOTS.as_of((cache_key, "fills"))
+                self.log_safe(f"  - {acc['name']}: Vol ${acc_vol:,.0f} | PnL ${acc_pnl:+.2f}{self.age_note(as_of)}", "INFO")
+                self.account_status(cache_key, week_vol=acc_vol)
+                g_accounts.append({"account": cache_key, "name": acc["name"], "volume": acc_vol,
+                                   "pnl": acc_pnl, "count": row.get("count", 0), "as_of": as_of})
             
             g_eff = (g_pnl / (g_vol / 1000000)) if g_vol > 0 else 0
             res_str = f"> {group['name']} 合计: Vol ${g_vol:,.0f} | PnL ${g_pnl:+.2f} | 效率 ${g_eff:.2f}/M"
             self.log_safe(res_str, "SUBHEADER")
             self.log_safe("", "INFO")
+            result["groups"].append({"name": group["name"], "volume": g_vol, "pnl": g_pnl,
+                                     "efficiency": g_eff, "accounts": g_accounts})
             
             grand_total_vol += g_vol
             grand_total_pnl += g_pnl
@@ -642,64 +3483,645 @@ class ParadexStatsApp:
         summary = f"\n📊 本周全账户汇总 (UTC Fri~Now):\n----------------------------------\n💰 总交易量: ${grand_total_vol:,.0f}\n📉 总盈亏额: ${grand_total_pnl:+.2f}\n⚡ 资金效率: ${grand_eff:.2f}/M"
         self.log_safe("=" * 50, "HEADER")
         self.log_safe(summary, "HEADER")
+        self.incomplete_note(list(failed.values()))
+        result["total"] = {"volume": grand_total_vol, "pnl": grand_total_pnl, "efficiency": grand_eff,
+                           "failed": list(failed.values())}
         
-        self.toggle_buttons(True)
+        self.end_action("volume", started)
+        return result
 
     # --- Logic: Positions (持仓监控) ---
     def logic_positions(self):
         self.log_safe("🔍 开始扫描全账户持仓...", "HEADER")
-        
-        total_upnl = 0.0  # 总未结盈亏
-        total_notional = 0.0 # 总持仓名义价值
-        has_position = False
+        started = self.begin_action()
+        result = {"action": "positions", "positions": [], "groups": []}
+
+        fetch = lambda group, acc, cache_key, log: fetch_positions(acc["key"])
+        if WORKER_PROCS > 1 and can_fork():
+            # 多进程分片要求 fork 时没有其他线程，标记价格先取
+            marks = fetch_mark_prices()
+            results = fan_out_accounts(fetch, on_status=self.account_status)
+        else:
+            # 标记价格 (一次公共请求) 与各账户持仓并行拉取
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                marks_future = pool.submit(fetch_mark_prices)
+                results = fan_out_accounts(fetch, on_status=self.account_status)
+                marks = marks_future.result()
+
+        rows, by_account, failed = [], {}, []
+        for group, acc, cache_key in iter_accounts():
+            as_of = SNAPSHOTS.as_of((acc["key"], "positions"))
+            positions, logs = results[cache_key]
+            if positions is None:
+                self.replay_logs(logs)
+                failed.append(acc["name"])
+                continue
+            for pos in positions:
+                size = float(pos.get("size", 0))
+                if size == 0: continue
+                side = pos.get("side", "LONG" if size > 0 else "SHORT")
+                by_account.setdefault(cache_key, []).append(len(rows))
+                rows.append({"group": group["name"], "account": cache_key, "name": acc["name"],
+                             "market": pos.get("market", "Unknown"), "side": side,
+                             "size": abs(size) * (-1 if side == "SHORT" else 1),
+                             "entry_price": float(pos.get("average_entry_price", 0)),
+                             "upnl": float(pos.get("unrealized_pnl", 0)), "as_of": as_of})
+        risk = position_risk(rows, marks)
 
         for group in GROUPS:
             self.log_safe(f"Checking {group['name']}...", "INFO")
             group_upnl = 0.0
             
-            for acc in group["accounts"]:
-                api_key = acc["key"]
-                if not api_key: continue
-                
-                positions = fetch_positions(api_key)
-                active_positions = [p for p in positions if float(p.get("size", 0)) != 0]
-                
-                if active_positions:
-                    has_position = True
-                    for pos in active_positions:
-                        market = pos.get("market", "Unknown")
-                        size = float(pos.get("size", 0))
-                        side = pos.get("side", "LONG" if size > 0 else "SHORT")
-                        entry_price = float(pos.get("average_entry_price", 0))
-                        upnl = float(pos.get("unrealized_pnl", 0))
-                        
-                        group_upnl += upnl
-                        total_upnl += upnl
-                        total_notional += abs(size * entry_price)
-
-                        tag = "SUCCESS" if upnl >= 0 else "ERROR"
-                        self.log_safe(
-                            f"  [{acc['name']}] {market} | {side} {abs(size):.3f} | Entry: {entry_price:,.2f} | uPnL: ${upnl:+.2f}", 
-                            tag
-                        )
+            for _, acc, cache_key in iter_accounts([group]):
+                acc_upnl = 0.0
+                for i in by_account.get(cache_key, []):
+                    row, mark, upnl = rows[i], risk["mark"][i], risk["upnl"][i]
+                    acc_upnl += upnl
+                    result["positions"].append({
+                        "account": cache_key, "group": group["name"], "market": row["market"], "side": row["side"],
+                        "size": row["size"], "entry_price": row["entry_price"], "mark_price": mark, "upnl": upnl,
+                        "upnl_reported": row["upnl"], "notional": risk["notional"][i], "exposure": risk["exposure"][i],
+                        "as_of": row["as_of"]})
+                    mark_str = f"{mark:,.2f}" if mark is not None else "-"
+                    self.log_safe(
+                        f"  [{acc['name']}] {row['market']} | {row['side']} {abs(row['size']):.3f} | Entry: {row['entry_price']:,.2f}"
+                        f" | Mark: {mark_str} | uPnL: ${upnl:+.2f}",
+                        "SUCCESS" if upnl >= 0 else "ERROR"
+                    )
+                group_upnl += acc_upnl
+                self.account_status(cache_key, upnl=acc_upnl, **self.as_of_cell(SNAPSHOTS.as_of((acc["key"], "positions"))))
             
             if group_upnl != 0:
                 self.log_safe(f"  > {group['name']} 未结盈亏: ${group_upnl:+.2f}\n", "SUBHEADER")
+            result["groups"].append({"name": group["name"], "upnl": group_upnl})
 
-        if not has_position:
+        total_upnl = sum(risk["upnl"])
+        total_notional = sum(risk["notional"])
+        exposure = market_exposure(rows, risk)
+        result["exposure"] = exposure
+        if not rows and not failed:
             self.log_safe("\n✅ 当前没有任何持仓。", "SUCCESS")
         else:
+            self.log_safe("\n📐 按市场净敞口 (标记价格，多正空负):", "INFO")
+            for market, row in exposure.items():
+                groups = " | ".join(f"{name.strip()} ${net:+,.0f}" for name, net in row["groups"].items() if round(net))
+                self.log_safe(f"  {market:<16} 净 ${row['net']:+,.0f} | 总 ${row['gross']:,.0f}  ({groups})", "INFO")
+            missing = sorted({row["market"] for row, mark in zip(rows, risk["mark"]) if mark is None})
+            if missing: self.log_safe(f"  ⚠️ 缺少标记价格，按接口 uPnL 与开仓价估算: {', '.join(missing)}", "WARNING")
             self.log_safe("=" * 40, "HEADER")
-            summary = f"📊 持仓汇总:\n💰 总未结盈亏 (uPnL): ${total_upnl:+.2f}\n📜 总持仓名义价值 (Est): ${total_notional:,.0f}"
+            net_total = sum(row["net"] for row in exposure.values())
+            summary = (f"📊 持仓汇总:\n💰 总未结盈亏 (uPnL): ${total_upnl:+.2f}\n📜 总持仓名义价值 (Mark): ${total_notional:,.0f}"
+                       f"\n⚖️ 净敞口: ${net_total:+,.0f}")
             self.log_safe(summary, "HEADER" if total_upnl >= 0 else "ERROR")
+        self.incomplete_note(failed)
+        result["total"] = {"upnl": total_upnl, "notional": total_notional,
+                           "net_exposure": sum(row["net"] for row in exposure.values()), "failed": failed}
 
-        self.toggle_buttons(True)
+        self.end_action("positions", started)
+        return result
 
-if __name__ == "__main__":
+    # --- Logic: Breakdown (按市场 / Maker-Taker 拆分) ---
+    def logic_breakdown(self, start_ms=None, end_ms=None):
+        self.log_safe("🧩 开始按市场 / Maker-Taker 拆分成交...", "HEADER")
+        started = self.begin_action()
+        ensure_cache()
+        result = {"action": "breakdown", "start_ms": start_ms, "end_ms": end_ms, "groups": []}
+
+        failed = list(self.sync_all_fills().values())
+        if self.save_state: save_cache()
+
+        markets = fill_breakdown("market", start_ms=start_ms, end_ms=end_ms, group_by="group")
+        for name, prof in fill_profile(start_ms=start_ms, end_ms=end_ms, group_by="group").items():
+            maker = f"{prof['maker_share'] * 100:.1f}%" if prof["maker_share"] is not None else "--"
+            bps = f"{prof['fee_bps']:.2f} bps" if prof["fee_bps"] is not None else "--"
+            share = f" | 占扣费前盈亏 {prof['fee_share'] * 100:.0f}%" if prof["fee_share"] is not None else ""
+            self.log_safe(f"\n📦 {name.strip()}: Vol ${prof['vol']:,.0f} | PnL ${prof['pnl']:+.2f}", "SUBHEADER")
+            self.log_safe(f"  Maker 占比 {maker} | 手续费 ${prof['fee']:,.2f} ({bps}){share}", "INFO")
+            group_markets = markets.get(name, {})
+            for market, row in sorted(group_markets.items(), key=lambda kv: -kv[1]["vol"]):
+                self.log_safe(f"  {market or '(未知)':<18} Vol ${row['vol']:,.0f} | PnL ${row['pnl']:+.2f}"
+                              f" | Fee ${row['fee']:,.2f} | {row['count']} 笔", "INFO")
+            result["groups"].append({"name": name, **prof, "markets": group_markets})
+        self.incomplete_note(failed, "成交同步失败，只含本地已有成交")
+        result["failed"] = failed
+
+        self.end_action("breakdown", started)
+        return result
+
+    # --- Logic: Equity (权益曲线与回撤，只读本地快照) ---
+    def logic_equity(self, start_ms=None, end_ms=None):
+        self.log_safe("📉 权益曲线与最大回撤 (本地快照，不发请求)...", "HEADER")
+        started = self.begin_action()
+        ensure_cache()
+        end_ms = end_ms or int(time.time() * 1000)
+        start_ms = start_ms or end_ms - 30 * DAY_MS
+        result = {"action": "equity", "start_ms": start_ms, "end_ms": end_ms, "groups": [], "accounts": [], "total": None}
+        fmt_day = lambda ts: datetime.fromtimestamp(ts / 1000, timezone.utc).strftime("%m-%d %H:%M") if ts else "--"
+
+        def describe(label, curve, level="INFO"):
+            dd = max_drawdown(curve)
+            pct = f" ({dd['drawdown_pct']:.1f}%)" if dd["drawdown_pct"] is not None else ""
+            change = curve["pnl"][-1] - curve["pnl"][0]
+            self.log_safe(f"{label}: {len(curve['ts'])} 点 | 盈亏 ${curve['pnl'][-1]:+,.0f} (区间 ${change:+,.0f})"
+                          f" | 最大回撤 ${dd['drawdown']:,.0f}{pct} {fmt_day(dd['peak_ts'])} → {fmt_day(dd['trough_ts'])}", level)
+            return {"curve": curve, "drawdown": dd, "returns": return_series(curve)}
+
+        by_account = equity_curve(start_ms=start_ms, end_ms=end_ms, group_by="account")
+        by_group = equity_curve(start_ms=start_ms, end_ms=end_ms, group_by="group")
+        for group in GROUPS:
+            if group["name"] not in by_group: continue
+            result["groups"].append({"name": group["name"], **describe(f"\n📦 {group['name'].strip()}", by_group[group["name"]], "SUBHEADER")})
+            for _, acc, cache_key in iter_accounts([group]):
+                if cache_key in by_account:
+                    result["accounts"].append({"account": cache_key, "name": acc["name"], "group": group["name"],
+                                               **describe(f"  - {acc['name']}", by_account[cache_key])})
+        total = equity_curve(start_ms=start_ms, end_ms=end_ms, group_by=None).get("total")
+        if total:
+            self.log_safe("=" * 40, "HEADER")
+            result["total"] = describe("📊 全账户", total, "HEADER")
+        else:
+            self.log_safe("还没有权益快照：运行一次总资金或开启后台刷新后开始记录。", "WARNING")
+
+        self.end_action("equity", started)
+        return result
+
+    # --- Logic: Export (成交明细导出) ---
+    def logic_export(self, start_ms=None, end_ms=None, fmt="xlsx", out=None):
+        self.log_safe("📦 开始导出成交明细...", "HEADER")
+        started = self.begin_action()
+        ensure_cache()
+        result = {"action": "export", "format": fmt, "path": None, "rows": 0}
+
+        failed = list(self.sync_all_fills().values())
+        if self.save_state: save_cache()
+
+        try:
+            if fmt == "parquet":
+                out = out or os.path.join(EXCEL_DIR, "fills_parquet")
+                with METRICS.timer("parquet_export_seconds", phase="parquet_export"):
+                    files, rows = export_parquet(out, start_ms=start_ms, end_ms=end_ms)
+                self.log_safe(f"💾 Parquet 已写出: {out} ({files} 个分区, {rows:,} 笔)", "SUCCESS")
+            else:
+                out = out or os.path.join(EXCEL_DIR, f"paradex_fills_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
+                summary_rows = [{"Account": key, "Volume ($)": row["vol"], "PnL ($)": row["pnl"], "Trades Count": row["count"]}
+                                for key, row in query_fills(start_ms=start_ms, end_ms=end_ms).items()]
+                with METRICS.timer("excel_export_seconds", phase="excel_export"):
+                    rows = export_excel_report(out, summary_rows, start_ms, end_ms)
+                self.log_safe(f"💾 Excel 已写出: {out} ({rows:,} 笔)", "SUCCESS")
+            result.update(path=out, rows=rows)
+        except ImportError as e:
+            self.log_safe(f"❌ 导出失败，缺少依赖: {e} (pip install {'pyarrow' if fmt == 'parquet' else 'openpyxl'})", "ERROR")
+        except Exception as e:
+            self.log_safe(f"❌ 导出失败: {e}", "ERROR")
+        self.incomplete_note(failed, "成交同步失败，只含本地已有成交")
+        result["failed"] = failed
+
+        self.end_action("export", started)
+        return result
+
+# ================= UI 应用程序类 =================
+
+def load_gui_modules():
+    """
+    按需导入 tkinter，无显示环境的命令行模式不会触发
+    """
+    global tk, ttk, scrolledtext, messagebox
+    import tkinter as tk
+    from tkinter import scrolledtext, ttk, messagebox
+
+class ParadexStatsApp(ReportLogic):
+    def __init__(self, root):
+        self.root = root
+        self.root.title("Paradex 统计助手 v5.2 (Fix Excel Addr)")
+        self.root.geometry("1100x760")
+        self.log_queue = deque()      # 工作线程 append，UI 线程按帧 popleft；deque 两端操作线程安全
+        self.status_pending = {}      # cache_key -> 待更新单元格，同一帧内多次更新只渲染最后一次
+        self.status_lock = threading.Lock()
+        
+        style = ttk.Style()
+        style.configure("TButton", font=("Arial", 10), padding=5)
+        
+        btn_frame = ttk.Frame(root, padding=10)
+        btn_frame.pack(fill=tk.X)
+        
+        self.btn_total = ttk.Button(btn_frame, text="📊 总资金 (Total Stats)", command=self.run_total_thread)
+        self.btn_total.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+        
+        self.btn_weekly = ttk.Button(btn_frame, text="📅 最新周报 + 💾 Excel", command=self.run_weekly_thread)
+        self.btn_weekly.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+
+        self.btn_vol = ttk.Button(btn_frame, text="📉 本周表现 (UTC Fri)", command=self.run_volume_thread)
+        self.btn_vol.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+
+        self.btn_pos = ttk.Button(btn_frame, text="📈 持仓监控 (Positions)", command=self.run_positions_thread)
+        self.btn_pos.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
+
+        self.btn_clear = ttk.Button(btn_frame, text="🧹 清屏", command=self.clear_log)
+        self.btn_clear.pack(side=tk.RIGHT, padx=5)
+
+        self.scheduler = RefreshScheduler(log_func=self.log_safe, on_status=self.account_status)
+        self.auto_refresh = tk.BooleanVar(value=False)
+        ttk.Checkbutton(btn_frame, text="🔄 后台刷新", variable=self.auto_refresh,
+                        command=self.toggle_scheduler).pack(side=tk.RIGHT, padx=5)
+        self.streams = StreamManager(log_func=self.log_safe, on_status=self.account_status)
+        self.live_stream = tk.BooleanVar(value=False)
+        ttk.Checkbutton(btn_frame, text="📡 实时推送", variable=self.live_stream,
+                        command=self.toggle_stream).pack(side=tk.RIGHT, padx=5)
+
+        # 账户状态表：每个账户一行，按 cache_key 原地更新单元格
+        table_frame = ttk.Frame(root, padding=(10, 0))
+        table_frame.pack(fill=tk.X)
+        accounts = list(iter_accounts())
+        self.status_table = ttk.Treeview(table_frame, columns=[c for c, _, _ in self.STATUS_COLUMNS],
+                                         height=max(1, min(len(accounts), 8)))
+        self.status_table.heading("#0", text="账户")
+        self.status_table.column("#0", width=140, stretch=False)
+        for col, title, width in self.STATUS_COLUMNS:
+            self.status_table.heading(col, text=title)
+            self.status_table.column(col, width=width, anchor=tk.W if col in ("group", "status") else tk.E)
+        for group, acc, cache_key in accounts:
+            self.status_table.insert("", tk.END, iid=cache_key, text=acc["name"],
+                                     values=[group["name"].strip()] + ["-"] * (len(self.STATUS_COLUMNS) - 1))
+        table_scroll = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.status_table.yview)
+        self.status_table.configure(yscrollcommand=table_scroll.set)
+        self.status_table.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        table_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.log_area = scrolledtext.ScrolledText(root, state='disabled', font=("Consolas", 10))
+        self.log_area.pack(expand=True, fill=tk.BOTH, padx=10, pady=10)
+        
+        self.log_area.tag_config("INFO", foreground="black")
+        self.log_area.tag_config("SUCCESS", foreground="green")
+        self.log_area.tag_config("WARNING", foreground="#FF8C00")
+        self.log_area.tag_config("ERROR", foreground="red")
+        self.log_area.tag_config("HEADER", foreground="blue", font=("Consolas", 10, "bold"))
+        self.log_area.tag_config("SUBHEADER", foreground="purple", font=("Consolas", 10, "bold"))
+        
+        self.log_safe("系统就绪。点击'最新周报'会自动导出Excel。", "INFO")
+        self.root.after(GUI_LOG_FLUSH_MS, self._drain_ui)
+        if SCHEDULER_AUTOSTART:
+            self.auto_refresh.set(True)
+            self.toggle_scheduler()
+        if STREAM_AUTOSTART:
+            self.live_stream.set(True)
+            self.toggle_stream()
+
+    STATUS_COLUMNS = (
+        ("group", "分组", 110), ("status", "状态", 90), ("balance", "余额", 110), ("pnl", "盈亏", 110),
+        ("volume", "累计成交", 130), ("week_vol", "本周成交", 110), ("upnl", "未结盈亏", 100),
+        ("elapsed", "耗时", 70), ("updated", "更新于", 80),
+    )
+
+    def log_safe(self, message, level="INFO"):
+        self.log_queue.append((message, level))
+
+    def account_status(self, cache_key, **cells):
+        with self.status_lock:
+            self.status_pending.setdefault(cache_key, {}).update(cells)
+
+    def _drain_ui(self):
+        """
+        UI 线程每帧执行一次：积压日志合并为一次 insert 渲染，状态表只更新变化的单元格
+        """
+        try:
+            lines = []
+            while self.log_queue: lines.append(self.log_queue.popleft())
+            if lines: self._render_logs(lines)
+            with self.status_lock:
+                pending, self.status_pending = self.status_pending, {}
+            for cache_key, cells in pending.items(): self._update_row(cache_key, cells)
+        except: pass
+        finally:
+            self.root.after(GUI_LOG_FLUSH_MS, self._drain_ui)
+
+    def _render_logs(self, lines):
+        # 积压超过滚动区容量时，较早的行插入后也会被立即裁掉，直接丢弃
+        if len(lines) > GUI_LOG_MAX_LINES:
+            dropped = len(lines) - GUI_LOG_MAX_LINES
+            lines = [(f"... 日志过多，已省略 {dropped:,} 行", "WARNING")] + lines[-GUI_LOG_MAX_LINES:]
+        # 相邻同级别的行合并为一段，整帧只调用一次 insert(text1, tag1, text2, tag2, ...)
+        chunks = []
+        for message, level in lines:
+            if chunks and chunks[-1][1] == level: chunks[-1][0].append(message)
+            else: chunks.append(([message], level))
+        args = [x for texts, level in chunks for x in ("\n".join(texts) + "\n", level)]
+
+        follow = self.log_area.yview()[1] >= 0.999  # 用户向上翻看时不强制滚到底
+        self.log_area.configure(state='normal')
+        self.log_area.insert(tk.END, *args)
+        overflow = int(self.log_area.index("end-1c").split(".")[0]) - 1 - GUI_LOG_MAX_LINES
+        if overflow > 0: self.log_area.delete("1.0", f"{overflow + 1}.0")
+        self.log_area.configure(state='disabled')
+        if follow: self.log_area.see(tk.END)
+
+    def _update_row(self, cache_key, cells):
+        if not self.status_table.exists(cache_key): return
+        for col, value in cells.items():
+            if isinstance(value, float):
+                value = f"${value:+,.2f}" if col in ("pnl", "upnl") else f"${value:,.0f}"
+            self.status_table.set(cache_key, col, value)
+
+    def toggle_scheduler(self):
+        if self.auto_refresh.get():
+            self.scheduler.start()
+            self.log_safe(f"🔄 后台刷新已开启 (活跃 {SCHED_ACTIVE_SEC:.0f}s / 空闲 {SCHED_IDLE_SEC:.0f}s，"
+                          f"预算 {SCHED_BUDGET_PER_MIN:.0f} 请求/分钟)，报表将直接读取本地数据", "SUCCESS")
+        else:
+            self.scheduler.stop()
+            self.log_safe("⏹ 后台刷新已关闭", "INFO")
+
+    def toggle_stream(self):
+        if not self.live_stream.get():
+            self.streams.stop()
+            self.log_safe("⏹ 实时推送已关闭", "INFO")
+            return
+        try:
+            self.streams.start()
+            self.log_safe(f"📡 实时推送已开启: {WS_URL}", "SUCCESS")
+        except ImportError as e:
+            self.live_stream.set(False)
+            self.log_safe(f"❌ 无法开启实时推送，缺少依赖: {e} (pip install websocket-client)", "ERROR")
+
+    def clear_log(self):
+        self.log_queue.clear()
+        self.log_area.configure(state='normal')
+        self.log_area.delete(1.0, tk.END)
+        self.log_area.configure(state='disabled')
+
+    def toggle_buttons(self, state):
+        self.root.after(0, lambda: self._toggle_impl(state))
+
+    def _toggle_impl(self, state):
+        s = tk.NORMAL if state else tk.DISABLED
+        self.btn_total.config(state=s)
+        self.btn_weekly.config(state=s)
+        self.btn_vol.config(state=s)
+        self.btn_pos.config(state=s)
+
+    # --- Threads ---
+    def run_total_thread(self):
+        self.toggle_buttons(False)
+        self.clear_log()
+        threading.Thread(target=self.logic_total_stats, daemon=True).start()
+
+    def run_weekly_thread(self):
+        self.toggle_buttons(False)
+        self.clear_log()
+        threading.Thread(target=self.logic_weekly_stats, daemon=True).start()
+
+    def run_volume_thread(self):
+        self.toggle_buttons(False)
+        self.clear_log()
+        threading.Thread(target=self.logic_volume_stats, daemon=True).start()
+
+    def run_positions_thread(self):
+        self.toggle_buttons(False)
+        self.clear_log()
+        threading.Thread(target=self.logic_positions, daemon=True).start()
+
+# ================= 命令行入口 =================
+
+class HeadlessReporter(ReportLogic):
+    """
+    无界面模式：日志直接打印，适合服务器与定时任务
+    """
+    def __init__(self, stream=None, export_excel=True, push_tg=True):
+        self.stream = stream or sys.stdout
+        self.export_excel = export_excel
+        self.push_tg = push_tg
+
+    def log_safe(self, message, level="INFO"):
+        print(message, file=self.stream, flush=True)
+
+# ================= 本机 JSON 接口 =================
+
+class ServeReporter(HeadlessReporter):
+    """
+    serve 模式的报表计算：不导出 Excel、不推送 Telegram、不落盘 (交给后台刷新)，只把请求错误 ([!] / ❌) 打印到 stderr
+    """
+    save_state = False
+
+    def __init__(self):
+        super().__init__(stream=sys.stderr, export_excel=False, push_tg=False)
+
+    def log_safe(self, message, level="INFO"):
+        if "[!]" in message or "❌" in message: super().log_safe(message.strip(), level)
+
+class ReportServer:
+    """
+    serve 模式的结果缓存
+    每个视图的 JSON 结果缓存 max_age 秒；过期后第一个请求触发后台重算，重算期间所有请求继续拿旧结果，
+    只有首次请求需要等待计算。计算全部基于本地成交库与快照缓存 (SNAPSHOTS.local_only，由后台刷新维护)，
+    读者再多也不会增加上游请求；调度器还没刷新到的账户按获取失败列出。
+    ETag 为响应体的哈希：内容不变时重算后 ETag 不变，轮询方带 If-None-Match 即可得到 304。
+    """
+    VIEWS = {"total": "logic_total_stats", "weekly": "logic_weekly_stats",
+             "this-week": "logic_volume_stats", "positions": "logic_positions", "equity": "logic_equity"}
+    PATHS = ["/" + view for view in VIEWS] + ["/accounts", "/accounts/<账户>"]
+
+    def __init__(self, max_age=SERVE_MAX_AGE):
+        self.reporter = ServeReporter()
+        self.max_age = max_age
+        self.entries = {}  # 视图 (或 accounts/<cache_key>) -> (computed_at, etag, body)
+        self.results = {}  # 视图 -> 结果字典
+        self.hits = {}
+        self._lock = threading.Lock()
+        self._compute_lock = threading.RLock()  # 报表逐个计算；accounts 视图在锁内复用其他视图
+        self._refreshing = set()
+
+    def get(self, view):
+        """
+        返回 (computed_at, etag, body)，未知视图返回 None
+        """
+        if view not in self.VIEWS and view != "accounts" and not view.startswith("accounts/"): return None
+        if view.startswith("accounts/"):
+            self.get("accounts")
+            return self.entries.get(view)
+        entry = self.entries.get(view)
+        if entry:
+            if time.time() - entry[0] >= self.max_age: self._refresh_async(view)
+            return entry
+        with self._compute_lock:
+            return self.entries.get(view) or self._compute(view)
+
+    def hit(self, view, status):
+        with self._lock:
+            key = (view.partition("/")[0], status)
+            self.hits[key] = self.hits.get(key, 0) + 1
+
+    def result(self, view):
+        """
+        视图的结果字典；缓存超过 max_age 时在当前线程重算 (accounts 视图在计算锁内合并其他视图，不能读到过期结果)
+        """
+        with self._compute_lock:
+            entry = self.entries.get(view)
+            if not entry or time.time() - entry[0] >= self.max_age: self._compute(view)
+            return self.results[view]
+
+    def _refresh_async(self, view):
+        with self._lock:
+            if view in self._refreshing: return
+            self._refreshing.add(view)
+
+        def run():
+            try:
+                with self._compute_lock: self._compute(view)
+            except Exception as e:
+                print(f"[!] serve {view}: {e}", file=sys.stderr, flush=True)
+            finally:
+                with self._lock: self._refreshing.discard(view)
+
+        threading.Thread(target=run, name=f"serve {view}", daemon=True).start()
+
+    def _compute(self, view):
+        if view == "accounts":
+            accounts = self._accounts()
+            for key, row in accounts.items(): self._store(f"accounts/{key}", row)
+            result = {"action": "accounts", "accounts": list(accounts.values())}
+        else:
+            result = getattr(self.reporter, self.VIEWS[view])()
+        self.results[view] = result
+        return self._store(view, result)
+
+    def _store(self, key, obj):
+        body = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        entry = self.entries[key] = (time.time(), etag, body)
+        return entry
+
+    def _accounts(self):
+        """
+        按账户合并 total / this-week / positions 三个视图
+        """
+        total, week, positions = self.result("total"), self.result("this-week"), self.result("positions")
+        week_rows = {a["account"]: a for g in week["groups"] for a in g["accounts"]}
+        out = {}
+        for group in total["groups"]:
+            for acc in group["accounts"]:
+                key = acc["account"]
+                w = week_rows.get(key, {})
+                out[key] = dict(acc, group=group["name"], week_volume=w.get("volume", 0.0), week_pnl=w.get("pnl", 0.0),
+                                positions=[p for p in positions["positions"] if p["account"] == key])
+                out[key]["upnl"] = sum(p["upnl"] for p in out[key]["positions"])
+        return out
+
+def etag_match(header, etag):
+    tags = [tag.strip() for tag in (header or "").split(",")]
+    return etag in tags or "*" in tags
+
+def make_serve_handler(server):
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, body=b"", headers=None):
+            self.send_response(status)
+            for k, v in (headers or {}).items(): self.send_header(k, v)
+            if status != 304:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if status != 304: self.wfile.write(body)
+
+        def do_GET(self):
+            path = unquote(urlsplit(self.path).path).strip("/")
+            if not path:
+                index = {"endpoints": ReportServer.PATHS, "max_age": server.max_age,
+                         "age": {view: round(time.time() - entry[0], 1) for view, entry in server.entries.items()
+                                 if "/" not in view}}
+                return self._send(200, json.dumps(index, ensure_ascii=False).encode("utf-8"))
+            try:
+                entry = server.get(path)
+            except Exception as e:
+                return self._send(500, json.dumps({"error": str(e)[:200]}).encode("utf-8"))
+            if entry is None: return self._send(404, b'{"error": "not found"}')
+            server.hit(path, 304 if etag_match(self.headers.get("If-None-Match"), entry[1]) else 200)
+            computed_at, etag, body = entry
+            age = max(0.0, time.time() - computed_at)
+            headers = {"ETag": etag, "Cache-Control": f"max-age={max(0, int(server.max_age - age))}",
+                       "Age": str(int(age)), "Last-Modified": self.date_time_string(computed_at),
+                       "Access-Control-Allow-Origin": "*"}
+            if etag_match(self.headers.get("If-None-Match"), etag): return self._send(304, headers=headers)
+            self._send(200, body, headers)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+ACTIONS = {
+    "total": "logic_total_stats",
+    "weekly": "logic_weekly_stats",
+    "volume": "logic_volume_stats",
+    "positions": "logic_positions",
+    "breakdown": "logic_breakdown",
+    "export": "logic_export",
+    "watch": "logic_watch",
+    "serve": "logic_serve",
+    "equity": "logic_equity",
+}
+
+def run_gui():
     try:
+        load_gui_modules()
         root = tk.Tk()
-        app = ParadexStatsApp(root)
+        ParadexStatsApp(root)
         root.mainloop()
     except Exception as e:
         print(f"CRITICAL ERROR: {e}")
-        input("Press Enter to exit...")
\ No newline at end of file
+        input("Press Enter to exit...")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Paradex PnL Reader (不带参数时启动 GUI)")
+    parser.add_argument("action", nargs="?", default="gui", choices=["gui"] + list(ACTIONS),
+                        help="gui 或直接运行某个报表: total / weekly / volume / positions / breakdown / export，"
+                             "watch 为后台刷新，serve 为后台刷新 + 本机 JSON 接口，equity 为权益曲线与回撤")
+    parser.add_argument("--json", action="store_true", help="结果以 JSON 输出到 stdout，日志改写到 stderr")
+    parser.add_argument("--no-excel", action="store_true", help="weekly 不导出 Excel")
+    parser.add_argument("--no-tg", action="store_true", help="total 不推送 Telegram")
+    parser.add_argument("--format", choices=["xlsx", "parquet"], default="xlsx", help="export 的输出格式")
+    parser.add_argument("--start", help="breakdown / export / equity 起始日期 (UTC, YYYY-MM-DD)")
+    parser.add_argument("--end", help="breakdown / export / equity 结束日期 (UTC, YYYY-MM-DD，不含当天)")
+    parser.add_argument("--out", help="export 输出路径 (xlsx 文件或 Parquet 目录)")
+    parser.add_argument("--duration", type=float, help="watch / serve 运行的秒数 (默认一直运行到 Ctrl+C)")
+    parser.add_argument("--stream", action="store_true", help="watch / serve 同时开启 WebSocket 实时推送 (成交与持仓)")
+    parser.add_argument("--host", help=f"serve 监听地址 (默认 {SERVE_HOST})")
+    parser.add_argument("--port", type=int, help=f"serve 端口 (默认 {SERVE_PORT})")
+    parser.add_argument("--max-age", type=float, help=f"serve 结果缓存秒数 (默认 {SERVE_MAX_AGE:g})")
+    parser.add_argument("--accounts-file", help="账户配置文件 (.json / .toml / .yaml)，默认见 PARADEX_ACCOUNTS_FILE")
+    parser.add_argument("--tag", action="append", help="只处理带该标签的账户 (可重复)")
+    parser.add_argument("--procs", type=int, help="把账户分片到 N 个子进程执行 (仅命令行模式，需要 fork)")
+    parser.add_argument("--timings", action="store_true", help="结束时输出各阶段耗时分解")
+    parser.add_argument("--metrics", metavar="FILE", help="写出运行指标 (.prom 为 Prometheus 文本格式，其余为 JSON)")
+    args = parser.parse_args(argv)
+    global METRICS_FILE, WORKER_PROCS
+    if args.metrics: METRICS_FILE = args.metrics
+    if args.accounts_file: GROUPS[:] = load_account_registry(args.accounts_file)
+    if args.tag: select_accounts(args.tag)
+    if args.procs: WORKER_PROCS = args.procs
+
+    if args.action == "gui":
+        run_gui()
+        return 0
+
+    reporter = HeadlessReporter(stream=sys.stderr if args.json else sys.stdout,
+                                export_excel=not args.no_excel, push_tg=not args.no_tg)
+    reporter.show_timings = args.timings or SHOW_TIMINGS
+    kwargs = {}
+    if args.action in ("breakdown", "export", "equity"):
+        to_ms = lambda d: int(datetime.strptime(d, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000) if d else None
+        kwargs = {"start_ms": to_ms(args.start), "end_ms": to_ms(args.end)}
+    if args.action == "export": kwargs.update(fmt=args.format, out=args.out)
+    if args.action == "watch": kwargs = {"duration": args.duration, "stream": args.stream}
+    if args.action == "serve":
+        kwargs = {"duration": args.duration, "stream": args.stream, "host": args.host, "port": args.port,
+                  "max_age": args.max_age}
+    result = getattr(reporter, ACTIONS[args.action])(**kwargs)
+    if not TG_QUEUE.flush(timeout=60): reporter.log_safe("⚠️ TG 队列未在 60 秒内发送完毕", "ERROR")
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+测试公共夹具
+query.py 在导入时读取配置，因此先在进程内启动 mock_server，把 API 地址、数据目录与限速写入环境变量，再导入 query。
+"""
+
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import mock_server  # noqa: E402
+
+FILLS_PER_ACCOUNT = 1500
+HISTORY_DAYS = 30
+
+@pytest.fixture(scope="session")
+def mock():
+    mock = mock_server.MockParadex(accounts=2, fills=FILLS_PER_ACCOUNT, history_days=HISTORY_DAYS, max_page=200)
+    server, base_url = mock_server.start_server(mock)
+    mock.base_url = base_url
+    yield mock
+    server.shutdown()
+
+@pytest.fixture(scope="session")
+def query(mock):
+    now_ms = int(time.time() * 1000)
+    os.environ.update({
+        "PARADEX_API_BASE_URL": mock.base_url,
+        "PARADEX_DATA_DIR": tempfile.mkdtemp(prefix="paradex_test_"),
+        "PARADEX_KEY_DISCOVERY": "0",
+        "PARADEX_HISTORY_START_MS": str(now_ms - (HISTORY_DAYS + 5) * 24 * 3600 * 1000),
+        "PARADEX_PAGE_SIZE_MAX": "200",
+        "PARADEX_CHECKPOINT_MIN_SEC": "0",
+        "PARADEX_SYNC_CHECKPOINT_PAGES": "1",
+    })
+    for family in ("FILLS", "TRANSFERS", "ACCOUNT", "XP", "DEFAULT"):
+        os.environ[f"PARADEX_RATE_{family}"] = "100000,100000"
+    return importlib.import_module("query")
+
+@pytest.fixture
+def cache(query, tmp_path, monkeypatch):
+    """
+    每个测试使用空的内存缓存与独立的 JSON 缓存文件
+    """
+    monkeypatch.setattr(query, "CACHE_FILE", str(tmp_path / "stats_cache.json"))
+    monkeypatch.setattr(query, "DB_CACHE", None)
+    monkeypatch.setattr(query, "_cache_loaded", True)
+    query.STATS_CACHE.clear()
+    query.SNAPSHOTS.clear()
+    yield query.STATS_CACHE
+    query.STATS_CACHE.clear()
+    query.SNAPSHOTS.clear()
+
+@pytest.fixture
+def synced(query, cache):
+    """
+    把模拟账户 0 的全部成交同步进本地成交库，返回 (cache_key, FillStore)
+    """
+    logs = []
+    assert query._sync_fills("mock-0", "acc0", logs.append) is not None, logs
+    return "acc0", query.get_fill_store("acc0")
+
+@pytest.fixture
+def groups(query, cache, monkeypatch):
+    """
+    只配置两个模拟账户的账户表，cache_key 为 g0_Acc 0 / g0_Acc 1
+    """
+    group = {"id": 0, "name": "Group 0 ", "accounts": [{"name": "Acc 0", "key": "mock-0"}, {"name": "Acc 1", "key": "mock-1"}]}
+    monkeypatch.setattr(query, "GROUPS", [group])
+    return [group]
@@ -0,0 +1,33 @@
+def brute_breakdown(rows, field):
+    out = {}
+    for ts, vol, pnl, fid, market, side, liq, fee, cnt in rows:
+        label = {"market": market, "side": side, "liquidity": liq}[field]
+        row = out.setdefault(label, [0.0, 0.0, 0.0, 0])
+        row[0] += vol
+        row[1] += pnl
+        row[2] += fee
+        row[3] += cnt
+    return out
+
+def test_breakdown_matches_brute_force(query, synced):
+    key, store = synced
+    start, end = store.ts[100], store.ts[-100]
+    rows = list(store.rows(start, end))
+    for field in ("market", "side", "liquidity"):
+        got = query.fill_breakdown(field, [key], start, end)[key]
+        expected = brute_breakdown(rows, field)
+        assert set(got) == set(expected)
+        for label, row in got.items():
+            vol, pnl, fee, cnt = expected[label]
+            assert row["count"] == cnt
+            assert abs(row["vol"] - vol) < 1e-6 * vol
+            assert abs(row["fee"] - fee) < 1e-6 * max(1.0, fee)
+
+def test_profile_maker_share(query, synced):
+    key, store = synced
+    rows = list(store.rows())
+    maker = sum(r[1] for r in rows if r[6] == "MAKER")
+    known = sum(r[1] for r in rows if r[6] in ("MAKER", "TAKER"))
+    prof = query.fill_profile([key])[key]
+    assert abs(prof["maker_share"] - maker / known) < 1e-9
+    assert abs(prof["fee_bps"] - prof["fee"] / prof["vol"] * 10000) < 1e-9
@@ -0,0 +1,35 @@
+def test_sqlite_round_trip(query, synced, tmp_path):
+    key, store = synced
+    assert query._sync_transfers("mock-0", key, print) is not None
+    series = query.get_equity_series(key)
+    series.record(store.ts[-1], 1000.0, 900.0, 5.0)
+    series.record(store.ts[-1] + query.HOUR_MS, 1010.0, 900.0, 7.0)
+    cache = query.STATS_CACHE
+
+    db = query.SqliteCache(str(tmp_path / "cache.db"))
+    db.save(cache, full=True)
+    loaded = query.SqliteCache(str(tmp_path / "cache.db")).load()
+    assert loaded[key]["net_deposits"] == cache[key]["net_deposits"]
+    assert loaded[key]["last_fill_ts"] == cache[key]["last_fill_ts"]
+    assert sorted(map(tuple, loaded[key]["transfers"])) == sorted(map(tuple, cache[key]["transfers"]))
+    restored = query.EquitySeries.from_json(loaded[key]["equity"])
+    assert restored.points() == series.points()
+
+    again = query.SqliteCache(str(tmp_path / "cache.db")).load_fills(key)
+    assert list(again.rows()) == list(store.rows())
+    assert again.window() == store.window()
+
+    # 增量保存：只写新增成交，重新加载后与内存一致
+    new = (store.ts[-1] + 1, 12.5, -0.5, "late-fill", "ETH-USD-PERP", "SELL", "MAKER", 0.2)
+    store.extend(store.dedupe([new]))
+    series.record(store.ts[-1] + 2 * query.HOUR_MS, 1020.0, 900.0, 0.0)
+    db.save(cache)
+    reopened = query.SqliteCache(str(tmp_path / "cache.db"))
+    assert list(reopened.load_fills(key).rows()) == list(store.rows())
+    assert query.EquitySeries.from_json(reopened.load()[key]["equity"]).points() == series.points()
+
+def test_json_round_trip(query, synced):
+    key, store = synced
+    query.save_cache()
+    loaded = query.load_cache()
+    assert list(loaded[key]["fills"].rows()) == list(store.rows())
@@ -0,0 +1,23 @@
+from conftest import FILLS_PER_ACCOUNT
+
+def test_compact_preserves_totals(query, synced):
+    key, store = synced
+    rows_before = len(store)
+    total = store.window()
+    daily = store.buckets(query.DAY_MS)
+    retention_days = 10
+    assert query.compact_fills(key, lambda message: None, retention_days=retention_days) > 0
+    assert len(store) < rows_before
+    assert store.total_count() == FILLS_PER_ACCOUNT
+    vol, pnl, cnt = store.window()
+    assert cnt == total[2]
+    assert abs(vol - total[0]) < 1e-6 * total[0]
+    assert abs(pnl - total[1]) < 1e-6 * max(1.0, abs(total[1]))
+    # 按天统计的桶边界与压缩桶对齐，逐日结果不变
+    after = store.buckets(query.DAY_MS)
+    assert set(after) == set(daily)
+    for b, (vol, _, cnt) in after.items():
+        assert cnt == daily[b][2]
+        assert abs(vol - daily[b][0]) < 1e-6 * max(1.0, vol)
+    # 保留期内仍是逐笔成交
+    assert all(fid for fid in store.ids[store.bounds(store.compacted_until)[0]:])
@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+def test_parquet_partitions_follow_report_weeks(query, synced, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    key, store = synced
+    files, rows = query.export_parquet(str(tmp_path), accounts=[key])
+    assert rows == len(store)
+    parts = sorted(tmp_path.glob("week=*/account=*/part-0.parquet"))
+    assert len(parts) == files
+    total = 0
+    for part in parts:
+        start = datetime.strptime(part.parent.parent.name[len("week="):], "%Y-%m-%d").replace(hour=8)
+        assert start.weekday() == 4
+        lo, hi = (int(t.timestamp() * 1000) for t in (start, start + timedelta(days=7)))
+        ts = [int(t.timestamp() * 1000) for t in pq.read_table(part).column("ts").to_pylist()]
+        assert all(lo <= t < hi for t in ts)
+        total += len(ts)
+    assert total == rows
+
+def test_week_start_matches_weekly_report_boundary(query):
+    friday_8am = datetime(2026, 10, 16, 8)
+    ms = lambda t: t.timestamp() * 1000
+    assert query.week_start(ms(friday_8am)) == friday_8am
+    assert query.week_start(ms(friday_8am - timedelta(seconds=1))) == friday_8am - timedelta(days=7)
+    assert query.week_start(ms(friday_8am + timedelta(days=6, hours=23))) == friday_8am
+
+def test_iter_fill_rows_chunks_on_ts_boundaries(query, synced, monkeypatch):
+    key, store = synced
+    monkeypatch.setattr(query, "EXPORT_CHUNK_ROWS", 7)
+    a, b = store.ts[10], store.ts[-10]
+    rows = [row[2:] for row in query.iter_fill_rows([key], a, b)]
+    assert rows == list(store.rows(a, b))
@@ -0,0 +1,28 @@
+from conftest import FILLS_PER_ACCOUNT
+
+def test_sync_fetches_every_fill(synced):
+    _, store = synced
+    assert store.total_count() == FILLS_PER_ACCOUNT
+    assert len(set(store.ids)) == FILLS_PER_ACCOUNT
+    assert list(store.ts) == sorted(store.ts)
+
+def test_dedupe_by_id(query, synced):
+    _, store = synced
+    rows = list(store.rows(store.ts[100], store.ts[200]))
+    page = [r[:8] for r in rows]
+    assert store.dedupe(page) == []
+    fresh = (store.ts[-1] + 1, 10.0, 1.0, "new-fill", "BTC-USD-PERP", "BUY", "TAKER", 0.1)
+    assert store.dedupe(page + [fresh, fresh]) == [fresh]
+    before = store.total_volume()
+    store.extend(store.dedupe([fresh]))
+    store.extend(store.dedupe([fresh]))
+    assert store.total_count() == FILLS_PER_ACCOUNT + 1
+    assert abs(store.total_volume() - before - 10.0) < 1e-6
+
+def test_columns_are_typed_arrays_and_round_trip(query, synced):
+    _, store = synced
+    assert (store.ts.typecode, store.vol.typecode, store.mkt.typecode, store.cnt.typecode) == ("q", "d", "H", "I")
+    assert len(store.markets) == len(set(store.markets)) < 20  # 市场名按字典编码，每个只存一次
+    restored = query.FillStore.from_json(store.to_json())
+    assert list(restored.rows()) == list(store.rows())
+    assert restored.window() == store.window()
@@ -0,0 +1,85 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import requests
+
+def response(status, headers=None, body=b"{}"):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    resp._content = body
+    return resp
+
+def scripted_client(query, monkeypatch, responses, limits=None):
+    """
+    HttpClient 按顺序返回给定响应，记录每次 sleep 的秒数
+    """
+    limiter = query.RateLimiter(limits or {"fills": (1000, 1000), "account": (1000, 1000), "default": (1000, 1000)})
+    client = query.HttpClient(limiter=limiter)
+    queue = list(responses)
+    monkeypatch.setattr(client, "_send", lambda method, url, **kwargs: queue.pop(0))
+    sleeps = []
+    monkeypatch.setattr(query.time, "sleep", sleeps.append)
+    return client, limiter, sleeps
+
+def test_429_honours_retry_after_and_pauses_family(query, monkeypatch):
+    client, limiter, sleeps = scripted_client(query, monkeypatch, [response(429, {"Retry-After": "3"}), response(200)])
+    resp = client.request("GET", query.API_BASE_URL + "/fills")
+    assert resp.status_code == 200
+    # 先按 Retry-After 等待；sleep 被替换、时钟没有前进，重试时限速器仍处于暂停期，再记一次限流等待
+    assert sleeps[0] == 3.0 and len(sleeps) == 2
+    stats = limiter.stats["fills"]
+    assert (stats["requests"], stats["http_429"], stats["retries"], stats["throttled"], stats["failed"]) == (2, 1, 1, 1, 0)
+    # 429 让同一接口族的所有线程一起暂停，其他接口族不受影响
+    assert 2.5 < limiter.buckets["fills"].reserve(0) <= 3.0
+    assert limiter.buckets["account"].reserve(0) == 0
+
+def test_retries_exhausted_return_last_response(query, monkeypatch):
+    monkeypatch.setattr(query, "RETRY_MAX", 2)
+    client, limiter, sleeps = scripted_client(query, monkeypatch, [response(503)] * 3)
+    resp = client.request("GET", query.API_BASE_URL + "/account/summary")
+    assert resp.status_code == 503
+    assert len(sleeps) == 2  # 没有 Retry-After 时按指数退避
+    assert all(0 <= s <= query.RETRY_CAP_SEC for s in sleeps)
+    assert limiter.stats["account"]["failed"] == 1
+
+def test_connection_errors_retry_then_raise(query, monkeypatch):
+    monkeypatch.setattr(query, "RETRY_MAX", 1)
+    limiter = query.RateLimiter({"default": (1000, 1000), "fills": (1000, 1000)})
+    client = query.HttpClient(limiter=limiter)
+    calls = []
+
+    def send(method, url, **kwargs):
+        calls.append(url)
+        raise requests.ConnectionError("reset")
+    monkeypatch.setattr(client, "_send", send)
+    monkeypatch.setattr(query.time, "sleep", lambda seconds: None)
+    try:
+        client.request("GET", query.API_BASE_URL + "/fills")
+    except requests.ConnectionError:
+        pass
+    else:
+        raise AssertionError("expected ConnectionError")
+    assert len(calls) == 2
+    assert limiter.stats["fills"]["failed"] == 1
+
+def test_retry_after_formats(query):
+    assert query.retry_after_seconds(response(429, {"Retry-After": "7"})) == 7.0
+    when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < query.retry_after_seconds(response(503, {"Retry-After": when})) <= 30
+    # Telegram 把等待秒数放在响应体里
+    assert query.retry_after_seconds(response(429, body=b'{"ok": false, "parameters": {"retry_after": 4}}')) == 4.0
+    assert query.retry_after_seconds(response(503)) is None
+
+def test_bucket_throttles_concurrent_callers(query):
+    limiter = query.RateLimiter({"fills": (20, 2)})
+    threads = [threading.Thread(target=limiter.acquire, args=("fills",)) for _ in range(6)]
+    start = time.monotonic()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    # 突发 2 个，其余 4 个按 20/s 放行
+    assert time.monotonic() - start >= 0.15
+    assert limiter.stats["fills"]["requests"] == 6
+    assert limiter.stats["fills"]["throttled"] == 4
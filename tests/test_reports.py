@@ -0,0 +1,50 @@
+import io
+
+import pytest
+import requests
+
+@pytest.fixture
+def reporter(query, groups):
+    stream = io.StringIO()
+    reporter = query.HeadlessReporter(stream=stream, export_excel=False, push_tg=False)
+    reporter.save_state = False
+    reporter.output = stream
+    return reporter
+
+def fail_fills_for(query, monkeypatch, api_key):
+    real_api_get = query.api_get
+
+    def api_get(path, key, **kwargs):
+        if path == "/fills" and key == api_key: raise requests.ConnectionError("fills down")
+        return real_api_get(path, key, **kwargs)
+    monkeypatch.setattr(query, "api_get", api_get)
+
+def test_total_marks_account_failed_when_fills_sync_fails(query, reporter, monkeypatch):
+    fail_fills_for(query, monkeypatch, "mock-1")
+    result = reporter.logic_total_stats()
+    accounts = result["groups"][0]["accounts"]
+    assert [a.get("error", False) for a in accounts] == [False, True]
+    assert result["total"]["failed"] == ["Acc 1"]
+    assert result["total"]["balance"] == accounts[0]["balance"]
+    assert "合计不完整" in reporter.output.getvalue()
+    assert "[!] Backfill err" in reporter.output.getvalue()
+
+@pytest.mark.parametrize("action", ["logic_volume_stats", "logic_breakdown"])
+def test_fill_reports_flag_failed_sync(query, reporter, monkeypatch, action):
+    fail_fills_for(query, monkeypatch, "mock-1")
+    result = getattr(reporter, action)()
+    failed = result["total"]["failed"] if "total" in result else result["failed"]
+    assert failed == ["Acc 1"]
+    assert "合计不完整" in reporter.output.getvalue()
+
+@pytest.mark.parametrize("action", ["logic_breakdown", "logic_export"])
+def test_reports_respect_save_state(query, reporter, monkeypatch, tmp_path, action):
+    kwargs = {"fmt": "parquet", "out": str(tmp_path / "parquet")} if action == "logic_export" else {}
+    getattr(reporter, action)(**kwargs)  # 先完成同步：快照有效期内不再同步，也就没有断点落盘
+    saves = []
+    monkeypatch.setattr(query, "save_cache", lambda: saves.append(1))
+    getattr(reporter, action)(**kwargs)
+    assert saves == []
+    reporter.save_state = True
+    getattr(reporter, action)(**kwargs)
+    assert saves == [1]
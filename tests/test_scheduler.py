@@ -0,0 +1,82 @@
+import sys
+import threading
+import time
+
+import requests
+
+from conftest import FILLS_PER_ACCOUNT
+
+def test_readers_consistent_during_out_of_order_writes(query, synced):
+    # 写入早于尾部的行会删掉尾部重排；读者在 CACHE_LOCK 内读取，成交额与笔数始终来自同一版本
+    key, store = synced
+    base_vol, _, base_cnt = store.window()
+    stop, errors = threading.Event(), []
+
+    def writer():
+        for i in range(300):
+            row = (store.ts[len(store.ts) // 2] - 1, 1.0, 0.0, f"late-{i}", "BTC-USD-PERP", "BUY", "TAKER", 0.0)
+            with query.CACHE_LOCK: store.extend([row])
+        stop.set()
+
+    def reader():
+        try:
+            while not stop.is_set():
+                vol, _, cnt = query.fill_window(key)
+                assert abs(vol - base_vol - (cnt - base_cnt)) < 1e-6 * base_vol
+                assert query.query_fills([key], group_by=None)["total"]["count"] >= cnt
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(3)] + [threading.Thread(target=writer)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # 频繁切换线程，让读者落在 extend 中间
+    try:
+        for t in threads: t.start()
+        for t in threads: t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert not errors
+    assert store.total_count() == FILLS_PER_ACCOUNT + 300
+
+def test_refresh_updates_snapshots_and_schedules_by_activity(query, mock, groups, monkeypatch):
+    monkeypatch.setattr(query, "SCHED_ACTIVE_HOURS", 24 * 365)  # 模拟成交都算近期：账户为活跃
+    scheduler = query.RefreshScheduler(active_sec=10, idle_sec=100)
+    group, acc, key = next(query.iter_accounts())
+    start = time.monotonic()
+    scheduler._refresh(key, group, acc, 4)
+    assert scheduler.active[key] is True
+    assert key in scheduler.fresh
+    assert scheduler.due[key] - start >= 9 and scheduler.due[key] - time.monotonic() <= 11
+    assert query.SNAPSHOTS.peek("mock-0", "summary") and query.SNAPSHOTS.peek("mock-0", "positions") is not None
+    assert query.get_fill_store(key).total_count() == FILLS_PER_ACCOUNT
+    assert scheduler.cost[key] >= 3
+
+def test_failed_refresh_retries_sooner(query, groups, monkeypatch):
+    monkeypatch.setattr(query, "SCHED_ACTIVE_HOURS", 0)
+    real_api_get = query.api_get
+
+    def api_get(path, key, **kwargs):
+        if path == "/account/summary": raise requests.ConnectionError("down")
+        return real_api_get(path, key, **kwargs)
+    monkeypatch.setattr(query, "api_get", api_get)
+    logs = []
+    scheduler = query.RefreshScheduler(active_sec=10, idle_sec=100, log_func=lambda message, level="INFO": logs.append(message))
+    group, acc, key = next(query.iter_accounts())
+    scheduler._refresh(key, group, acc, 4)
+    assert key not in scheduler.fresh
+    assert scheduler.due[key] - time.monotonic() <= 2 * 10 * 1.1  # 空闲账户失败后按 2 倍活跃间隔重试，而不是空闲间隔
+    assert any("后台刷新" in line for line in logs)
+
+def test_first_round_is_staggered(query, groups):
+    started = {}
+    on_status = lambda key, **cells: started.setdefault(key, time.monotonic()) if cells.get("status") == "🔄 刷新中" else None
+    scheduler = query.RefreshScheduler(active_sec=1.0, idle_sec=100, on_status=on_status).start()
+    try:
+        deadline = time.monotonic() + 10
+        while scheduler.refreshes < 2 and time.monotonic() < deadline: time.sleep(0.05)
+    finally:
+        scheduler.stop(wait=True)
+    assert scheduler.refreshes >= 2
+    first, second = sorted(started.values())
+    assert second - first >= 0.4  # 两个账户在一个活跃间隔内均匀错开
+    assert query.SNAPSHOTS.hold_sec == 0
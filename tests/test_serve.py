@@ -0,0 +1,79 @@
+import json
+import threading
+import time
+
+import requests
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate(): return True
+        time.sleep(0.05)
+    return False
+
+def account_balance(server, key):
+    _, _, body = server.get(f"accounts/{key}")
+    return json.loads(body)["balance"]
+
+def test_accounts_view_follows_upstream(query, mock, groups):
+    server = query.ReportServer(max_age=0.2)
+    first = account_balance(server, "g0_Acc 0")
+    assert first == float(mock.accounts[0].account_value)
+
+    # 调度器刷新快照后，accounts 视图过期重算时要读到新值，而不是首次计算的 total 结果
+    mock.accounts[0].account_value += 1000
+    query.SNAPSHOTS.refresh("mock-0", "summary", lambda: query._load_account_summary("mock-0"))
+    time.sleep(0.25)
+    assert wait_for(lambda: account_balance(server, "g0_Acc 0") == first + 1000)
+
+def test_etag_stable_until_content_changes(query, groups):
+    server = query.ReportServer(max_age=0.2)
+    _, etag, body = server.get("total")
+    time.sleep(0.25)
+    server.get("total")  # 过期：后台重算
+    assert wait_for(lambda: server.entries["total"][0] > time.time() - 0.2)
+    assert server.get("total")[1] == etag
+
+def test_views_read_only_scheduler_snapshots(query, mock, groups, monkeypatch):
+    monkeypatch.setattr(query.SNAPSHOTS, "local_only", True)
+    server = query.ReportServer(max_age=60)
+    # 调度器还没刷新过：视图照常返回，账户列为获取失败，不访问上游
+    before = sum(mock.counts.values())
+    _, _, body = server.get("positions")
+    assert sum(mock.counts.values()) == before
+    assert json.loads(body)["total"]["failed"] == ["Acc 0", "Acc 1"]
+
+    scheduler = query.RefreshScheduler()
+    for group, acc, cache_key in query.iter_accounts():
+        scheduler._refresh(cache_key, group, acc, 4)
+    assert query.SNAPSHOTS.peek("", "markets")
+    before = sum(mock.counts.values())
+    server = query.ReportServer(max_age=60)
+    for view in query.ReportServer.VIEWS:
+        server.get(view)
+    server.get("accounts")
+    assert sum(mock.counts.values()) == before
+    assert json.loads(server.get("positions")[2])["total"]["failed"] == []
+    weekly = json.loads(server.get("weekly")[2])
+    assert weekly["total"]["failed"] == []
+    assert all(row["address"] and row["xp"] for row in weekly["accounts"])
+
+def test_http_etag_and_unknown_views(query, groups):
+    from http.server import ThreadingHTTPServer
+    server = query.ReportServer(max_age=60)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), query.make_serve_handler(server))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    try:
+        first = requests.get(base + "/total", timeout=10)
+        assert first.status_code == 200 and first.headers["ETag"]
+        assert first.json()["action"] == "total"
+        again = requests.get(base + "/total", headers={"If-None-Match": first.headers["ETag"]}, timeout=10)
+        assert again.status_code == 304 and again.content == b""
+        assert requests.get(base + "/accounts/g0_Acc%201", timeout=10).json()["name"] == "Acc 1"
+        assert requests.get(base + "/nope", timeout=10).status_code == 404
+        assert "/accounts" in requests.get(base + "/", timeout=10).json()["endpoints"]
+        assert server.hits[("total", 200)] == 1 and server.hits[("total", 304)] == 1
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
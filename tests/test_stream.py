@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+import mock_server
+
+LIVE_FILLS = 300
+
+def wait_for(predicate, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate(): return True
+        time.sleep(0.05)
+    return False
+
+@pytest.fixture
+def live(query, groups, monkeypatch):
+    """
+    独立的模拟服务器 (推送会生成新成交，不能影响共享的 mock)，REST 与 WebSocket 地址都指向它
+    """
+    pytest.importorskip("websocket")
+    mock = mock_server.MockParadex(accounts=2, fills=LIVE_FILLS, history_days=10, max_page=200)
+    server, base_url = mock_server.start_server(mock)
+    monkeypatch.setattr(query, "API_BASE_URL", base_url)
+    monkeypatch.setattr(query, "WS_URL", base_url.replace("http", "ws", 1) + "/ws")
+    manager = query.StreamManager().start()
+    assert wait_for(lambda: all(s.live for s in manager.streams.values()))
+    yield mock, manager
+    manager.stop(wait=True)
+    server.shutdown()
+
+def test_pushed_fills_and_positions_apply_locally(query, live):
+    mock, manager = live
+    stream = manager.streams["g0_Acc 0"]
+    store = query.get_fill_store("g0_Acc 0")
+    assert store.total_count() == LIVE_FILLS
+    assert query.SNAPSHOTS.pinned("g0_Acc 0", "fills") and query.SNAPSHOTS.pinned("mock-0", "positions")
+    before = mock.counts.get("/fills", 0)
+    mock.trade(0, n=3)
+    assert wait_for(lambda: store.total_count() == LIVE_FILLS + 3)
+    assert mock.counts.get("/fills", 0) == before  # 推送直接写入，没有 REST 请求
+    markets = {p["market"] for p in query.SNAPSHOTS.peek("mock-0", "positions")}
+    assert markets == {p["market"] for p in mock.accounts[0].positions}
+    assert stream.gaps == 0 and stream.messages >= 6
+
+def test_sequence_gap_triggers_rest_catch_up(query, live):
+    mock, manager = live
+    stream = manager.streams["g0_Acc 1"]
+    store = query.get_fill_store("g0_Acc 1")
+    mock.trade(1, n=1)
+    assert wait_for(lambda: store.total_count() == LIVE_FILLS + 1)  # 先收到一条，记下序号
+    mock.ws_drop_rate = 1.0
+    mock.trade(1, n=2)  # 丢弃的消息同样占用序号
+    mock.ws_drop_rate = 0.0
+    mock.trade(1, n=1)
+    assert wait_for(lambda: stream.gaps >= 1 and store.total_count() == LIVE_FILLS + 4)
+    assert len(set(store.ids)) == LIVE_FILLS + 4
+
+def test_reconnects_after_disconnect(query, live):
+    mock, manager = live
+    stream = manager.streams["g0_Acc 0"]
+    statuses = []
+    stream.on_status = lambda key, **cells: statuses.append(cells.get("status"))
+    assert mock.kick() == 2
+    # 断线后标记断开，退避重连并用 REST 补齐后重新上线
+    assert wait_for(lambda: "📡 推送中" in statuses)
+    assert statuses.index("⚠️ 推送断开") < statuses.index("📡 推送中")
+    mock.trade(0, n=1)
+    assert wait_for(lambda: query.get_fill_store("g0_Acc 0").total_count() == LIVE_FILLS + 1)
@@ -0,0 +1,112 @@
+import requests
+
+from conftest import FILLS_PER_ACCOUNT
+
+def fills_requests(mock):
+    return mock.counts.get("/fills", 0)
+
+def test_resumable_sync_resumes_from_checkpoint(query, mock, cache, monkeypatch):
+    key = "acc1"
+    cache[key] = {"last_fill_ts": 1}  # 跳过分片回填，直接走游标增量同步
+    full_before = fills_requests(mock)
+    calls = [0]
+    real_api_get = query.api_get
+
+    def flaky_api_get(path, api_key, **kwargs):
+        calls[0] += 1
+        if calls[0] == 4: raise requests.ConnectionError("network down")
+        return real_api_get(path, api_key, **kwargs)
+
+    logs = []
+    monkeypatch.setattr(query, "api_get", flaky_api_get)
+    assert query._sync_fills("mock-1", key, logs.append) is None
+    assert any("Fills err" in line for line in logs)
+    assert cache[key]["fill_sync"]["cursor"]
+    committed = query.get_fill_store(key).total_count()
+    assert 0 < committed < FILLS_PER_ACCOUNT
+    monkeypatch.setattr(query, "api_get", real_api_get)
+
+    # 模拟重启：断点已落盘，从磁盘重新加载后继续
+    cache.clear()
+    cache.update(query.load_cache())
+    assert cache[key]["fill_sync"]["cursor"]
+    first_run = fills_requests(mock) - full_before
+    logs.clear()
+    assert query._sync_fills("mock-1", key, logs.append) is not None
+    assert any("续传" in line for line in logs)
+    store = query.get_fill_store(key)
+    assert store.total_count() == FILLS_PER_ACCOUNT
+    assert len(set(store.ids)) == FILLS_PER_ACCOUNT
+    assert "fill_sync" not in cache[key]
+    # 续传只拉断点之后的页
+    resumed = fills_requests(mock) - full_before - first_run
+    cache.clear()
+    cache["fresh"] = {"last_fill_ts": 1}
+    before = fills_requests(mock)
+    query._sync_fills("mock-1", "fresh", lambda message: None)
+    assert resumed < fills_requests(mock) - before
+
+def test_pending_transfer_counted_once_completed(query, mock, cache):
+    key = "acc0"
+    transfers = mock.accounts[0].transfers
+    pending = transfers[-1]
+    signed = lambda t: float(t["amount"]) * (1 if t["direction"] == "IN" else -1)
+    pending["status"] = "PENDING"
+    try:
+        assert query._sync_transfers("mock-0", key, print) is not None
+        completed = sum(signed(t) for t in transfers if t["status"] == "COMPLETED")
+        assert abs(cache[key]["net_deposits"] - completed) < 1e-6
+        # 高水位停在处理中的转账之前，下次同步会重新扫描到它
+        assert cache[key]["last_transfer_ts"] < pending["created_at"]
+
+        pending["status"] = "COMPLETED"
+        assert query._sync_transfers("mock-0", key, print) is not None
+        assert abs(cache[key]["net_deposits"] - (completed + signed(pending))) < 1e-6
+        assert cache[key]["last_transfer_ts"] >= pending["created_at"]
+        # 再次同步不重复计入
+        assert query._sync_transfers("mock-0", key, print) is not None
+        assert abs(cache[key]["net_deposits"] - (completed + signed(pending))) < 1e-6
+    finally:
+        pending["status"] = "COMPLETED"
+
+def test_newest_first_pages_commit_in_one_batch(query, mock, cache, monkeypatch):
+    # 接口按新 -> 旧翻页：一批内的多页合并后只调用一次 extend，不再每页重建尾部
+    monkeypatch.setattr(query, "SYNC_CHECKPOINT_PAGES", 1000)
+    calls = []
+    real_extend = query.FillStore.extend
+    monkeypatch.setattr(query.FillStore, "extend", lambda store, rows: calls.append(len(rows)) or real_extend(store, rows))
+    cache["acc1"] = {"last_fill_ts": 1}
+    assert query._sync_fills("mock-1", "acc1", print) is not None
+    assert calls == [FILLS_PER_ACCOUNT]
+    store = query.get_fill_store("acc1")
+    assert list(store.ts) == sorted(store.ts)
+    assert abs(store.total_volume() - sum(store.vol)) < 1e-6 * store.total_volume()
+
+def test_resync_is_idempotent(query, synced):
+    key, store = synced
+    query.STATS_CACHE[key]["last_fill_ts"] = store.ts[FILLS_PER_ACCOUNT // 2]  # 重叠一半历史
+    assert query._sync_fills("mock-0", key, lambda message: None) is not None
+    assert store.total_count() == FILLS_PER_ACCOUNT
+
+def test_extend_newest_first_pages(query, synced):
+    # 按接口顺序 (新 -> 旧) 逐页写入也要得到有序的列与正确的前缀和
+    _, source = synced
+    rows = [r[:8] for r in source.rows()]
+    store = query.FillStore()
+    for end in range(len(rows), 0, -200):
+        store.extend(rows[max(0, end - 200):end])
+    assert list(store.ts) == list(source.ts)
+    assert store.window() == source.window()
+    for i in (0, len(rows) // 2, len(rows) - 1):
+        assert abs(store.cvol[i] - sum(store.vol[:i + 1])) < 1e-6 * store.cvol[i]
+
+def test_legacy_rows_without_id_resync_from_last_ts(query, synced):
+    # 旧版缓存没有 id：从 last_ts 本身重拉，边界毫秒上已有的行按 ts 计数去重，新的同毫秒成交不丢
+    key, store = synced
+    legacy = query.FillStore()
+    legacy.extend([(r[0], r[1], r[2], "") + tuple(r[4:8]) for r in store.rows()])
+    last_ts = legacy.ts[-1]
+    replay = [r[:8] for r in store.rows(last_ts)]
+    fresh = (last_ts, 5.0, 0.5, "", "BTC-USD-PERP", "BUY", "TAKER", 0.01)
+    assert legacy.dedupe(replay) == []
+    assert legacy.dedupe(replay + [fresh]) == [fresh]
@@ -0,0 +1,72 @@
+import itertools
+
+import pytest
+
+CHATS = itertools.count()
+
+@pytest.fixture
+def tg(query, mock, monkeypatch):
+    """
+    指向模拟服务器 Telegram 存根的发送队列；每个测试用独立的 chat_id (存根按会话限速)
+    """
+    monkeypatch.setattr(query, "RETRY_BASE_SEC", 0.01)
+    dispatcher = query.TelegramDispatcher("test-token", f"chat-{next(CHATS)}", api_url=mock.base_url.rsplit("/v1", 1)[0] + "/tg",
+                                          coalesce_sec=0.2, dedupe_sec=60)
+    dispatcher.sent = lambda: [m["text"] for m in mock.tg_messages if m["chat"]["id"] == dispatcher.chat_id]
+    yield dispatcher
+    dispatcher.flush(10)
+
+def test_coalesces_and_keeps_latest_per_key(tg):
+    old = tg.submit("总资金 v1", key="total")
+    new = tg.submit("总资金 v2", key="total")
+    other = tg.submit("持仓告警")
+    assert tg.flush(10)
+    assert tg.sent() == ["总资金 v2\n\n持仓告警"]
+    assert (old.status, new.status, other.status) == ("replaced", "sent", "sent")
+    assert old.ok and new.ok and other.ok
+
+def test_recent_duplicate_is_skipped(tg):
+    assert tg.submit("同一条内容").wait(10)
+    again = tg.submit("同一条内容")
+    assert again.wait(10)
+    assert again.status == "duplicate"
+    assert tg.sent() == ["同一条内容"]
+
+def test_long_message_split_into_parts(query, tg):
+    paragraph = "x" * 1500
+    text = "\n\n".join([paragraph] * 5)
+    delivery = tg.submit(text)
+    assert delivery.wait(30)
+    assert delivery.status == "sent" and delivery.parts == delivery.sent_parts > 1
+    assert all(len(part) <= query.TG_MAX_LEN for part in tg.sent())
+    assert "\n\n".join(tg.sent()) == text
+
+def test_failed_part_retried_without_resending_earlier_parts(query, tg, monkeypatch):
+    real_send = tg._send
+    calls = []
+
+    def flaky_send(text):
+        calls.append(text)
+        if len(calls) == 2: return "Bad Gateway"  # 第二条第一次发送失败
+        return real_send(text)
+    monkeypatch.setattr(tg, "_send", flaky_send)
+    text = "\n\n".join(["y" * 3000] * 2)
+    delivery = tg.submit(text)
+    assert delivery.wait(30)
+    assert delivery.parts == 2 and len(tg.sent()) == 2
+    assert calls[1] == calls[2]  # 只重发失败的那一条
+
+def test_partial_delivery_reported(query, tg, monkeypatch):
+    monkeypatch.setattr(query, "TG_PART_RETRIES", 0)
+    real_send = tg._send
+    monkeypatch.setattr(tg, "_send", lambda text: real_send(text) if not tg.sent() else "Bad Gateway")
+    results = []
+    delivery = tg.submit("\n\n".join(["z" * 3000] * 2), on_done=results.append)
+    assert delivery.wait(30) is False
+    assert (delivery.status, delivery.sent_parts, delivery.parts) == ("partial", 1, 2)
+    assert delivery.error == "Bad Gateway"
+    assert results == [delivery]
+
+def test_disabled_without_token(query):
+    delivery = query.TelegramDispatcher("", "").submit("hello")
+    assert delivery.status == "disabled" and delivery.ok is False
@@ -0,0 +1,37 @@
+import random
+
+def brute_window(rows, start_ms, end_ms):
+    picked = [r for r in rows if start_ms <= r[0] < end_ms]
+    return sum(r[1] for r in picked), sum(r[2] for r in picked), sum(r[8] for r in picked)
+
+def test_window_matches_brute_force(synced):
+    _, store = synced
+    rows = list(store.rows())
+    rng = random.Random(1)
+    for _ in range(50):
+        a, b = sorted(rng.randint(store.ts[0] - 1000, store.ts[-1] + 1000) for _ in range(2))
+        vol, pnl, cnt = store.window(a, b)
+        exp_vol, exp_pnl, exp_cnt = brute_window(rows, a, b)
+        assert cnt == exp_cnt
+        assert abs(vol - exp_vol) < 1e-6 * max(1.0, exp_vol)
+        assert abs(pnl - exp_pnl) < 1e-6 * max(1.0, abs(exp_pnl))
+
+def test_rollups_match_brute_force(query, synced):
+    _, store = synced
+    rows = list(store.rows())
+    for size in (query.HOUR_MS, query.DAY_MS):
+        expected = {}
+        for r in rows:
+            bucket = expected.setdefault(r[0] - r[0] % size, [0.0, 0.0, 0])
+            bucket[0] += r[1]
+            bucket[1] += r[2]
+            bucket[2] += r[8]
+        got = store.buckets(size)
+        assert set(got) == set(expected)
+        for b, (vol, pnl, cnt) in got.items():
+            assert cnt == expected[b][2]
+            assert abs(vol - expected[b][0]) < 1e-6 * max(1.0, vol)
+        # 窗口不对齐时首尾两个桶走二分
+        start, end = store.ts[0] + size // 3, store.ts[-1] - size // 3
+        partial = store.buckets(size, start, end)
+        assert sum(c for _, _, c in partial.values()) == brute_window(rows, start, end)[2]